@@ -1,192 +1,108 @@
-import glob
-import os
-import slicer
-import DICOMLib
-from DICOMLib import DICOMUtils
-from DICOM import DICOMWidget #slicer.util.selectModule("DICOM")
-from MeniscusSignalIntensity import MeniscusSignalIntensityLogic as mL
-
-
+"""
+Batch meniscus signal intensity for all BEAR subjects of the 6 month cohort.
 
+Subjects are processed in parallel, one headless Slicer process per subject
+(see MeniscusSignalIntensityLib.batch), and the per-subject tables are merged
+into _csvSignalIntensity/MeniscusSignalIntensity_results.csv. Run it with a
+plain python (or PythonSlicer); set SLICER_EXECUTABLE to the Slicer launcher if
+it is not on the PATH:
 
-def meniscusSItoTable(inputVolume, medModel, latModel, anatomy):
-    """This function is used to compute the model parameters and segment the meniscus
-    from the input volume. It will return a table with the results."""
+python batch_process_brownmeniscus.py --workers 8 --timeout 1800
 
+With --longitudinal, only the scans that are new or changed since the last run are
+processed, and a change-over-time table is written per subject and knee (see
+MeniscusSignalIntensityLib.longitudinal).
 
-    #mL.compute_model_parameters(inputVolume, medModel, latModel, anatomy)
-    #not necessarily intuitive.. but the swap to compute left- is to swap Med<->Lat
-    medTrue = True
-    latTrue = False
+Other co-registered sequences of each subject are found by folder name and get
+their own block of columns, e.g. --sequence T2MAP=T2_MAP --sequence PDFS=PD_FS.
+"""
 
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from MeniscusSignalIntensityLib.batch import SUCCESS_STATUSES, WorkerOptions, findSubjects, parseSequencePattern, runBatch
+from MeniscusSignalIntensityLib.longitudinal import updateLongitudinal
+from MeniscusSignalIntensityLib.resultcache import ResultCache
+
+
+dataDir = r"P:\DBarnes\Meniscus\Slicer_6mo_data"
+outdir = "P:\\DBarnes\\Meniscus\\Slicer_6mo_data\\_csvSignalIntensity"
+# Volumes loaded from DICOM are kept here, so reruns skip the DICOM import
+cacheDir = "P:\\DBarnes\\Meniscus\\Slicer_6mo_data\\_volumeCache"
+# Per-subject tables, reused when the STLs, DICOM files, side and algorithm are unchanged
+resultCacheDir = "P:\\DBarnes\\Meniscus\\Slicer_6mo_data\\_resultCache"
+# Index of the subject folders, refreshed incrementally instead of walking the share every run
+manifestPath = os.path.join(outdir, "subject_manifest.json")
+# Per-stage timings of every subject, open in chrome://tracing or https://ui.perfetto.dev
+tracePath = os.path.join(outdir, "MeniscusSignalIntensity_trace.json")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent Slicer processes (default: number of cores)")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-subject timeout in seconds")
+    parser.add_argument("--slicer", default=None, help="Slicer executable")
+    parser.add_argument("--no-cache", action="store_true", help="Always import the DICOM folders and recompute every subject")
+    parser.add_argument("--plane-fitting", choices=["bounds", "pca"], default="bounds", help="Cut plane fitting, pca for oblique scans")
+    parser.add_argument("--preprocess-meshes", action="store_true", help="Clean and decimate the STLs to the voxel size first")
+    parser.add_argument("--full-volume", action="store_true", help="Load whole volumes instead of the menisci sub-volumes")
+    parser.add_argument("--partial-volume", action="store_true", help="Partial-volume weighted statistics")
+    parser.add_argument("--longitudinal", action="store_true", help="Process new or changed timepoints only, with change-over-time tables")
+    parser.add_argument(
+        "--sequence",
+        action="append",
+        default=[],
+        type=parseSequencePattern,
+        metavar="NAME=PATTERN",
+        help="Co-registered sequence, found per subject as the folder whose name contains PATTERN; repeatable",
+    )
+    args = parser.parse_args()
 
-    if anatomy == 'right':
-        # meniscus centroid and planes
-        medAntPlane, medPostPlane = mL.generateCutPlaneCoords_fromMenicus(mWidget,
-            medModel,
-            True,
-        )
-
-        latAntPlane, latPostPlane = mL.generateCutPlaneCoords_fromMenicus(mWidget,
-            latModel,
-            False,
-        )
-        """using the anterior and posterior defined planes, cute each meniscus into
-        anterior, mid and posterior sections."""
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
-        medAntModel,medMidModel,medPostModel = mL.cutModelFromPlanes(mWidget,
-            medModel,
-            medAntPlane,
-            medPostPlane,
-            medTrue,
-        )
-        latAntModel, latMidModel,latPostModel =  mL.cutModelFromPlanes(mWidget,
-            latModel,
-            latAntPlane,
-            latPostPlane,
-            latTrue,
+    # Only folders starting with BEAR are subjects
+    os.makedirs(outdir, exist_ok=True)
+    options = WorkerOptions(
+        args.plane_fitting, args.preprocess_meshes, args.full_volume, args.partial_volume, tuple(args.sequence)
+    )
+    if args.longitudinal:
+        results = updateLongitudinal(
+            dataDir,
+            outdir,
+            manifestPath,
+            "BEAR",
+            args.workers,
+            args.timeout,
+            args.slicer,
+            cacheDir,
+            ResultCache(resultCacheDir, maxAgeDays=365),
+            options,
+        ).results
+    elif args.no_cache:
+        subjects = findSubjects(dataDir, "BEAR", manifestPath)
+        results = runBatch(
+            subjects, outdir, args.workers, args.timeout, args.slicer, tracePath=tracePath, options=options
         )
     else:
-        
-        #LEFT CASE
-        medAntPlane, medPostPlane = mL.generateCutPlaneCoords_fromMenicus(mWidget,
-            latModel,
-            True,
-        )
-        latAntPlane, latPostPlane =mL.generateCutPlaneCoords_fromMenicus(mWidget,
-            medModel,
-            False,
+        subjects = findSubjects(dataDir, "BEAR", manifestPath)
+        resultCache = ResultCache(resultCacheDir, maxAgeDays=365)
+        results = runBatch(
+            subjects,
+            outdir,
+            args.workers,
+            args.timeout,
+            args.slicer,
+            cacheDir,
+            resultCache,
+            tracePath=tracePath,
+            options=options,
         )
 
-            
-        """using the anterior and posterior defined planes, cute each meniscus into
-        anterior, mid and posterior sections."""
-
-        medAntModel,medMidModel,medPostModel = mL.cutModelFromPlanes(mWidget,
-            latModel,
-            medAntPlane,
-            medPostPlane,
-            medTrue,
-        )
-        
-        latAntModel, latMidModel,latPostModel = mL.cutModelFromPlanes(mWidget,
-            medModel,
-            latAntPlane,
-            latPostPlane,
-            latTrue,
-        )
-
-
-    #hide input model and color each output here?
-    medModel.SetDisplayVisibility(False)
-    latModel.SetDisplayVisibility(False)
-
-
-    #vtk 0 to 1 coloring of the models
-    medAntModel.GetDisplayNode().SetColor(1.0, 1.5, 0.0)  # red
-    medMidModel.GetDisplayNode().SetColor(0.5, 0.0, 1.0)  # blue
-    medPostModel.GetDisplayNode().SetColor(0.25, 0.5, 0.4)  # green
-
-    latAntModel.GetDisplayNode().SetColor(1.0, 1.5, 0.0)  # red
-    latMidModel.GetDisplayNode().SetColor(0.5, 0.0, 1.0)  # blue
-    latPostModel.GetDisplayNode().SetColor(0.25, 0.5, 0.4)  # green
-
-    medAntModel.SetDisplayVisibility(True)
-    medMidModel.SetDisplayVisibility(True)
-    medPostModel.SetDisplayVisibility(True)
-
-    latAntModel.SetDisplayVisibility(True)
-    latMidModel.SetDisplayVisibility(True)
-    latPostModel.SetDisplayVisibility(True)
-
-
-        
-        #newTable = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTableNode")
-        #mNode.resultsTable = newTable
-        
-
-    resTable = mL.segmentFromModels(mWidget,
-        outdir,
-        inputVolume,
-        medAntModel,
-        medMidModel,
-        medPostModel,
-        medTrue,
-        medModel.GetName(),
-    )       
-
-    mL.segmentFromModels(mWidget,
-        outdir,
-        inputVolume,
-        latAntModel,
-        latMidModel,
-        latPostModel,
-        latTrue,
-        latModel.GetName(),
-        resTable
-    )
-
-
-
-
-# collect folder names 
-folder_names = glob.glob(r"P:\DBarnes\Meniscus\Slicer_6mo_data\*")
-
-# Remove any in the list that don't start with BEAR
-folders = []
-for i in folder_names:
-    if 'BEAR' in i:
-        folders.append(i)
-
-for files in folders:
-    folder = os.path.join(files,"*")
-    folder_open = glob.glob(folder)
-    #Assign STLs path variables
-    for item in folder_open:
-        if item.endswith('_MM.stl'):
-            mm_stl = item
-        elif item.endswith('_LM.stl'):
-            lm_stl = item
-    # Assign Dicom Folder 
-        for dirpath, dirnames, filenames in os.walk(item):
-            if any(filename.lower().endswith('.dcm') for filename in filenames):
-                dcm_folder = dirpath
-    #Right or left 
-    if "right" in files:
-        anatomy = "right"
-    else:
-        anatomy = "left"
-    
-
-        
-    outdir ='P:\\DBarnes\\Meniscus\\Slicer_6mo_data\\_csvSignalIntensity'
-
-    db = slicer.dicomDatabase
-
-    DICOMLib.clearDatabase(slicer.dicomDatabase)
-    slicer.mrmlScene.Clear(0)
-
-    dicomBrowser = slicer.modules.DICOMWidget.browserWidget.dicomBrowser
-    dicomBrowser.importDirectory(dcm_folder, dicomBrowser.ImportDirectoryAddLink)
-    # wait for import to finish before proceeding (optional, if removed then import runs in the background)
-    dicomBrowser.waitForImportFinished()
-
-
-    browserWidget = slicer.modules.DICOMWidget.browserWidget
-
-    patient = db.patients()[0]
-    studies = db.studiesForPatient(patient)
-    series = [db.seriesForStudy(study) for study in studies]
-    seriesUIDs = [uid for uidList in series for uid in uidList]
-
-    browserWidget.onSeriesSelected(seriesUIDs)
-    browserWidget.loadCheckedLoadables()
-
-    inputVolume = slicer.mrmlScene.GetFirstNodeByClass("vtkMRMLScalarVolumeNode")
-    medModel = slicer.util.loadModel(mm_stl)
-    latModel = slicer.util.loadModel(lm_stl)
-
-    #mNode = mL.getParameterNode()
-    mWidget = slicer.modules.meniscussignalintensity.widgetRepresentation().self()
-
-    meniscusSItoTable(inputVolume, medModel, latModel, anatomy)
+    failed = [result for result in results if result.status not in SUCCESS_STATUSES]
+    for result in failed:
+        print(f"{result.subjectId}: {result.status} {result.message}")
+    sys.exit(1 if failed else 0)
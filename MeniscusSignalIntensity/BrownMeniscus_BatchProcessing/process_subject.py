@@ -0,0 +1,198 @@
+"""
+Process a single subject in a headless Slicer process. Started by
+MeniscusSignalIntensityLib.batch for every subject of a cohort:
+
+Slicer --no-splash --no-main-window --python-script process_subject.py --dicom-dir ... --medial-stl ... \
+    --lateral-stl ... --anatomy left --outdir ... --results-file ... [--cache-dir ...] [--trace-file ...] \
+    [--plane-fitting pca] [--preprocess-meshes] [--full-volume] [--partial-volume] \
+    [--sequence-dir T2MAP=... --sequence-dir PDFS=...]
+
+Volumes of --sequence-dir are co-registered sequences of the same knee; the regions
+are labelled once and the results table gets a block of columns per sequence.
+"""
+
+import argparse
+import os
+import sys
+import traceback
+
+import vtk
+
+import slicer
+from DICOMLib import DICOMUtils
+from MeniscusSignalIntensity import MeniscusSignalIntensityLogic
+from MeniscusSignalIntensityLib.partialvolume import DEFAULT_SUPERSAMPLING
+from MeniscusSignalIntensityLib.planes import PLANE_FITTING_METHODS
+from MeniscusSignalIntensityLib.roi import polyDataListBounds
+from MeniscusSignalIntensityLib.volumecache import CachedVolume, VolumeCache, listFilesRecursive
+
+
+# Voxels kept around the menisci when cropping the volume, more than the statistics crop padding
+VOLUME_CROP_PADDING = 4
+
+
+def loadDicomVolume(dcm_folder, seriesUID=""):
+    """Load the scalar volume of the series seriesUID of a DICOM folder (the first scalar volume
+    if seriesUID is empty), using a private temporary DICOM database so that concurrent workers
+    do not share a database. Returns the volume node and its series UID."""
+    with DICOMUtils.TemporaryDICOMDatabase() as db:
+        DICOMUtils.importDicom(dcm_folder, db)
+        if seriesUID:
+            loadedNodeIDs = DICOMUtils.loadSeriesByUID([seriesUID])
+        else:
+            loadedNodeIDs = []
+            for patientUID in db.patients():
+                loadedNodeIDs.extend(DICOMUtils.loadPatientByUID(patientUID))
+
+        for nodeID in loadedNodeIDs:
+            node = slicer.mrmlScene.GetNodeByID(nodeID)
+            if node and node.IsA("vtkMRMLScalarVolumeNode"):
+                instanceUIDs = (node.GetAttribute("DICOM.instanceUIDs") or "").split()
+                seriesUID = db.instanceValue(instanceUIDs[0], "0020,000E") if instanceUIDs else ""
+                return node, seriesUID
+    raise RuntimeError(f"No scalar volume loaded from {dcm_folder}")
+
+
+def folderSeriesUID(dcm_folder):
+    """Series UID of the first DICOM file of a folder, from its header only ("" if none)."""
+    import pydicom
+
+    for relativePath, _ in sorted(listFilesRecursive(dcm_folder)):
+        try:
+            dataset = pydicom.dcmread(
+                os.path.join(dcm_folder, relativePath), stop_before_pixels=True, specific_tags=["SeriesInstanceUID"]
+            )
+        except pydicom.errors.InvalidDicomError:
+            continue
+        return str(dataset.get("SeriesInstanceUID", ""))
+    return ""
+
+
+def addCroppedVolume(volume, bounds, padding=VOLUME_CROP_PADDING):
+    """Add the sub-volume of a CachedVolume around the RAS bounds (min, max) to the scene."""
+    if bounds is not None:
+        volume = volume.crop(*bounds, padding)
+    return slicer.util.addVolumeFromArray(
+        volume.array, ijkToRAS=slicer.util.vtkMatrixFromArray(volume.ijkToRas), name=volume.name
+    )
+
+
+def loadVolume(dcm_folder, cacheDir=None, bounds=None):
+    """Load the scalar volume of a DICOM folder, from the volume cache when the folder is
+    unchanged since it was cached, otherwise through a DICOM import that fills the cache.
+
+    With the RAS bounds (min, max) of the menisci, only the sub-volume around them is kept
+    in the scene. A cached volume is then memory-mapped and only the slabs of that
+    sub-volume are read, so the worker never holds the whole series in memory.
+
+    The series is that of the first DICOM file of the folder (see folderSeriesUID), both for
+    the cache lookup and for the import, so folders with several series hit the cache too.
+    """
+    seriesUID = folderSeriesUID(dcm_folder)
+    if not cacheDir and bounds is None:
+        return loadDicomVolume(dcm_folder, seriesUID)[0]
+
+    cache = VolumeCache(cacheDir) if cacheDir else None
+    if cache:
+        cached = cache.get(dcm_folder, seriesUID, mmap=True)
+        if cached:
+            return addCroppedVolume(cached, bounds)
+
+    volumeNode, seriesUID = loadDicomVolume(dcm_folder, seriesUID)
+    ijkToRas = vtk.vtkMatrix4x4()
+    volumeNode.GetIJKToRASMatrix(ijkToRas)
+    volume = CachedVolume(
+        slicer.util.arrayFromVolume(volumeNode),
+        slicer.util.arrayFromVTKMatrix(ijkToRas),
+        seriesUID,
+        volumeNode.GetName(),
+    )
+    if cache:
+        cache.put(dcm_folder, volume.array, volume.ijkToRas, volume.seriesUID, volume.name)
+    if bounds is None:
+        return volumeNode
+    # Replace the full volume by its sub-volume
+    croppedNode = addCroppedVolume(volume, bounds)
+    slicer.mrmlScene.RemoveNode(volumeNode)
+    return croppedNode
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dicom-dir", required=True)
+    parser.add_argument("--medial-stl", required=True)
+    parser.add_argument("--lateral-stl", required=True)
+    parser.add_argument("--anatomy", choices=["right", "left"], required=True)
+    parser.add_argument("--outdir", required=True)
+    parser.add_argument("--results-file", required=True)
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--per-model-csv", action="store_true", help="Also write one CSV per meniscus to outdir")
+    parser.add_argument("--trace-file", default=None, help="Write per-stage timings as Chrome trace events to this file")
+    parser.add_argument("--plane-fitting", choices=PLANE_FITTING_METHODS, default="bounds")
+    parser.add_argument("--preprocess-meshes", action="store_true", help="Clean and decimate the STLs to the voxel size")
+    parser.add_argument("--full-volume", action="store_true", help="Keep the whole volume instead of the menisci sub-volume")
+    parser.add_argument("--partial-volume", action="store_true", help="Partial-volume weighted statistics")
+    parser.add_argument(
+        "--sequence-dir",
+        action="append",
+        default=[],
+        metavar="NAME=DIR",
+        help="DICOM folder of another co-registered sequence, repeatable",
+    )
+    args = parser.parse_args(argv)
+
+    logic = MeniscusSignalIntensityLogic()
+    if args.trace_file:
+        logic.enableProfiling()
+    try:
+        with logic.stage("subject"):
+            with logic.stage("model load"):
+                medModel = slicer.util.loadModel(args.medial_stl)
+                latModel = slicer.util.loadModel(args.lateral_stl)
+            with logic.stage("volume load"):
+                # Only the sub-volume around the menisci is needed
+                bounds = None if args.full_volume else polyDataListBounds([medModel.GetPolyData(), latModel.GetPolyData()])
+                inputVolume = loadVolume(args.dicom_dir, args.cache_dir, bounds)
+                additionalVolumes = []
+                for sequence in args.sequence_dir:
+                    name, _, sequenceDir = sequence.partition("=")
+                    if not sequenceDir:
+                        raise ValueError(f"--sequence-dir needs NAME=DIR, got {sequence}")
+                    volume = loadVolume(sequenceDir, args.cache_dir, bounds)
+                    volume.SetName(name)
+                    additionalVolumes.append(volume)
+            if args.preprocess_meshes:
+                # Decimated meshes are cached next to the cached volumes
+                meshCacheDir = os.path.join(args.cache_dir, "meshes") if args.cache_dir else None
+                for model in (medModel, latModel):
+                    logic.preprocessModel(model, inputVolume, cacheDir=meshCacheDir)
+
+            perModelOutdir = args.outdir if args.per_model_csv else None
+            supersampling = DEFAULT_SUPERSAMPLING if args.partial_volume else None
+            resTable = logic.computeMeniscusSignalIntensity(
+                perModelOutdir,
+                inputVolume,
+                medModel,
+                latModel,
+                args.anatomy,
+                args.plane_fitting,
+                supersampling,
+                additionalVolumes,
+            )
+            with logic.stage("save results"):
+                if not slicer.util.saveNode(resTable, args.results_file):
+                    raise RuntimeError(f"Failed to write {args.results_file}")
+    finally:
+        # Failed subjects keep the timings of the stages that did run
+        if args.trace_file:
+            logic.profiler.writeTrace(args.trace_file)
+
+
+if __name__ == "__main__":
+    exitCode = 0
+    try:
+        main(sys.argv[1:])
+    except Exception:
+        traceback.print_exc()
+        exitCode = 1
+    slicer.util.exit(exitCode)
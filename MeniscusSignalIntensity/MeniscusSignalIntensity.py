@@ -7,10 +7,14 @@ mNode = mLogic.getParameterNode()
 """
 
 
+import collections
+import contextlib
+import functools
 import logging
 import os
 from typing import Annotated, Optional
 
+import qt
 import vtk
 
 import slicer
@@ -20,6 +24,7 @@ from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
 from slicer.parameterNodeWrapper import (
     parameterNodeWrapper,
+    Choice,
     WithinRange,
 )
 
@@ -134,9 +139,20 @@ class MeniscusSignalIntensityParameterNode:
 
 
     resultsTable: vtkMRMLTableNode
+    sectorTable: vtkMRMLTableNode
 
-    # TO DO : (future) determine angle discretization increments
-    # angleDiscretization: Annotated[float, WithinRange(0, 180)] = 90.0
+    # How the cut planes are fitted: "bounds" (RAS bounding box) or "pca" (principal axes, for oblique scans)
+    planeFitting: Annotated[str, Choice(["bounds", "pca"])] = "bounds"
+
+    # Width in degrees of the angular sectors, and number of inner to outer bands, of sector statistics
+    angleDiscretization: Annotated[float, WithinRange(1, 180)] = 10.0
+    radialBands: Annotated[int, WithinRange(1, 4)] = 1
+    # Depth in mm below the model surfaces over which the surface signal intensity is averaged
+    surfaceSamplingDepth: Annotated[float, WithinRange(0, 5)] = 1.0
+    # Update the region statistics and models of a meniscus while one of its planes is moved
+    incrementalUpdate: bool = False
+    # Weight the voxels by their partial coverage by each region, instead of counting whole voxels
+    partialVolume: bool = False
 
 
 #
@@ -144,6 +160,12 @@ class MeniscusSignalIntensityParameterNode:
 #
 
 
+# Delay after the last plane modification before incremental updates are applied
+PLANE_UPDATE_DELAY_MS = 50
+# Interval at which the progress of a background computation is polled
+COMPUTE_POLL_INTERVAL_MS = 100
+
+
 class MeniscusSignalIntensityWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     """Uses ScriptedLoadableModuleWidget base class, available at:
     https://github.com/Slicer/Slicer/blob/main/Base/Python/slicer/ScriptedLoadableModule.py
@@ -156,6 +178,14 @@ class MeniscusSignalIntensityWidget(ScriptedLoadableModuleWidget, VTKObservation
         self.logic = None
         self._parameterNode = None
         self._parameterNodeGuiTag = None
+        # Incremental updates: one (model, isMed, antPlane, postPlane, regionModels, cache) per meniscus
+        self._incrementalMenisci = []
+        self._pendingMenisci = set()
+        self._planeUpdateTimer = None
+        # Background computations: the running (task, job) and the queued jobs, see onComputePlanesButton
+        self._computation = None
+        self._computeQueue = collections.deque()
+        self._computePollTimer = None
 
     def setup(self) -> None:
         """Called when the user opens the module the first time and the widget is initialized."""
@@ -192,12 +222,29 @@ class MeniscusSignalIntensityWidget(ScriptedLoadableModuleWidget, VTKObservation
         # Buttons
        
         self.ui.planeComputeButton.connect("clicked(bool)", self.onComputePlanesButton)
+        self.ui.sectorComputeButton.connect("clicked(bool)", self.onComputeSectorsButton)
+        self.ui.incrementalUpdateCheckBox.connect("toggled(bool)", self.onIncrementalUpdateToggled)
+
+        # Plane edits are collected and applied once the plane has not moved for a moment
+        self._planeUpdateTimer = qt.QTimer()
+        self._planeUpdateTimer.setSingleShot(True)
+        self._planeUpdateTimer.setInterval(PLANE_UPDATE_DELAY_MS)
+        self._planeUpdateTimer.connect("timeout()", self.updateModifiedMenisci)
+
+        # The computations run in a background thread, whose progress is polled here
+        self.ui.cancelComputeButton.connect("clicked(bool)", self.cancelComputations)
+        self._computePollTimer = qt.QTimer()
+        self._computePollTimer.setInterval(COMPUTE_POLL_INTERVAL_MS)
+        self._computePollTimer.connect("timeout()", self.pollComputation)
+        self.updateComputeProgress()
 
         # Make sure parameter node is initialized (needed for module reload)
         self.initializeParameterNode()
 
     def cleanup(self) -> None:
         """Called when the application closes and the module widget is destroyed."""
+        self.cancelComputations()
+        self.stopIncrementalUpdates()
         self.removeObservers()
 
     def enter(self) -> None:
@@ -217,6 +264,8 @@ class MeniscusSignalIntensityWidget(ScriptedLoadableModuleWidget, VTKObservation
 
     def onSceneStartClose(self, caller, event) -> None:
         """Called just before the scene is closed."""
+        self.cancelComputations()
+        self.stopIncrementalUpdates()
         # Parameter node will be reset, do not use it anymore
         self.setParameterNode(None)
 
@@ -277,9 +326,18 @@ class MeniscusSignalIntensityWidget(ScriptedLoadableModuleWidget, VTKObservation
         ):
             self.ui.planeComputeButton.toolTip = _("Compute meniscus metrics")
             self.ui.planeComputeButton.enabled = True
+            self.ui.sectorComputeButton.toolTip = _("Compute the statistics of the angular sectors of both menisci")
+            self.ui.sectorComputeButton.enabled = True
         else:
             self.ui.planeComputeButton.toolTip = _("Select input volume and model")
             self.ui.planeComputeButton.enabled = False
+            self.ui.sectorComputeButton.toolTip = _("Select input volume and model")
+            self.ui.sectorComputeButton.enabled = False
+        # The incremental rows are binary voxel statistics, they would overwrite weighted ones
+        partialVolume = bool(self._parameterNode and self._parameterNode.partialVolume)
+        self.ui.incrementalUpdateCheckBox.enabled = not partialVolume
+        if partialVolume and self._incrementalMenisci:
+            self.stopIncrementalUpdates()
 
     def _checkCanCutModel(self, caller=None, event=None) -> None:
         if (
@@ -298,157 +356,236 @@ class MeniscusSignalIntensityWidget(ScriptedLoadableModuleWidget, VTKObservation
             self.ui.cutModelButton.enabled = False
 
     def onComputePlanesButton(self) -> None:
-        """Run processing when user clicks "Apply" button."""
-        with slicer.util.tryWithErrorDisplay(
-            _("Failed to compute results."), waitCursor=True
-        ):
-
-            # workflow:
-            # input volume and model
-
-            """compute_model_parameters:
-            '   - model bounds:
-            '       - medial bound(x) mean(y,z) of the model bounds
-            '       - lateral bound extents each: Ant, Post
-            '   those 3 control points form plane each : (ant, post)
-            '
-            """
-            #not necessarily intuitive.. but the swap to compute left- is to swap Med<->Lat
-            medTrue = True
-            latTrue = False
-
-            if self.ui.right_rb.isChecked():
-                # meniscus centroid and planes
-                pAnt, pPost = self.logic.generateCutPlaneCoords_fromMenicus(
-                    self.ui.inputMedialSelector.currentNode(),
-                    True,
-                )
-                self._parameterNode.medAntPlane = pAnt
-                self._parameterNode.medPostPlane = pPost
-
-                pAnt, pPost = self.logic.generateCutPlaneCoords_fromMenicus(
-                    self.ui.inputLateralSelector.currentNode(),
-                    False,
-                )
-                self._parameterNode.latAntPlane = pAnt
-                self._parameterNode.latPostPlane = pPost    
-
-                """using the anterior and posterior defined planes, cute each meniscus into
-                anterior, mid and posterior sections."""
-
-                antModel, midModel, postModel = self.logic.cutModelFromPlanes(
-                    self.ui.inputMedialSelector.currentNode(),
-                    self._parameterNode.medAntPlane,
-                    self._parameterNode.medPostPlane,
-                    medTrue,
-                )            
-                self._parameterNode.medAntModel = antModel
-                self._parameterNode.medMidModel = midModel
-                self._parameterNode.medPostModel = postModel
-
-                antModel, midModel, postModel = self.logic.cutModelFromPlanes(
-                    self.ui.inputLateralSelector.currentNode(),
-                    self._parameterNode.latAntPlane,
-                    self._parameterNode.latPostPlane,
-                    latTrue,
-                )
-                self._parameterNode.latAntModel = antModel
-                self._parameterNode.latMidModel = midModel
-                self._parameterNode.latPostModel = postModel
-
-            else:
-                
-                pAnt, pPost =self.logic.generateCutPlaneCoords_fromMenicus(
-                    self.ui.inputLateralSelector.currentNode(),
-                    True,
-                )
-                self._parameterNode.medAntPlane = pAnt
-                self._parameterNode.medPostPlane = pPost
-
-                pAnt, pPost = self.logic.generateCutPlaneCoords_fromMenicus(
-                    self.ui.inputMedialSelector.currentNode(),
-                    False,
-                )
-                self._parameterNode.latAntPlane = pAnt
-                self._parameterNode.latPostPlane = pPost
+        """Queue the computation of the current inputs when user clicks "Apply" button.
 
-                """using the anterior and posterior defined planes, cute each meniscus into
-                anterior, mid and posterior sections."""
-
-                antModel, midModel, postModel = self.logic.cutModelFromPlanes(
-                    self.ui.inputLateralSelector.currentNode(),
-                    self._parameterNode.medAntPlane,
-                    self._parameterNode.medPostPlane,
-                    medTrue,
-                )
-                self._parameterNode.medAntModel = antModel
-                self._parameterNode.medMidModel = midModel
-                self._parameterNode.medPostModel = postModel
-
-                antModel, midModel, postModel = self.logic.cutModelFromPlanes(
-                    self.ui.inputMedialSelector.currentNode(),
-                    self._parameterNode.latAntPlane,
-                    self._parameterNode.latPostPlane,
-                    latTrue,
+        The planes, cuts, statistics and surface intensities are computed in a background
+        thread (see MeniscusSignalIntensityLogic.startKneeComputation), so that the next
+        knee can be selected and queued meanwhile. Nodes are only created in finishComputation.
+        """
+        parameterNode = self._parameterNode
+        job = {
+            "inputVolume": parameterNode.inputVolume,
+            "medModel": parameterNode.medialModel,
+            "latModel": parameterNode.lateralModel,
+            "anatomy": "right" if self.ui.right_rb.isChecked() else "left",
+            "planeFitting": parameterNode.planeFitting,
+            "supersampling": None,
+            "surfaceDepth": parameterNode.surfaceSamplingDepth,
+        }
+        if parameterNode.partialVolume:
+            from MeniscusSignalIntensityLib.partialvolume import DEFAULT_SUPERSAMPLING
+
+            job["supersampling"] = DEFAULT_SUPERSAMPLING
+        self._computeQueue.append(job)
+        if not self._computation:
+            self.startNextComputation()
+        self.updateComputeProgress()
+
+    def onComputeSectorsButton(self) -> None:
+        """Sector statistics of the medial and lateral models, in one table that replaces the
+        previous one (see MeniscusSignalIntensityLogic.computeSectorStatistics)."""
+        parameterNode = self._parameterNode
+        with slicer.util.tryWithErrorDisplay(_("Failed to compute sector statistics."), waitCursor=True):
+            self.logic.releaseNodes(parameterNode.sectorTable)
+            sectorTable = None
+            for model in (parameterNode.medialModel, parameterNode.lateralModel):
+                sectorTable = self.logic.computeSectorStatistics(
+                    parameterNode.inputVolume,
+                    model,
+                    parameterNode.angleDiscretization,
+                    parameterNode.radialBands,
+                    sectorTable,
                 )
-                self._parameterNode.latAntModel = antModel
-                self._parameterNode.latMidModel = midModel
-                self._parameterNode.latPostModel = postModel
+            sectorTable.SetName("Meniscus sector signal intensity")
+            parameterNode.sectorTable = sectorTable
+
+    def startNextComputation(self) -> None:
+        while self._computeQueue and not self._computation:
+            job = self._computeQueue.popleft()
+            # A failing job is reported and skipped, the queued ones still run
+            try:
+                with slicer.util.tryWithErrorDisplay(_("Failed to compute results."), waitCursor=True):
+                    # workflow:
+                    # input volume and model
+                    # meniscus centroid and planes, cut into ant, mid, post, region statistics
+                    task = self.logic.startKneeComputation(**job)
+            except Exception:
+                continue
+            self._computation = (task, job)
+            self._computePollTimer.start()
+
+    def pollComputation(self) -> None:
+        if not self._computation:
+            self._computePollTimer.stop()
+        elif self._computation[0].done():
+            self._computePollTimer.stop()
+            task, job = self._computation
+            self._computation = None
+            try:
+                self.finishComputation(task, job)
+            except Exception:
+                # Already displayed by finishComputation, go on with the queued jobs
+                pass
+            self.startNextComputation()
+        self.updateComputeProgress()
+
+    def updateComputeProgress(self) -> None:
+        running = self._computation is not None
+        self.ui.computeProgressBar.visible = running
+        self.ui.cancelComputeButton.visible = running
+        if running:
+            fraction, message = self._computation[0].progress()
+            queued = f", {len(self._computeQueue)} queued" if self._computeQueue else ""
+            self.ui.computeProgressBar.value = int(round(100 * fraction))
+            self.ui.computeProgressBar.format = f"{self._computation[1]['medModel'].GetName()}: {message} %p%{queued}"
+
+    def cancelComputations(self) -> None:
+        """Cancel the running computation and drop the queued ones."""
+        self._computeQueue.clear()
+        if self._computation:
+            # The thread stops at its next progress report, its results are discarded
+            self._computation[0].cancel()
+            self._computation = None
+        if self._computePollTimer:
+            self._computePollTimer.stop()
+            self.updateComputeProgress()
+
+    def finishComputation(self, task, job: dict) -> None:
+        """Create the planes, cut models, results table and surface intensity of a finished
+        computation, in the main thread."""
+        from MeniscusSignalIntensityLib import TaskCancelled
+
+        with slicer.util.tryWithErrorDisplay(_("Failed to compute results."), waitCursor=True):
+            try:
+                task.result()
+            except TaskCancelled:
+                return
+
+            # Recomputing replaces the planes and cut models of the previous run
+            self.stopIncrementalUpdates()
+            self.logic.releaseNodes(
+                self._parameterNode.medAntPlane,
+                self._parameterNode.medPostPlane,
+                self._parameterNode.latAntPlane,
+                self._parameterNode.latPostPlane,
+                self._parameterNode.medAntModel,
+                self._parameterNode.medMidModel,
+                self._parameterNode.medPostModel,
+                self._parameterNode.latAntModel,
+                self._parameterNode.latMidModel,
+                self._parameterNode.latPostModel,
+            )
 
+            #not necessarily intuitive.. but the swap to compute left- is to swap Med<->Lat
+            (medPlanes, latPlanes), (medModels, latModels), resTable = self.logic.finishKneeComputation(
+                task, slicer.app.temporaryPath, job["medModel"], job["latModel"], job["anatomy"]
+            )
+            self._parameterNode.medAntPlane, self._parameterNode.medPostPlane = medPlanes
+            self._parameterNode.latAntPlane, self._parameterNode.latPostPlane = latPlanes
+            self._parameterNode.medAntModel, self._parameterNode.medMidModel, self._parameterNode.medPostModel = medModels
+            self._parameterNode.latAntModel, self._parameterNode.latMidModel, self._parameterNode.latPostModel = latModels
 
             #hide input model and color each output here?
-            self._parameterNode.medialModel.SetDisplayVisibility(False)
-            self._parameterNode.lateralModel.SetDisplayVisibility(False)
+            job["medModel"].SetDisplayVisibility(False)
+            job["latModel"].SetDisplayVisibility(False)
 
-        
             #vtk 0 to 1 coloring of the models
-            self._parameterNode.medAntModel.GetDisplayNode().SetColor(1.0, 1.5, 0.0)  # red
-            self._parameterNode.medMidModel.GetDisplayNode().SetColor(0.5, 0.0, 1.0)  # blue
-            self._parameterNode.medPostModel.GetDisplayNode().SetColor(0.25, 0.5, 0.4)  # green
-            
-            self._parameterNode.latAntModel.GetDisplayNode().SetColor(1.0, 1.5, 0.0)  # red
-            self._parameterNode.latMidModel.GetDisplayNode().SetColor(0.5, 0.0, 1.0)  # blue
-            self._parameterNode.latPostModel.GetDisplayNode().SetColor(0.25, 0.5, 0.4)  # green
-
-            self._parameterNode.medAntModel.SetDisplayVisibility(True)
-            self._parameterNode.medMidModel.SetDisplayVisibility(True)
-            self._parameterNode.medPostModel.SetDisplayVisibility(True)
-
-            self._parameterNode.latAntModel.SetDisplayVisibility(True)
-            self._parameterNode.latMidModel.SetDisplayVisibility(True)
-            self._parameterNode.latPostModel.SetDisplayVisibility(True)
-        
-            
-   # def meniscusVolumeSignalVals(self) -> None:
-        with slicer.util.tryWithErrorDisplay(
-            _("Failed to compute results."), waitCursor=True
-        ):
-            '''
-            newTable = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTableNode")
-            self._parameterNode.resultsTable = newTable
-            '''
-            outdir = slicer.app.temporaryPath
-
-            resTable = self.logic.segmentFromModels(
-                outdir,
-                self._parameterNode.inputVolume,
-                self._parameterNode.medAntModel,
-                self._parameterNode.medMidModel,
-                self._parameterNode.medPostModel,
-                medTrue,
-                self.ui.inputMedialSelector.currentNode().GetName(),
-            )       
+            for antModel, midModel, postModel in (medModels, latModels):
+                antModel.GetDisplayNode().SetColor(1.0, 1.5, 0.0)  # red
+                midModel.GetDisplayNode().SetColor(0.5, 0.0, 1.0)  # blue
+                postModel.GetDisplayNode().SetColor(0.25, 0.5, 0.4)  # green
+                for model in (antModel, midModel, postModel):
+                    model.SetDisplayVisibility(True)
+
+            self._parameterNode.resultsTable = resTable
 
-            self.logic.segmentFromModels(
-                outdir,
+            # Incremental updates follow the current selection, so only if it is still this knee
+            currentKnee = (
                 self._parameterNode.inputVolume,
-                self._parameterNode.latAntModel,
-                self._parameterNode.latMidModel,
-                self._parameterNode.latPostModel,
-                latTrue,
-                self.ui.inputLateralSelector.currentNode().GetName(),
-                resTable
+                self._parameterNode.medialModel,
+                self._parameterNode.lateralModel,
+                "right" if self.ui.right_rb.isChecked() else "left",
             )
+            if self._parameterNode.incrementalUpdate and not self._parameterNode.partialVolume and currentKnee == (
+                job["inputVolume"], job["medModel"], job["latModel"], job["anatomy"]
+            ):
+                self.startIncrementalUpdates()
+
+    def onIncrementalUpdateToggled(self, enabled: bool) -> None:
+        if enabled and self._parameterNode and self._parameterNode.resultsTable and not self._parameterNode.partialVolume:
+            with slicer.util.tryWithErrorDisplay(_("Failed to start incremental updates."), waitCursor=True):
+                self.startIncrementalUpdates()
+        elif not enabled:
+            self.stopIncrementalUpdates()
+
+    def startIncrementalUpdates(self) -> None:
+        """Observe the four cut planes, and update the statistics rows and the region models of
+        the meniscus whose plane moved (see MeniscusSignalIntensityLogic.updateRegionStatistics).
+
+        Nothing else is recomputed: the planes are not regenerated, and the meniscus voxels are
+        rasterized once here. Note that the updated rows use the single-pass regions (voxel
+        centers split by the planes), which can differ slightly from the cut models. They are
+        not partial-volume weighted, so nothing is started when partialVolume is set.
+        """
+        self.stopIncrementalUpdates()
+        parameterNode = self._parameterNode
+        if parameterNode.partialVolume:
+            logging.warning("Incremental updates are not available with partial-volume weighted statistics")
+            return
+        # As for the cuts, for a left knee the plane construction of the menisci is swapped
+        if self.ui.right_rb.isChecked():
+            medRoleModel, latRoleModel = parameterNode.medialModel, parameterNode.lateralModel
+        else:
+            medRoleModel, latRoleModel = parameterNode.lateralModel, parameterNode.medialModel
+        menisci = [
+            (
+                medRoleModel,
+                True,
+                parameterNode.medAntPlane,
+                parameterNode.medPostPlane,
+                (parameterNode.medAntModel, parameterNode.medMidModel, parameterNode.medPostModel),
+            ),
+            (
+                latRoleModel,
+                False,
+                parameterNode.latAntPlane,
+                parameterNode.latPostPlane,
+                (parameterNode.latAntModel, parameterNode.latMidModel, parameterNode.latPostModel),
+            ),
+        ]
+        for model, isMed, antPlane, postPlane, regionModels in menisci:
+            cache = self.logic.createRegionVoxelCache(parameterNode.inputVolume, model, isMed)
+            self.logic.updateRegionStatistics(cache, antPlane, postPlane)
+            self._incrementalMenisci.append((model, isMed, antPlane, postPlane, regionModels, cache))
+            for planeNode in (antPlane, postPlane):
+                planeNode.SetDisplayVisibility(True)
+                self.addObserver(planeNode, vtk.vtkCommand.ModifiedEvent, self.onPlaneModified)
+
+    def stopIncrementalUpdates(self) -> None:
+        self.removeObservers(self.onPlaneModified)
+        if self._planeUpdateTimer:
+            self._planeUpdateTimer.stop()
+        self._incrementalMenisci = []
+        self._pendingMenisci.clear()
+
+    def onPlaneModified(self, caller, event) -> None:
+        for index, (_, _, antPlane, postPlane, _, _) in enumerate(self._incrementalMenisci):
+            if caller in (antPlane, postPlane):
+                self._pendingMenisci.add(index)
+        # Restart the timer: consecutive events while dragging give one update
+        self._planeUpdateTimer.start()
+
+    def updateModifiedMenisci(self) -> None:
+        """Update the results table rows and region models of the menisci whose planes moved."""
+        from MeniscusSignalIntensityLib import REGION_NAMES
+
+        resultsTable = self._parameterNode.resultsTable if self._parameterNode else None
+        for index in sorted(self._pendingMenisci):
+            model, isMed, antPlane, postPlane, regionModels, cache = self._incrementalMenisci[index]
+            # Rows of segmentMenisciFromModels: ant, mid, post of the medial then the lateral meniscus
+            self.logic.updateRegionStatistics(cache, antPlane, postPlane, resultsTable, index * len(REGION_NAMES))
+            self.logic.updateRegionModels(regionModels, model, antPlane, postPlane, isMed)
+        self._pendingMenisci.clear()
         
 
 
@@ -461,6 +598,17 @@ class MeniscusSignalIntensityWidget(ScriptedLoadableModuleWidget, VTKObservation
 #
 
 
+def profiledStage(name: str):
+    """Record calls of a logic method as a stage of the logic's profiler, if profiling is enabled."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
 class MeniscusSignalIntensityLogic(ScriptedLoadableModuleLogic):
     """This class should implement all the actual
     computation done by your module.  The interface
@@ -474,10 +622,115 @@ class MeniscusSignalIntensityLogic(ScriptedLoadableModuleLogic):
     def __init__(self) -> None:
         """Called when the logic class is instantiated. Can be used for initializing member variables."""
         ScriptedLoadableModuleLogic.__init__(self)
+        # Keep the centroid, ROI, segmentation and labelmap nodes created along the way (for debugging).
+        # By default they are removed as soon as the method that created them returns.
+        self.keepIntermediates = False
+        # IDs of all nodes this logic added to the scene
+        self._createdNodeIDs = []
+        # Stage timings, see enableProfiling
+        self.profiler = None
+        self._nodeAddedCount = 0
+        self._nodeAddedObserver = None
 
     def getParameterNode(self):
         return MeniscusSignalIntensityParameterNode(super().getParameterNode())
 
+    def enableProfiling(self, processName: Optional[str] = None):
+        """Record wall time, CPU time, peak RSS and the number of nodes added to the scene for
+        every stage (planes, cut, voxelize, statistics, ...) in a new self.profiler.
+
+        Returns the MeniscusSignalIntensityLib.profiling.StageProfiler.
+        """
+        from MeniscusSignalIntensityLib.profiling import StageProfiler
+
+        if self._nodeAddedObserver is None:
+            self._nodeAddedObserver = slicer.mrmlScene.AddObserver(slicer.mrmlScene.NodeAddedEvent, self._onNodeAdded)
+        self.profiler = StageProfiler(lambda: self._nodeAddedCount, processName)
+        return self.profiler
+
+    def disableProfiling(self) -> None:
+        if self._nodeAddedObserver is not None:
+            slicer.mrmlScene.RemoveObserver(self._nodeAddedObserver)
+            self._nodeAddedObserver = None
+        self.profiler = None
+
+    def _onNodeAdded(self, caller, event) -> None:
+        self._nodeAddedCount += 1
+
+    def stage(self, name: str, **args):
+        """Context manager timing a stage when profiling is enabled, a no-op otherwise."""
+        if self.profiler is None:
+            return contextlib.nullcontext(args)
+        return self.profiler.stage(name, **args)
+
+    def _trackNode(self, node):
+        """Remember a node added to the scene by this logic, so that it can be counted and removed."""
+        self._createdNodeIDs.append(node.GetID())
+        return node
+
+    def _addNode(self, className: str):
+        return self._trackNode(slicer.mrmlScene.AddNewNodeByClass(className))
+
+    @staticmethod
+    def _removeNode(node) -> None:
+        """Remove a node together with its display and storage nodes."""
+        if not node or node.GetScene() is None:
+            return
+        ownedNodes = []
+        if node.IsA("vtkMRMLDisplayableNode"):
+            ownedNodes += [node.GetNthDisplayNode(i) for i in range(node.GetNumberOfDisplayNodes())]
+        if node.IsA("vtkMRMLStorableNode"):
+            ownedNodes += [node.GetNthStorageNode(i) for i in range(node.GetNumberOfStorageNodes())]
+        slicer.mrmlScene.RemoveNode(node)
+        for ownedNode in ownedNodes:
+            if ownedNode and ownedNode.GetScene():
+                slicer.mrmlScene.RemoveNode(ownedNode)
+
+    def _removeIntermediateNodes(self, *nodes) -> None:
+        if self.keepIntermediates:
+            return
+        for node in nodes:
+            self._removeNode(node)
+
+    def createdNodes(self) -> list:
+        """Nodes added to the scene by this logic that are still in the scene."""
+        self._createdNodeIDs = [nodeID for nodeID in self._createdNodeIDs if slicer.mrmlScene.GetNodeByID(nodeID)]
+        return [slicer.mrmlScene.GetNodeByID(nodeID) for nodeID in self._createdNodeIDs]
+
+    def releaseNodes(self, *nodes) -> None:
+        """Remove the given nodes if this logic created them; other nodes are left alone."""
+        createdNodeIDs = set(self._createdNodeIDs)
+        for node in nodes:
+            if node and node.GetID() in createdNodeIDs:
+                self._removeNode(node)
+
+    def trackedNodeCount(self) -> int:
+        """Number of nodes added to the scene by this logic that are still in the scene."""
+        return len(self.createdNodes())
+
+    @contextlib.contextmanager
+    def scopedNodes(self):
+        """Remove every node this logic creates inside the block when the block exits.
+
+        Yields a set; add the nodes to keep (e.g. a results table) to it. Used to keep the
+        scene, and memory, flat over long batch or interactive sessions:
+
+        with logic.scopedNodes() as keep:
+            table = logic.computeMeniscusSignalIntensity(None, volume, medModel, latModel, "left")
+            keep.add(table)
+        """
+        # IDs rather than a list position: createdNodes() prunes the list, also inside the block
+        previousNodeIDs = set(self._createdNodeIDs)
+        keep = set()
+        try:
+            yield keep
+        finally:
+            keepIDs = {node.GetID() for node in keep if node}
+            for nodeID in list(self._createdNodeIDs):
+                if nodeID not in previousNodeIDs and nodeID not in keepIDs:
+                    self._removeNode(slicer.mrmlScene.GetNodeByID(nodeID))
+            self.createdNodes()
+
     '''def compute_model_parameters(
         self,
         inputVolume: vtkMRMLScalarVolumeNode,
@@ -493,95 +746,54 @@ class MeniscusSignalIntensityLogic(ScriptedLoadableModuleLogic):
         self.generateCutPlaneCoords_fromMenicus(inputModel, isMed)
     '''
 
-    def generateCutPlaneCoords_fromMenicus(self, modelNode, isMed) -> tuple[vtkMRMLMarkupsPlaneNode, vtkMRMLMarkupsPlaneNode]:
+    @profiledStage("planes")
+    def generateCutPlaneCoords_fromMenicus(
+        self, modelNode, isMed, planeFitting: str = "bounds"
+    ) -> tuple[vtkMRMLMarkupsPlaneNode, vtkMRMLMarkupsPlaneNode]:
 
         # Workflow:
         # bounds from model
         # centroid mean(x,y,z) of the model bounds
         # corner extents for cut planes
+        # The geometry is computed by MeniscusSignalIntensityLib, this only creates the nodes.
+        # planeFitting "pca" takes the bounds in the principal frame of the model (oblique scans).
+        from MeniscusSignalIntensityLib import computeCutPlanes
 
-        # Get the model node and its polydata
-        # modelNode = self._parameterNode.inputModel
-        modelPolyData = modelNode.GetPolyData()
-
-        # Get the bounds of the polydata
-        bounds = [0.0] * 6
-        modelPolyData.GetBounds(bounds)
-
-        import numpy as np
-
-        # construct min and max coordinates of bounding box
-        bb_min = np.array([bounds[0], bounds[2], bounds[4]])
-        bb_max = np.array([bounds[1], bounds[3], bounds[5]])
-
-        bb_center = (bb_min + bb_max) / 2
-        bb_size = bb_max - bb_min
-
-        """ determine planes for cases:
-            |     R     |    L     |
-            |   ((  ))    ((  ))   |
-            |  lat  med | med lat  |
-        """
-        # lateral extents in lateral roi.. can this be queried anatomically,
-        # or do we need to convert ras to ijk based on above diagram?
-
-        # R A S
-        mid_IS = (bb_min[2] + bb_max[2]) / 2
+        planes = computeCutPlanes(modelNode.GetPolyData(), isMed, planeFitting)
+        return self._addPlaneNodes(planes, isMed)
 
-        mcenter_markup = slicer.mrmlScene.AddNewNodeByClass(
-            "vtkMRMLMarkupsFiducialNode"
-        )
-
-        if isMed:
-            sML = "Med"
-            medLatExtent = bb_min[0]
-            medCentroid = np.array([bb_max[0], bb_center[1], mid_IS])
-        else:
-            sML = "Lat"
-            medLatExtent = bb_max[0]
-            medCentroid = np.array([bb_min[0], bb_center[1], mid_IS])
+    def _addPlaneNodes(self, planes, isMed) -> tuple[vtkMRMLMarkupsPlaneNode, vtkMRMLMarkupsPlaneNode]:
+        """Create the ant, post plane nodes of MeniscusPlanes (and the centroid and ROI intermediates)."""
+        sML = "Med" if isMed else "Lat"
 
+        mcenter_markup = self._addNode("vtkMRMLMarkupsFiducialNode")
         mcenter_markup.SetName(f"'{sML}' Meniscus Centroid")
-        mcenter_markup.AddControlPoint(bb_center[0], bb_center[1], bb_center[2])
+        mcenter_markup.AddControlPoint(*planes.center)
         mcenter_markup.SetLocked(True)
 
-        pAnt = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsPlaneNode")
+        pAnt = self._addNode("vtkMRMLMarkupsPlaneNode")
         pAnt.SetName(f"'{sML}' Meniscus Ant Plane")
-        pPost = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsPlaneNode")
-        pPost.SetName(f"'{sML}' Meniscus Post Plane")
-
-        aVp = vtk.vtkPlaneSource()
-        aVp.SetOrigin(medCentroid[0], medCentroid[1], medCentroid[2])
-        aVp.SetPoint1(medLatExtent, bb_max[1], bb_max[2])
-        aVp.SetPoint2(medLatExtent, bb_max[1], bb_min[2])
-
-        pAnt.SetOrigin(aVp.GetOrigin())
-        aNorm = aVp.GetNormal()
-        a_np = np.array(aNorm)
-
-        pAnt.SetNormal(a_np)  
+        pAnt.SetOrigin(planes.ant.origin)
+        pAnt.SetNormal(planes.ant.normal)
         pAnt.SetDisplayVisibility(False)
 
-        pVp = vtk.vtkPlaneSource()
-        pVp.SetOrigin(medCentroid[0], medCentroid[1], medCentroid[2])
-        pVp.SetPoint1(medLatExtent, bb_min[1], bb_max[2])
-        pVp.SetPoint2(medLatExtent, bb_min[1], bb_min[2])
-
-        pPost.SetOrigin(pVp.GetOrigin())
-        pNorm = pVp.GetNormal()
-        p_np = np.array(pNorm)
-
-        pPost.SetNormal(p_np)
+        pPost = self._addNode("vtkMRMLMarkupsPlaneNode")
+        pPost.SetName(f"'{sML}' Meniscus Post Plane")
+        pPost.SetOrigin(planes.post.origin)
+        pPost.SetNormal(planes.post.normal)
         pPost.SetDisplayVisibility(False)
 
         # Create a new ROI node and set its parameters
-        roiNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsROINode")
+        roiNode = self._addNode("vtkMRMLMarkupsROINode")
         roiNode.SetName("ROI from Meniscus Model")
-        roiNode.SetCenter(bb_center)
-        roiNode.SetSize(bb_size)
+        roiNode.SetCenter(planes.center)
+        roiNode.SetSize(planes.boundsMax - planes.boundsMin)
 
         roiNode.SetLocked(True)  # Lock the ROI to prevent user modifications
         roiNode.SetDisplayVisibility(False)
+
+        # The centroid and the ROI are only kept for inspection
+        self._removeIntermediateNodes(mcenter_markup, roiNode)
         '''
         if isMed:
             self.getParameterNode().medAntPlane = pAnt
@@ -592,7 +804,18 @@ class MeniscusSignalIntensityLogic(ScriptedLoadableModuleLogic):
         '''
         return pAnt, pPost
         #set parameter nodes by planes
-        
+
+    @staticmethod
+    def planeFromMarkupsNode(planeNode: vtkMRMLMarkupsPlaneNode):
+        """Return the world origin and normal of a markups plane as a MeniscusSignalIntensityLib Plane."""
+        import numpy as np
+        from MeniscusSignalIntensityLib import Plane
+
+        origin = [0.0, 0.0, 0.0]
+        normal = [0.0, 0.0, 0.0]
+        planeNode.GetOriginWorld(origin)
+        planeNode.GetNormalWorld(normal)
+        return Plane(np.array(origin), np.array(normal))
 
     def cutModelFromPlanes(
         self,
@@ -602,76 +825,256 @@ class MeniscusSignalIntensityLogic(ScriptedLoadableModuleLogic):
         isMed: bool = True,
     ) -> tuple[vtkMRMLModelNode, vtkMRMLModelNode, vtkMRMLModelNode]:
         """Cut the input model using the ant, post planes."""
+        return self.cutModelsFromPlanes([(inputModel, antPlane, postPlane, isMed)])[0]
+
+    @profiledStage("cut")
+    def cutModelsFromPlanes(
+        self,
+        cuts: list[tuple[vtkMRMLModelNode, vtkMRMLMarkupsPlaneNode, vtkMRMLMarkupsPlaneNode, bool]],
+    ) -> list[tuple[vtkMRMLModelNode, vtkMRMLModelNode, vtkMRMLModelNode]]:
+        """Cut several models, e.g. both menisci, in one call.
+
+        cuts is a list of (inputModel, antPlane, postPlane, isMed). The models are cut
+        concurrently (see cutPolyDataBatch) and the (ant, mid, post) models of each
+        cut are returned in the same order.
+        """
+        from MeniscusSignalIntensityLib import cutPolyDataBatch
+
+        # Same capped cuts as the Dynamic Modeler "Plane cut" tool, without the modeler
+        # node and the intermediate mixModel. Only the geometry runs in the worker
+        # threads; the nodes are read and created here, in the main thread.
+        jobs = [
+            (inputModel.GetPolyData(), self.planeFromMarkupsNode(antPlane), self.planeFromMarkupsNode(postPlane), isMed)
+            for inputModel, antPlane, postPlane, isMed in cuts
+        ]
+        regionsPerCut = cutPolyDataBatch(jobs)
 
         #Output models"
-        antModel = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
-        mixModel = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
-        postModel = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
-        midModel = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+        return [self._addRegionModels(inputModel, regions) for (inputModel, _, _, _), regions in zip(cuts, regionsPerCut)]
+
+    def _addRegionModels(self, inputModel: vtkMRMLModelNode, regions) -> tuple[vtkMRMLModelNode, vtkMRMLModelNode, vtkMRMLModelNode]:
+        """Add the (ant, mid, post) region surfaces of inputModel to the scene as {name}_ant, ... models."""
+        models = []
+        for suffix, polyData in zip(("ant", "mid", "post"), regions):
+            model = self._trackNode(slicer.modules.models.logic().AddModel(polyData))
+            model.SetName(f"{inputModel.GetName()}_{suffix}")
+            models.append(model)
+        return tuple(models)
+
+    def computeRegionStatistics(
+        self,
+        inputVolume: vtkMRMLScalarVolumeNode,
+        inputModel: vtkMRMLModelNode,
+        isMed: bool = True,
+        singlePass: bool = True,
+        planeFitting: str = "bounds",
+        supersampling: Optional[int] = None,
+    ) -> dict[str, dict]:
+        """Ant/mid/post signal intensity statistics of a meniscus without adding any node to the scene.
+
+        With singlePass the voxels are split by their signed distances to the cut planes
+        instead of cutting the model twice and rasterizing the three pieces. With
+        supersampling, the statistics are partial-volume weighted instead.
+        """
+        from MeniscusSignalIntensityLib import computeMeniscusStatistics
+
+        ijkToRas = vtk.vtkMatrix4x4()
+        inputVolume.GetIJKToRASMatrix(ijkToRas)
+        return computeMeniscusStatistics(
+            inputModel.GetPolyData(),
+            slicer.util.arrayFromVolume(inputVolume),
+            slicer.util.arrayFromVTKMatrix(ijkToRas),
+            isMed,
+            singlePass,
+            planeFitting=planeFitting,
+            supersampling=supersampling,
+        )
 
-        antModel.SetName(f"{inputModel.GetName()}_ant")
-        postModel.SetName(f"{inputModel.GetName()}_post")
-        midModel.SetName(f"{inputModel.GetName()}_mid")
+    @profiledStage("region voxel cache")
+    def createRegionVoxelCache(
+        self,
+        inputVolume: vtkMRMLScalarVolumeNode,
+        inputModel: vtkMRMLModelNode,
+        isMed: bool = True,
+    ):
+        """Rasterize the meniscus once, for fast updates of its region statistics when its
+        planes move (see updateRegionStatistics and MeniscusSignalIntensityLib.incremental)."""
+        from MeniscusSignalIntensityLib import RegionVoxelCache
+
+        ijkToRas = vtk.vtkMatrix4x4()
+        inputVolume.GetIJKToRASMatrix(ijkToRas)
+        return RegionVoxelCache(
+            inputModel.GetPolyData(),
+            slicer.util.arrayFromVolume(inputVolume),
+            slicer.util.arrayFromVTKMatrix(ijkToRas),
+            isMed,
+        )
 
-        if isMed:
-            outAntNegID = antModel.GetID()
-            outAntPosID = mixModel.GetID()
-            
-            nextInputID = outAntPosID
+    @profiledStage("incremental statistics")
+    def updateRegionStatistics(
+        self,
+        cache,
+        antPlane: vtkMRMLMarkupsPlaneNode,
+        postPlane: vtkMRMLMarkupsPlaneNode,
+        resultsTable: Optional[vtkMRMLTableNode] = None,
+        firstRow: int = 0,
+    ) -> dict[str, dict]:
+        """Ant/mid/post statistics of a RegionVoxelCache for the current ant, post planes.
 
-            outPostPosID = postModel.GetID()
-            outPostNegID = midModel.GetID()
+        Only the signed distances to a moved plane are recomputed. With resultsTable, the
+        statistics columns of its ant, mid, post rows starting at firstRow are updated in place.
+        """
+        from MeniscusSignalIntensityLib import REGION_NAMES, STATISTICS_COLUMN_NAMES, STATISTICS_KEYS, setTableRows
+
+        cache.setPlanes(self.planeFromMarkupsNode(antPlane), self.planeFromMarkupsNode(postPlane))
+        stats = cache.statistics()
+        if resultsTable:
+            wasModifying = resultsTable.StartModify()
+            setTableRows(
+                resultsTable.GetTable(),
+                firstRow,
+                {STATISTICS_COLUMN_NAMES[key]: [stats[name][key] for name in REGION_NAMES] for key in STATISTICS_KEYS},
+            )
+            resultsTable.Modified()
+            resultsTable.EndModify(wasModifying)
+        return stats
 
-        else:
-            outAntNegID = mixModel.GetID()
-            outAntPosID = antModel.GetID()
-
-            nextInputID = outAntNegID
-
-            outPostPosID = midModel.GetID()
-            outPostNegID = postModel.GetID()
-            
-
-        #First, cut the anterior horn from the body
-        planeModeler = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLDynamicModelerNode") #
-        planeModeler.SetToolName("Plane cut")
-        planeModeler.SetNodeReferenceID("PlaneCut.InputModel", inputModel.GetID())
-        planeModeler.SetNodeReferenceID("PlaneCut.InputPlane", antPlane.GetID())
-
-        planeModeler.SetNodeReferenceID("PlaneCut.OutputNegativeModel", outAntNegID)
-        planeModeler.SetNodeReferenceID("PlaneCut.OutputPositiveModel", outAntPosID)
-        slicer.modules.dynamicmodeler.logic().RunDynamicModelerTool(planeModeler)
-
-
-        #Next, use the 'negative leftovers from above, cut the post horn from the body
-        #Can I recycle the plaenModeler and just update the input model and plane?
-        planeModeler.SetNodeReferenceID("PlaneCut.InputModel",nextInputID)
-        planeModeler.SetNodeReferenceID("PlaneCut.InputPlane", postPlane.GetID())
-        planeModeler.SetNodeReferenceID("PlaneCut.OutputPositiveModel", outPostPosID)
-        planeModeler.SetNodeReferenceID("PlaneCut.OutputNegativeModel", outPostNegID)
-        slicer.modules.dynamicmodeler.logic().RunDynamicModelerTool(planeModeler)
-   
-        '''
-        if isMed:
-            self.getParameterNode().medAntModel = antModel
-            self.getParameterNode().medMidModel = midModel
-            self.getParameterNode().medPostModel = postModel
-        else:
-            self.getParameterNode().latAntModel = antModel
-            self.getParameterNode().latMidModel = midModel
-            self.getParameterNode().latPostModel = postModel
-        '''
+    @profiledStage("cut")
+    def updateRegionModels(
+        self,
+        regionModels: tuple[vtkMRMLModelNode, vtkMRMLModelNode, vtkMRMLModelNode],
+        inputModel: vtkMRMLModelNode,
+        antPlane: vtkMRMLMarkupsPlaneNode,
+        postPlane: vtkMRMLMarkupsPlaneNode,
+        isMed: bool = True,
+    ) -> None:
+        """Cut the input model again into the existing (ant, mid, post) models, without adding nodes."""
+        from MeniscusSignalIntensityLib import cutPolyDataByPlanes
+
+        regions = cutPolyDataByPlanes(
+            inputModel.GetPolyData(),
+            self.planeFromMarkupsNode(antPlane),
+            self.planeFromMarkupsNode(postPlane),
+            isMed,
+        )
+        for model, polyData in zip(regionModels, regions):
+            if model:
+                model.SetAndObservePolyData(polyData)
 
-        #Remove the planeModeler node from the scene
-        slicer.mrmlScene.RemoveNode(planeModeler)
-        slicer.mrmlScene.RemoveNode(mixModel)
+    @profiledStage("preprocess")
+    def preprocessModel(
+        self,
+        inputModel: vtkMRMLModelNode,
+        inputVolume: vtkMRMLScalarVolumeNode,
+        edgeFactor: float = 1.0,
+        cacheDir: Optional[str] = None,
+    ) -> None:
+        """Replace the mesh of inputModel by a cleaned copy decimated to edgeFactor times the
+        smallest voxel spacing of inputVolume (see MeniscusSignalIntensityLib.preprocess).
 
-        return antModel, midModel, postModel
+        With cacheDir, the result is cached per model file, as long as the model is
+        unchanged since it was read.
+        """
+        from MeniscusSignalIntensityLib.preprocess import cachedPreprocessPolyData
+
+        storageNode = inputModel.GetStorageNode()
+        sourcePath = None
+        if storageNode and storageNode.GetFileName() and not inputModel.GetModifiedSinceRead():
+            sourcePath = storageNode.GetFileName()
+        polyData = cachedPreprocessPolyData(
+            inputModel.GetPolyData(), sourcePath, min(inputVolume.GetSpacing()), edgeFactor, cacheDir
+        )
+        inputModel.SetAndObservePolyData(polyData)
 
+    @profiledStage("sector statistics")
+    def computeSectorStatistics(
+        self,
+        inputVolume: vtkMRMLScalarVolumeNode,
+        inputModel: vtkMRMLModelNode,
+        angleDiscretization: float = 10.0,
+        radialBands: int = 1,
+        resultsTable: Optional[vtkMRMLTableNode] = None,
+    ) -> vtkMRMLTableNode:
+        """Signal intensity statistics of the angular sectors of a meniscus, angleDiscretization
+        degrees wide around its centroid and optionally split into radialBands inner to outer
+        bands, appended to resultsTable (see MeniscusSignalIntensityLib.sectors).
+
+        All sectors are labelled and reduced in one pass, without cutting the model.
+        """
+        import numpy as np
+        from MeniscusSignalIntensityLib import (
+            STATISTICS_COLUMN_NAMES,
+            STATISTICS_KEYS,
+            appendTableColumns,
+            computeSectorStatistics,
+        )
+
+        ijkToRas = vtk.vtkMatrix4x4()
+        inputVolume.GetIJKToRASMatrix(ijkToRas)
+        sectorCount = max(1, int(round(360.0 / angleDiscretization)))
+        rows = computeSectorStatistics(
+            inputModel.GetPolyData(),
+            slicer.util.arrayFromVolume(inputVolume),
+            slicer.util.arrayFromVTKMatrix(ijkToRas),
+            sectorCount,
+            radialBands,
+        )
+
+        if not resultsTable:
+            resultsTable = self._addNode("vtkMRMLTableNode")
+            resultsTable.SetName(f"{inputModel.GetName()} sector signal intensity")
+
+        columns = [("sector", "Sector"), ("band", "Band"), ("angle_start", "Angle start [deg]"), ("angle_end", "Angle end [deg]")]
+        columns += [(key, STATISTICS_COLUMN_NAMES[key]) for key in STATISTICS_KEYS]
+        segmentNames = [f"{inputModel.GetName()}_sector{row['sector']:02d}_band{row['band']}" for row in rows]
+        columnValues = [segmentNames] + [np.array([row[key] for row in rows], dtype=np.float64) for key, _ in columns]
+        wasModifying = resultsTable.StartModify()
+        appendTableColumns(resultsTable.GetTable(), columnValues, ["Segment"] + [name for _, name in columns])
+        resultsTable.Modified()
+        resultsTable.EndModify(wasModifying)
+        return resultsTable
+
+    @profiledStage("surface intensity")
+    def mapSignalIntensityToModel(
+        self,
+        inputVolume: vtkMRMLScalarVolumeNode,
+        inputModel: vtkMRMLModelNode,
+        depth: float = 0.0,
+        depthSamples: int = 3,
+        arrayName: str = "SignalIntensity",
+    ) -> None:
+        """Sample inputVolume at every vertex of inputModel into the point scalar array arrayName
+        and color the model by it. With a depth (mm), depthSamples samples along the inward
+        normal down to that depth are averaged."""
+        from MeniscusSignalIntensityLib import addSurfaceIntensity
+
+        ijkToRas = vtk.vtkMatrix4x4()
+        inputVolume.GetIJKToRASMatrix(ijkToRas)
+        polyData = inputModel.GetPolyData()
+        addSurfaceIntensity(
+            polyData,
+            slicer.util.arrayFromVolume(inputVolume),
+            slicer.util.arrayFromVTKMatrix(ijkToRas),
+            depth,
+            depthSamples,
+            arrayName,
+        )
+        polyData.Modified()
+        self._showSurfaceIntensity(inputModel, arrayName)
+
+    @staticmethod
+    def _showSurfaceIntensity(inputModel: vtkMRMLModelNode, arrayName: str = "SignalIntensity") -> None:
+        """Color the model by its point scalar array arrayName."""
+        displayNode = inputModel.GetDisplayNode()
+        if displayNode:
+            displayNode.SetActiveScalar(arrayName, vtk.vtkAssignAttribute.POINT_DATA)
+            displayNode.SetAndObserveColorNodeID("vtkMRMLColorTableNodeFileViridis.txt")
+            displayNode.SetScalarRangeFlag(slicer.vtkMRMLDisplayNode.UseDataScalarRange)
+            displayNode.SetScalarVisibility(True)
 
     def segmentFromModels(
         self,
-        outfdir: str,
+        outfdir: Optional[str],
         inputVolume: vtkMRMLScalarVolumeNode,
         antModel: vtkMRMLModelNode,
         midModel: vtkMRMLModelNode,
@@ -679,27 +1082,47 @@ class MeniscusSignalIntensityLogic(ScriptedLoadableModuleLogic):
         isMed: bool = True,
         men_model_name: Optional[str] = None,
         resultsTable: Optional[vtkMRMLTableNode] = None,
+        useSegmentStatistics: bool = True,
+        supersampling: Optional[int] = None,
         ) -> Optional[vtkMRMLTableNode]:
+        """Signal intensity statistics of the ant, mid, post models, added to resultsTable and,
+        unless outfdir is None, written to {men_model_name}_SegmentStatistics.csv in outfdir.
+
+        By default the models go through a segmentation node, a labelmap and the
+        SegmentStatistics module, and the table has the SegmentStatistics columns. With
+        useSegmentStatistics=False the models are rasterized straight into a label array and
+        reduced in one vectorized pass (MeniscusSignalIntensityLib), with the columns of
+        STATISTICS_COLUMN_NAMES; segmentMenisciFromModels always takes this path.
+        With supersampling, the statistics are weighted by the partial coverage of the voxels
+        (see MeniscusSignalIntensityLib.partialvolume); this needs useSegmentStatistics=False.
+        """
+        if supersampling and useSegmentStatistics:
+            raise ValueError("Partial-volume weighting needs useSegmentStatistics=False")
+        if not useSegmentStatistics:
+            return self._segmentFromModelsDirect(
+                outfdir, inputVolume, [(antModel, midModel, postModel)], [men_model_name], resultsTable, supersampling
+            )
+
         #create Segmentation nodes the input volume using the ant, mid, post models.
         #https://github.com/jzeyl/3D-Slicer-Scripts/blob/master/1_set%20up%20volume%20and%20segmentation%20nodes.py
         
 
-        segNode = slicer.vtkMRMLSegmentationNode()
-        slicer.mrmlScene.AddNode(segNode)
-        segNode.CreateDefaultDisplayNodes()
-        segNode.SetReferenceImageGeometryParameterFromVolumeNode(inputVolume)
-        
-        slicer.modules.segmentations.logic().ImportModelToSegmentationNode(antModel, segNode)
-        slicer.modules.segmentations.logic().ImportModelToSegmentationNode(midModel, segNode)
-        slicer.modules.segmentations.logic().ImportModelToSegmentationNode(postModel, segNode)
+        with self.stage("segmentation import"):
+            segNode = self._addNode("vtkMRMLSegmentationNode")
+            segNode.CreateDefaultDisplayNodes()
+            segNode.SetReferenceImageGeometryParameterFromVolumeNode(inputVolume)
+
+            slicer.modules.segmentations.logic().ImportModelToSegmentationNode(antModel, segNode)
+            slicer.modules.segmentations.logic().ImportModelToSegmentationNode(midModel, segNode)
+            slicer.modules.segmentations.logic().ImportModelToSegmentationNode(postModel, segNode)
 
         visibleSegmentIds = vtk.vtkStringArray()
         segNode.GetDisplayNode().GetVisibleSegmentIDs(visibleSegmentIds)
         nsegs = visibleSegmentIds.GetNumberOfValues()
 
-        labelmapNode = slicer.vtkMRMLLabelMapVolumeNode()
-        slicer.mrmlScene.AddNode(labelmapNode)
-        slicer.vtkSlicerSegmentationsModuleLogic.ExportSegmentsToLabelmapNode(segNode, visibleSegmentIds, labelmapNode, inputVolume)
+        with self.stage("labelmap export"):
+            labelmapNode = self._addNode("vtkMRMLLabelMapVolumeNode")
+            slicer.vtkSlicerSegmentationsModuleLogic.ExportSegmentsToLabelmapNode(segNode, visibleSegmentIds, labelmapNode, inputVolume)
 
 
         if isMed:
@@ -723,51 +1146,367 @@ class MeniscusSignalIntensityLogic(ScriptedLoadableModuleLogic):
         segStatParams.SetParameter("LabelmapSegmentStatisticsPlugin.enabled", str(False))
         segStatParams.SetParameter("ScalarVolumeSegmentStatisticsPlugin.enabled", str(True))
 
-        segStatLogic.computeStatistics()
+        with self.stage("SegmentStatistics"):
+            segStatLogic.computeStatistics()
         
         
   
         if not resultsTable:
             # Create a new table node if it doesn't exist
-            newTable = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTableNode")
+            newTable = self._addNode("vtkMRMLTableNode")
             resultsTable = newTable
             segStatLogic.exportToTable(resultsTable)
             #segStatLogic.showTable(self.getParameterNode().resultsTable)
 
         else:
-            # Append to the existing table node
-            statistics = segStatLogic.getStatistics()        
+            # Append to the existing table node, one column at a time, matched by the column names of exportToTable
+            from MeniscusSignalIntensityLib import appendTableColumns
+
+            statistics = segStatLogic.getStatistics()
             temp_table = resultsTable
             keys = segStatLogic.getNonEmptyKeys()
-             # Fill columns
-            for segmentID in statistics["SegmentIDs"]:
-                rowIndex = temp_table.AddEmptyRow()
-                columnIndex = 0
-                for key in keys:
-                    value = statistics[segmentID, key] if (segmentID, key) in statistics else None
-                    if value is None and key != segStatLogic.segmentColumnName:
-                        value = float("nan")
-                    if isinstance(value, list):
-                        for i in range(len(value)):
-                            temp_table.GetTable().GetColumn(columnIndex).SetComponent(rowIndex, i, value[i])
-                    else:
-                        temp_table.GetTable().GetColumn(columnIndex).SetValue(rowIndex, value)
-                    columnIndex += 1
+            _, uniqueHeaderNames = segStatLogic.getHeaderNames()
+            columnValues = []
+            for key in keys:
+                values = [statistics.get((segmentID, key)) for segmentID in statistics["SegmentIDs"]]
+                if key == segStatLogic.segmentColumnName:
+                    values = ["" if value is None else value for value in values]
+                columnValues.append(values)
+
+            wasModifying = temp_table.StartModify()
+            appendTableColumns(temp_table.GetTable(), columnValues, [uniqueHeaderNames[key] for key in keys])
+            temp_table.Modified()
+            temp_table.EndModify(wasModifying)
 
-        
             segStatLogic.showTable(temp_table)
 
         #stats = segStatLogic.getStatistics()
         #sid = stats.get("SegmentIDs")
 
-        outputFilename = os.path.join(outfdir, f"{men_model_name}_SegmentStatistics.csv")
-        # TODO: open this directory
-        print(outputFilename)
-        segStatLogic.exportToCSVFile(outputFilename)
+        if outfdir:
+            outputFilename = os.path.join(outfdir, f"{men_model_name}_SegmentStatistics.csv")
+            # TODO: open this directory
+            print(outputFilename)
+            with self.stage("CSV export"):
+                segStatLogic.exportToCSVFile(outputFilename)
+
+        self._removeIntermediateNodes(segNode, labelmapNode)
+        return resultsTable
+
+    def segmentMenisciFromModels(
+        self,
+        outfdir: Optional[str],
+        inputVolume: vtkMRMLScalarVolumeNode,
+        regionModels: list[tuple[vtkMRMLModelNode, vtkMRMLModelNode, vtkMRMLModelNode]],
+        men_model_names: list[str],
+        resultsTable: Optional[vtkMRMLTableNode] = None,
+        supersampling: Optional[int] = None,
+    ) -> vtkMRMLTableNode:
+        """segmentFromModels of several menisci at once, typically the (ant, mid, post) models
+        of the medial and then the lateral meniscus.
+
+        All regions are rasterized into one label array over the bounds of all menisci,
+        labelled by meniscus and region (see meniscusRegionLabel), and reduced in a single
+        pass, so the image is read once. The rows of all menisci are added to resultsTable
+        in one fill, and one CSV file per meniscus is written as by segmentFromModels.
+        With supersampling, the statistics are partial-volume weighted, see segmentFromModels.
+        """
+        return self._segmentFromModelsDirect(
+            outfdir, inputVolume, regionModels, men_model_names, resultsTable, supersampling
+        )
+
+    def _segmentFromModelsDirect(
+        self,
+        outfdir: Optional[str],
+        inputVolume: vtkMRMLScalarVolumeNode,
+        regionModels: list,
+        men_model_names: list,
+        resultsTable: Optional[vtkMRMLTableNode],
+        supersampling: Optional[int] = None,
+    ) -> vtkMRMLTableNode:
+        """segmentFromModels without segmentation, labelmap or SegmentStatistics nodes, for
+        one (ant, mid, post) group of models per meniscus."""
+        from MeniscusSignalIntensityLib import (
+            REGION_NAMES,
+            coverageFractions,
+            cropFromPolyData,
+            meniscusRegionLabel,
+            regionStatistics,
+            voxelizePolyData,
+            voxelVolumeFromIjkToRas,
+            weightedRegionStatistics,
+        )
+
+        imageArray = slicer.util.arrayFromVolume(inputVolume)
+        ijkToRasMatrix = vtk.vtkMatrix4x4()
+        inputVolume.GetIJKToRASMatrix(ijkToRasMatrix)
+        ijkToRas = slicer.util.arrayFromVTKMatrix(ijkToRasMatrix)
+
+        models = [model for group in regionModels for model in group]
+        labels = [meniscusRegionLabel(meniscus, name) for meniscus in range(len(regionModels)) for name in REGION_NAMES]
+
+        # Only rasterize and read the padded bounds of the menisci, not the full MRI
+        regionPolyData = [model.GetPolyData() for model in models]
+        crop = cropFromPolyData(regionPolyData, imageArray.shape, ijkToRas)
+        imageArray = crop.crop(imageArray)
+        ijkToRas = crop.ijkToRas
+
+        voxelVolume = voxelVolumeFromIjkToRas(ijkToRas)
+        if supersampling:
+            # Fractional coverage of every voxel by each region, from a supersampled mask
+            with self.stage("voxelize"):
+                fractions = coverageFractions(regionPolyData, imageArray.shape, ijkToRas, supersampling)
+            with self.stage("statistics"):
+                stats = dict(zip(labels, weightedRegionStatistics(imageArray, fractions, voxelVolume)))
+        else:
+            with self.stage("voxelize"):
+                labelArray = voxelizePolyData(regionPolyData, imageArray.shape, ijkToRas, labels)
+            with self.stage("statistics"):
+                stats = regionStatistics(imageArray, labelArray, labels, voxelVolume)
+
+        # Segment names are the model names, as ImportModelToSegmentationNode would name them
+        return self._writeStatisticsRows(
+            outfdir,
+            [model.GetName() for model in models],
+            self._statisticsColumns([stats[label] for label in labels]),
+            men_model_names,
+            resultsTable,
+        )
+
+    @staticmethod
+    def _statisticsColumns(rowStatistics: list[dict], prefix: str = "") -> list:
+        """(column name, values) of every statistic, for one row of statistics per segment."""
+        import numpy as np
+        from MeniscusSignalIntensityLib import STATISTICS_COLUMN_NAMES, STATISTICS_KEYS
+
+        return [
+            (f"{prefix}{STATISTICS_COLUMN_NAMES[key]}", np.array([stats[key] for stats in rowStatistics], dtype=np.float64))
+            for key in STATISTICS_KEYS
+        ]
+
+    def _writeStatisticsRows(
+        self,
+        outfdir: Optional[str],
+        segmentNames: list[str],
+        statisticsColumns: list,
+        men_model_names: list,
+        resultsTable: Optional[vtkMRMLTableNode],
+    ) -> vtkMRMLTableNode:
+        """Add one row per segment with the given (column name, values) to resultsTable (created
+        if None) and, unless outfdir is None, write the ant, mid, post rows of each meniscus to
+        its CSV file."""
+        import csv
+        from MeniscusSignalIntensityLib import REGION_NAMES, appendTableColumns
+
+        columnNames = ["Segment"] + [name for name, _ in statisticsColumns]
+        columnValues = [segmentNames] + [values for _, values in statisticsColumns]
+        rows = [list(row) for row in zip(*columnValues)]
+
+        if not resultsTable:
+            resultsTable = self._addNode("vtkMRMLTableNode")
+            resultsTable.SetName("Meniscus signal intensity")
+
+        # Whole columns at once, with a single Modified event on the table
+        with self.stage("table"):
+            wasModifying = resultsTable.StartModify()
+            appendTableColumns(resultsTable.GetTable(), columnValues, columnNames)
+            resultsTable.Modified()
+            resultsTable.EndModify(wasModifying)
+
+        if outfdir:
+            regionCount = len(REGION_NAMES)
+            for meniscus, men_model_name in enumerate(men_model_names):
+                outputFilename = os.path.join(outfdir, f"{men_model_name}_SegmentStatistics.csv")
+                logging.info(f"Writing {outputFilename}")
+                with self.stage("CSV export"), open(outputFilename, "w", newline="") as csvFile:
+                    writer = csv.writer(csvFile)
+                    writer.writerow(columnNames)
+                    writer.writerows(rows[meniscus * regionCount:(meniscus + 1) * regionCount])
 
         return resultsTable
 
-            
+    def segmentMenisciFromModelsMultiVolume(
+        self,
+        outfdir: Optional[str],
+        inputVolumes: list[vtkMRMLScalarVolumeNode],
+        regionModels: list[tuple[vtkMRMLModelNode, vtkMRMLModelNode, vtkMRMLModelNode]],
+        men_model_names: list[str],
+        resultsTable: Optional[vtkMRMLTableNode] = None,
+    ) -> vtkMRMLTableNode:
+        """segmentMenisciFromModels of several co-registered volumes (sequences) at once.
+
+        The regions are rasterized once, on the grid of the first volume, and resampled
+        onto the grid of any other volume whose geometry differs (see
+        MeniscusSignalIntensityLib.multivolume). The table has one row per region and one
+        block of statistics columns per volume, prefixed by the volume name.
+        """
+        from MeniscusSignalIntensityLib import REGION_NAMES, SharedRegionLabels, meniscusRegionLabel
+
+        models = [model for group in regionModels for model in group]
+        labels = [meniscusRegionLabel(meniscus, name) for meniscus in range(len(regionModels)) for name in REGION_NAMES]
+
+        def volumeGeometry(volume):
+            ijkToRas = vtk.vtkMatrix4x4()
+            volume.GetIJKToRASMatrix(ijkToRas)
+            return slicer.util.arrayFromVolume(volume), slicer.util.arrayFromVTKMatrix(ijkToRas)
+
+        referenceArray, referenceIjkToRas = volumeGeometry(inputVolumes[0])
+        with self.stage("voxelize"):
+            sharedLabels = SharedRegionLabels(
+                [model.GetPolyData() for model in models], labels, referenceArray.shape, referenceIjkToRas
+            )
+
+        statisticsColumns = []
+        for volume in inputVolumes:
+            imageArray, ijkToRas = volumeGeometry(volume)
+            with self.stage("statistics"):
+                stats = sharedLabels.statistics(imageArray, ijkToRas)
+            statisticsColumns += self._statisticsColumns([stats[label] for label in labels], f"{volume.GetName()} ")
+
+        return self._writeStatisticsRows(
+            outfdir, [model.GetName() for model in models], statisticsColumns, men_model_names, resultsTable
+        )
+
+    def computeMeniscusSignalIntensity(
+        self,
+        outfdir: Optional[str],
+        inputVolume: vtkMRMLScalarVolumeNode,
+        medModel: vtkMRMLModelNode,
+        latModel: vtkMRMLModelNode,
+        anatomy: str = "right",
+        planeFitting: str = "bounds",
+        supersampling: Optional[int] = None,
+        additionalVolumes: Optional[list[vtkMRMLScalarVolumeNode]] = None,
+    ) -> vtkMRMLTableNode:
+        """Planes, cuts and regional statistics of both menisci of one knee, in one results table.
+
+        anatomy is "right" or "left". The plane construction uses the side of the
+        meniscus in the image, so for a left knee the medial and lateral roles are swapped.
+        planeFitting is "bounds" or "pca", see generateCutPlaneCoords_fromMenicus. With
+        supersampling, the statistics are partial-volume weighted, see segmentFromModels.
+        With additionalVolumes (other sequences), the regions are applied to all volumes and
+        the table has a block of columns per volume, see segmentMenisciFromModelsMultiVolume.
+        """
+        if additionalVolumes and supersampling:
+            raise ValueError("Partial-volume weighting is not supported with additional volumes")
+
+        sides = self._kneeSides(medModel, latModel, anatomy)
+        planes = [self.generateCutPlaneCoords_fromMenicus(model, isMed, planeFitting) for model, isMed in sides]
+        # Both menisci are cut in one batch
+        regionModels = self.cutModelsFromPlanes(
+            [(model, pAnt, pPost, isMed) for (model, isMed), (pAnt, pPost) in zip(sides, planes)]
+        )
+
+        menModelNames = [model.GetName() for model, _ in sides]
+        if additionalVolumes:
+            return self.segmentMenisciFromModelsMultiVolume(
+                outfdir, [inputVolume] + list(additionalVolumes), regionModels, menModelNames
+            )
+        # Statistics of both menisci in one label volume and one table fill
+        return self.segmentMenisciFromModels(
+            outfdir, inputVolume, regionModels, menModelNames, supersampling=supersampling
+        )
+
+    @staticmethod
+    def _kneeSides(medModel, latModel, anatomy: str = "right") -> list:
+        """(model, isMed) of both menisci, in the order of the medial and lateral plane construction."""
+        #not necessarily intuitive.. but the swap to compute left- is to swap Med<->Lat
+        if anatomy == "right":
+            return [(medModel, True), (latModel, False)]
+        return [(latModel, True), (medModel, False)]
+
+    def startKneeComputation(
+        self,
+        inputVolume: vtkMRMLScalarVolumeNode,
+        medModel: vtkMRMLModelNode,
+        latModel: vtkMRMLModelNode,
+        anatomy: str = "right",
+        planeFitting: str = "bounds",
+        supersampling: Optional[int] = None,
+        surfaceDepth: Optional[float] = None,
+    ):
+        """Start the computations of computeMeniscusSignalIntensity, and unless surfaceDepth is
+        None of mapSignalIntensityToModel for both models, in a background thread.
+
+        The models and the image around them are copied here, in the main thread, so the
+        scene can be used while the task runs. Returns the started
+        MeniscusSignalIntensityLib.BackgroundTask; once it is done, finishKneeComputation
+        creates the nodes from its results.
+        """
+        import numpy as np
+        from MeniscusSignalIntensityLib import BackgroundTask, computeKneeResults, cropFromPolyData
+
+        sides = []
+        for model, isMed in self._kneeSides(medModel, latModel, anatomy):
+            polyData = vtk.vtkPolyData()
+            polyData.DeepCopy(model.GetPolyData())
+            sides.append((polyData, isMed))
+
+        ijkToRasMatrix = vtk.vtkMatrix4x4()
+        inputVolume.GetIJKToRASMatrix(ijkToRasMatrix)
+        imageArray = slicer.util.arrayFromVolume(inputVolume)
+        # The statistics crop (2 voxels) and the surface samples stay inside this sub-volume
+        crop = cropFromPolyData(
+            [polyData for polyData, _ in sides], imageArray.shape, slicer.util.arrayFromVTKMatrix(ijkToRasMatrix), padding=4
+        )
+        task = BackgroundTask(
+            computeKneeResults,
+            sides,
+            np.array(crop.crop(imageArray)),
+            crop.ijkToRas,
+            planeFitting=planeFitting,
+            supersampling=supersampling,
+            surfaceDepth=surfaceDepth,
+        )
+        return task.start()
+
+    @profiledStage("knee results")
+    def finishKneeComputation(
+        self,
+        task,
+        outfdir: Optional[str],
+        medModel: vtkMRMLModelNode,
+        latModel: vtkMRMLModelNode,
+        anatomy: str = "right",
+        resultsTable: Optional[vtkMRMLTableNode] = None,
+        arrayName: str = "SignalIntensity",
+    ) -> tuple[list, list, vtkMRMLTableNode]:
+        """Create the nodes of a done startKneeComputation task, with the same arguments: the
+        plane nodes, region models and results table of computeMeniscusSignalIntensity, and
+        the surface intensity arrays of mapSignalIntensityToModel.
+
+        Returns (planes, regionModels, resultsTable), with one (ant, post) plane pair and one
+        (ant, mid, post) model triple per meniscus, in the order of the plane construction.
+        Re-raises the error of the task (TaskCancelled if it was cancelled).
+        """
+        from MeniscusSignalIntensityLib import REGION_NAMES, setSurfaceIntensity
+
+        results = task.result()
+        sides = self._kneeSides(medModel, latModel, anatomy)
+        planes = [self._addPlaneNodes(meniscusPlanes, isMed) for meniscusPlanes, (_, isMed) in zip(results.planes, sides)]
+        regionModels = [self._addRegionModels(model, regions) for (model, _), regions in zip(sides, results.regions)]
+        resultsTable = self._writeStatisticsRows(
+            outfdir,
+            [model.GetName() for models in regionModels for model in models],
+            self._statisticsColumns([stats[name] for stats in results.statistics for name in REGION_NAMES]),
+            [model.GetName() for model, _ in sides],
+            resultsTable,
+        )
+
+        for (model, _), values in zip(sides, results.surfaceIntensity):
+            if values is None:
+                continue
+            polyData = model.GetPolyData()
+            if polyData.GetNumberOfPoints() != len(values):
+                logging.warning(f"{model.GetName()} changed while its surface intensity was computed, not mapped")
+                continue
+            setSurfaceIntensity(polyData, values, arrayName)
+            polyData.Modified()
+            self._showSurfaceIntensity(model, arrayName)
+
+        return planes, regionModels, resultsTable
+
+
 #
 # MeniscusSignalIntensityTest
 #
@@ -788,50 +1527,729 @@ class MeniscusSignalIntensityTest(ScriptedLoadableModuleTest):
         """Run as few or as many tests as needed here."""
         self.setUp()
         self.test_MeniscusSignalIntensity1()
+        self.test_MeniscusSignalIntensityHeadless()
+        self.test_MeniscusSignalIntensityBatchedCut()
+        self.test_MeniscusSignalIntensityTableColumns()
+        self.test_MeniscusSignalIntensityNodeLifecycle()
+        self.test_MeniscusSignalIntensityProfiling()
+        self.test_MeniscusSignalIntensitySectors()
+        self.test_MeniscusSignalIntensitySurfaceMap()
+        self.test_MeniscusSignalIntensityPlaneFitting()
+        self.test_MeniscusSignalIntensityPreprocess()
+        self.test_MeniscusSignalIntensityIncremental()
+        self.test_MeniscusSignalIntensityVolumeRegion()
+        self.test_MeniscusSignalIntensityPartialVolume()
+        self.test_MeniscusSignalIntensityBackground()
+        self.test_MeniscusSignalIntensityMultiVolume()
+        self.test_MeniscusSignalIntensityBatchSequences()
+        self.test_MeniscusSignalIntensityResultCache()
+        self.test_MeniscusSignalIntensityResultsWriter()
+        self.test_MeniscusSignalIntensityManifest()
+        self.test_MeniscusSignalIntensityLongitudinal()
 
     def test_MeniscusSignalIntensity1(self):
-        """Ideally you should have several levels of tests.  At the lowest level
-        tests should exercise the functionality of the logic with different inputs
-        (both valid and invalid).  At higher levels your tests should emulate the
-        way the user would interact with your code and confirm that it still works
-        the way you intended.
-        One of the most important features of the tests is that it should alert other
-        developers when their changes will have an impact on the behavior of your
-        module.  For example, if a developer removes a feature that you depend on,
-        your test should break so they know that the feature is needed.
-        """
+        """Run the scene pipeline on synthetic menisci and check it against the headless pipeline."""
+        import numpy as np
+        from MeniscusSignalIntensityLib import computeMeniscusStatistics
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
 
         self.delayDisplay("Starting the test")
 
         # Get/create input data
 
-        import SampleData
+        medPolyData = makeSyntheticMeniscus(20000, openingDirection=180)
+        latPolyData = makeSyntheticMeniscus(20000, center=(-45, 0, 0))
+        medModel = slicer.modules.models.logic().AddModel(medPolyData)
+        latModel = slicer.modules.models.logic().AddModel(latPolyData)
+        imageArray, ijkToRas = makeSyntheticVolume(1.5, extent=90, center=(-22.5, 0, 0))
+        inputVolume = slicer.util.addVolumeFromArray(imageArray, slicer.util.vtkMatrixFromArray(ijkToRas))
+        self.delayDisplay("Created test data set")
+
+        # Test the module logic
 
-        registerSampleData()
-        inputVolume = SampleData.downloadSample("MeniscusSignalIntensity1")
-        self.delayDisplay("Loaded test data set")
+        logic = MeniscusSignalIntensityLogic()
+        resTable = logic.computeMeniscusSignalIntensity(None, inputVolume, medModel, latModel, "right")
+        self.assertEqual(resTable.GetNumberOfRows(), 6)
+
+        table = resTable.GetTable()
+        row = 0
+        for polyData, isMed in [(medPolyData, True), (latPolyData, False)]:
+            expected = computeMeniscusStatistics(polyData, imageArray, ijkToRas, isMed, singlePass=False)
+            for regionName in ["ant", "mid", "post"]:
+                voxelCount = table.GetColumnByName("Number of voxels [voxels]").GetValue(row)
+                mean = table.GetColumnByName("Mean").GetValue(row)
+                self.assertGreater(voxelCount, 0)
+                self.assertEqual(voxelCount, expected[regionName]["voxel_count"])
+                self.assertAlmostEqual(mean, expected[regionName]["mean"], places=6)
+                row += 1
 
-        inputScalarRange = inputVolume.GetImageData().GetScalarRange()
-        self.assertEqual(inputScalarRange[0], 0)
-        self.assertEqual(inputScalarRange[1], 695)
+        self.delayDisplay("Test passed")
 
-        outputVolume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
-        threshold = 100
+    def test_MeniscusSignalIntensityHeadless(self):
+        """Run the scene-free pipeline on a synthetic ring and a constant volume."""
+        import numpy as np
+        from MeniscusSignalIntensityLib import computeKneeStatistics, computeMeniscusStatistics
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus
+
+        self.delayDisplay("Starting the headless test")
+
+        polyData = makeSyntheticMeniscus(20000, ringRadius=15, crossSectionRadius=4, arcDegrees=300)
+
+        ijkToRas = np.diag([1.5, 1.5, 1.5, 1.0])
+        ijkToRas[:3, 3] = -30
+        imageArray = np.full((40, 40, 40), 100, dtype=np.int16)
+
+        nodeCount = slicer.mrmlScene.GetNumberOfNodes()
+        stats = computeMeniscusStatistics(polyData, imageArray, ijkToRas, True)
+        self.assertEqual(slicer.mrmlScene.GetNumberOfNodes(), nodeCount)
+
+        self.assertEqual(list(stats.keys()), ["ant", "mid", "post"])
+        ringVolume = 2 * np.pi**2 * 15 * 4**2 * 300 / 360
+        totalVolume = sum(regionStats["volume_mm3"] for regionStats in stats.values())
+        self.assertAlmostEqual(totalVolume / ringVolume, 1.0, delta=0.05)
+        for regionStats in stats.values():
+            self.assertGreater(regionStats["voxel_count"], 0)
+            self.assertEqual(regionStats["mean"], 100)
+            self.assertEqual(regionStats["stdev"], 0)
+
+        # Both menisci in one shared label array give the same regions as one at a time
+        latPolyData = makeSyntheticMeniscus(5000, ringRadius=6, crossSectionRadius=2)
+        kneeStats = computeKneeStatistics(polyData, latPolyData, imageArray, ijkToRas)
+        latStats = computeMeniscusStatistics(latPolyData, imageArray, ijkToRas, False)
+        for name in ["ant", "mid", "post"]:
+            self.assertEqual(kneeStats["med"][name], stats[name])
+            self.assertEqual(kneeStats["lat"][name], latStats[name])
 
-        # Test the module logic
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityBatchedCut(self):
+        """Cutting both menisci in one concurrent batch gives the same regions as separate cuts,
+        and the cut regions rasterize to the single-pass region labels."""
+        import numpy as np
+        from MeniscusSignalIntensityLib import (
+            computeCutPlanes,
+            cutPolyDataBatch,
+            cutPolyDataByPlanes,
+            labelRegionVoxels,
+            voxelizePolyData,
+        )
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+
+        self.delayDisplay("Starting the batched cut test")
+
+        jobs = []
+        for polyData, isMed in [(makeSyntheticMeniscus(5000), True), (makeSyntheticMeniscus(5000, center=(-45, 0, 0)), False)]:
+            planes = computeCutPlanes(polyData, isMed)
+            jobs.append((polyData, planes.ant, planes.post, isMed))
+
+        batched = cutPolyDataBatch(jobs, workers=2)
+        self.assertEqual(len(batched), 2)
+        for job, regions in zip(jobs, batched):
+            for region, expected in zip(regions, cutPolyDataByPlanes(*job)):
+                self.assertEqual(region.GetNumberOfPoints(), expected.GetNumberOfPoints())
+                self.assertEqual(region.GetNumberOfCells(), expected.GetNumberOfCells())
+
+        # Each plane clips the mesh once, the capped halves still enclose the same voxels
+        imageArray, ijkToRas = makeSyntheticVolume(1.0, extent=120, center=(-22.5, 0, 0))
+        for job, regions in zip(jobs, batched):
+            polyData, antPlane, postPlane, isMed = job
+            singlePass = labelRegionVoxels(polyData, imageArray.shape, ijkToRas, antPlane, postPlane, isMed)
+            self.assertTrue(np.array_equal(voxelizePolyData(regions, imageArray.shape, ijkToRas), singlePass))
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityTableColumns(self):
+        """Appended columns go to the table columns of the same name, in any order."""
+        from MeniscusSignalIntensityLib import appendTableColumns
+
+        self.delayDisplay("Starting the table columns test")
+
+        table = vtk.vtkTable()
+        self.assertEqual(appendTableColumns(table, [["a", "b"], [1.0, 2.0], [3.0, 4.0]], ["Segment", "Mean", "Max"]), 2)
+        self.assertEqual(appendTableColumns(table, [[6.0], ["c"], [5.0]], ["Max", "Segment", "Mean"]), 1)
+        self.assertEqual(table.GetValueByName(2, "Segment").ToString(), "c")
+        self.assertEqual(table.GetValueByName(2, "Mean").ToDouble(), 5.0)
+        self.assertEqual(table.GetValueByName(2, "Max").ToDouble(), 6.0)
+        with self.assertRaises(ValueError):
+            appendTableColumns(table, [["d"], [7.0], [8.0]], ["Segment", "Mean", "Median"])
+        self.assertEqual(table.GetNumberOfRows(), 3)
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityNodeLifecycle(self):
+        """Repeated runs inside scopedNodes must not grow the scene."""
+        import numpy as np
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus
+
+        self.delayDisplay("Starting the node lifecycle test")
+
+        medModel = slicer.modules.models.logic().AddModel(makeSyntheticMeniscus(5000))
+        latModel = slicer.modules.models.logic().AddModel(makeSyntheticMeniscus(5000, center=(-45, 0, 0)))
+
+        ijkToRas = vtk.vtkMatrix4x4()
+        for axis in range(3):
+            ijkToRas.SetElement(axis, axis, 1.5)
+        ijkToRas.SetElement(0, 3, -75)
+        ijkToRas.SetElement(1, 3, -30)
+        ijkToRas.SetElement(2, 3, -30)
+        inputVolume = slicer.util.addVolumeFromArray(np.full((40, 40, 70), 100, dtype=np.int16), ijkToRas)
 
         logic = MeniscusSignalIntensityLogic()
+        nodeCount = slicer.mrmlScene.GetNumberOfNodes()
+        for run in range(3):
+            with logic.scopedNodes() as keep:
+                resTable = logic.computeMeniscusSignalIntensity(None, inputVolume, medModel, latModel, "right")
+                self.assertEqual(resTable.GetNumberOfRows(), 6)
+                keep.add(resTable)
+            self.assertEqual(logic.trackedNodeCount(), 1)
+            self.assertEqual(slicer.mrmlScene.GetNumberOfNodes(), nodeCount + 1)
+            logic.releaseNodes(resTable)
+        self.assertEqual(logic.trackedNodeCount(), 0)
+
+        # Counting (which prunes the removed intermediates) and a nested scope inside a scope
+        with logic.scopedNodes() as keep:
+            medPlanes = logic.generateCutPlaneCoords_fromMenicus(medModel, True)
+            self.assertEqual(logic.trackedNodeCount(), 2)
+            with logic.scopedNodes():
+                logic.computeMeniscusSignalIntensity(None, inputVolume, medModel, latModel, "right")
+            self.assertEqual(logic.trackedNodeCount(), 2)
+            latPlanes = logic.generateCutPlaneCoords_fromMenicus(latModel, False)
+            keep.add(latPlanes[0])
+        self.assertEqual(logic.trackedNodeCount(), 1)
+        self.assertIsNone(medPlanes[0].GetScene())
+        self.assertIsNone(latPlanes[1].GetScene())
+        logic.releaseNodes(latPlanes[0])
+        self.assertEqual(logic.trackedNodeCount(), 0)
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityProfiling(self):
+        """Every stage of both menisci is recorded, with the nodes it added to the scene."""
+        import numpy as np
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+
+        self.delayDisplay("Starting the profiling test")
+
+        medModel = slicer.modules.models.logic().AddModel(makeSyntheticMeniscus(5000))
+        latModel = slicer.modules.models.logic().AddModel(makeSyntheticMeniscus(5000, center=(-45, 0, 0)))
+        imageArray, ijkToRas = makeSyntheticVolume(1.5, extent=90, center=(-22.5, 0, 0))
+        inputVolume = slicer.util.addVolumeFromArray(imageArray, slicer.util.vtkMatrixFromArray(ijkToRas))
+
+        logic = MeniscusSignalIntensityLogic()
+        profiler = logic.enableProfiling()
+        logic.computeMeniscusSignalIntensity(None, inputVolume, medModel, latModel, "right")
+        logic.disableProfiling()
+
+        summary = profiler.summary()
+        self.assertEqual(summary["planes"]["count"], 2)
+        # Both menisci are cut, rasterized and reduced in one batch
+        for stage in ["cut", "voxelize", "statistics", "table"]:
+            self.assertEqual(summary[stage]["count"], 1)
+        # Six region models, plus their display nodes
+        self.assertGreaterEqual(summary["cut"]["nodes"], 6)
+        self.assertGreater(summary["voxelize"]["wall_s"], 0)
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensitySectors(self):
+        """Sectors and bands partition the meniscus voxels of the ant/mid/post regions."""
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+
+        self.delayDisplay("Starting the sector test")
+
+        model = slicer.modules.models.logic().AddModel(makeSyntheticMeniscus(20000))
+        imageArray, ijkToRas = makeSyntheticVolume(1.0)
+        inputVolume = slicer.util.addVolumeFromArray(imageArray, slicer.util.vtkMatrixFromArray(ijkToRas))
+
+        logic = MeniscusSignalIntensityLogic()
+        regionStats = logic.computeRegionStatistics(inputVolume, model)
+        sectorTable = logic.computeSectorStatistics(inputVolume, model, angleDiscretization=5.0, radialBands=2)
+        self.assertEqual(sectorTable.GetNumberOfRows(), 72 * 2)
+
+        voxelCounts = sectorTable.GetTable().GetColumnByName("Number of voxels [voxels]")
+        sectorVoxels = sum(voxelCounts.GetValue(row) for row in range(voxelCounts.GetNumberOfValues()))
+        self.assertEqual(sectorVoxels, sum(stats["voxel_count"] for stats in regionStats.values()))
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensitySurfaceMap(self):
+        """Surface samples of a volume that is linear in RAS match the linear function."""
+        import numpy as np
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+
+        self.delayDisplay("Starting the surface map test")
+
+        model = slicer.modules.models.logic().AddModel(makeSyntheticMeniscus(20000))
+        imageArray, ijkToRas = makeSyntheticVolume(1.0)
+        k, j, i = np.indices(imageArray.shape)
+        ras = np.stack((i, j, k, np.ones_like(i)), axis=-1) @ ijkToRas.T
+        linearArray = (2 * ras[..., 0] + ras[..., 1] + 100).astype(np.float32)
+        inputVolume = slicer.util.addVolumeFromArray(linearArray, slicer.util.vtkMatrixFromArray(ijkToRas))
+
+        logic = MeniscusSignalIntensityLogic()
+        logic.mapSignalIntensityToModel(inputVolume, model)
+        points = slicer.util.arrayFromModelPoints(model)
+        values = slicer.util.arrayFromModelPointData(model, "SignalIntensity")
+        np.testing.assert_allclose(values, 2 * points[:, 0] + points[:, 1] + 100, atol=1e-3)
+        self.assertEqual(model.GetDisplayNode().GetActiveScalarName(), "SignalIntensity")
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityPlaneFitting(self):
+        """PCA plane fitting gives the same regions when the knee is rotated in the scanner."""
+        from MeniscusSignalIntensityLib import computeMeniscusStatistics
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+
+        self.delayDisplay("Starting the plane fitting test")
+
+        polyData = makeSyntheticMeniscus(20000, openingDirection=180)
+        rotation = vtk.vtkTransform()
+        rotation.RotateZ(25)
+        rotateFilter = vtk.vtkTransformPolyDataFilter()
+        rotateFilter.SetInputData(polyData)
+        rotateFilter.SetTransform(rotation)
+        rotateFilter.Update()
+        imageArray, ijkToRas = makeSyntheticVolume(0.5)
+
+        expected = computeMeniscusStatistics(polyData, imageArray, ijkToRas, True)
+        rotated = computeMeniscusStatistics(rotateFilter.GetOutput(), imageArray, ijkToRas, True, planeFitting="pca")
+        for regionName in ["ant", "mid", "post"]:
+            self.assertAlmostEqual(rotated[regionName]["volume_mm3"] / expected[regionName]["volume_mm3"], 1.0, delta=0.02)
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityPreprocess(self):
+        """Decimating a dense mesh keeps the region statistics within the documented tolerance."""
+        import numpy as np
+        from MeniscusSignalIntensityLib.preprocess import PREPROCESS_TOLERANCE
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+
+        self.delayDisplay("Starting the preprocessing test")
+
+        model = slicer.modules.models.logic().AddModel(makeSyntheticMeniscus(200000, openingDirection=180))
+        imageArray, ijkToRas = makeSyntheticVolume(1.5)
+        inputVolume = slicer.util.addVolumeFromArray(imageArray, slicer.util.vtkMatrixFromArray(ijkToRas))
+
+        logic = MeniscusSignalIntensityLogic()
+        expected = logic.computeRegionStatistics(inputVolume, model, singlePass=False)
+        logic.preprocessModel(model, inputVolume)
+        self.assertLess(model.GetPolyData().GetNumberOfCells(), 20000)
+        preprocessed = logic.computeRegionStatistics(inputVolume, model, singlePass=False)
+        for regionName in ["ant", "mid", "post"]:
+            for key, tolerance in PREPROCESS_TOLERANCE.items():
+                self.assertLess(abs(preprocessed[regionName][key] / expected[regionName][key] - 1.0), tolerance)
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityIncremental(self):
+        """Moving a cut plane updates the cached region statistics and the results table rows."""
+        import numpy as np
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+
+        self.delayDisplay("Starting the incremental update test")
+
+        medModel = slicer.modules.models.logic().AddModel(makeSyntheticMeniscus(5000))
+        latModel = slicer.modules.models.logic().AddModel(makeSyntheticMeniscus(5000, center=(-45, 0, 0)))
+        imageArray, ijkToRas = makeSyntheticVolume(1.0, extent=90, center=(-22.5, 0, 0))
+        inputVolume = slicer.util.addVolumeFromArray(imageArray, slicer.util.vtkMatrixFromArray(ijkToRas))
+
+        logic = MeniscusSignalIntensityLogic()
+        pAnt, pPost = logic.generateCutPlaneCoords_fromMenicus(medModel, True)
+        cache = logic.createRegionVoxelCache(inputVolume, medModel, True)
+        stats = logic.updateRegionStatistics(cache, pAnt, pPost)
+        self.assertEqual(stats, logic.computeRegionStatistics(inputVolume, medModel, True))
+
+        resTable = logic.computeMeniscusSignalIntensity(None, inputVolume, medModel, latModel, "right")
+        voxelCounts = resTable.GetTable().GetColumnByName("Number of voxels [voxels]")
+        latVoxelCounts = [voxelCounts.GetValue(row) for row in range(3, 6)]
+
+        # Move the ant plane 3 mm along its normal: only the medial rows change
+        origin = np.array(pAnt.GetOriginWorld())
+        pAnt.SetOriginWorld(origin + 3 * np.array(pAnt.GetNormalWorld()))
+        moved = logic.updateRegionStatistics(cache, pAnt, pPost, resTable, 0)
+        self.assertNotEqual(moved["ant"]["voxel_count"], stats["ant"]["voxel_count"])
+        self.assertEqual(
+            sum(regionStats["voxel_count"] for regionStats in moved.values()),
+            sum(regionStats["voxel_count"] for regionStats in stats.values()),
+        )
+        for row, name in enumerate(["ant", "mid", "post"]):
+            self.assertEqual(voxelCounts.GetValue(row), moved[name]["voxel_count"])
+        self.assertEqual([voxelCounts.GetValue(row) for row in range(3, 6)], latVoxelCounts)
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityVolumeRegion(self):
+        """Statistics on the memory-mapped sub-volume around the menisci equal those on the whole volume."""
+        import tempfile
+        from MeniscusSignalIntensityLib import computeKneeStatistics
+        from MeniscusSignalIntensityLib.roi import polyDataListBounds
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+        from MeniscusSignalIntensityLib.volumecache import VolumeCache
+
+        self.delayDisplay("Starting the volume region test")
+
+        medPolyData = makeSyntheticMeniscus(5000)
+        latPolyData = makeSyntheticMeniscus(5000, center=(-45, 0, 0))
+        imageArray, ijkToRas = makeSyntheticVolume(1.0, extent=120, center=(-22.5, 0, 0))
+        expected = computeKneeStatistics(medPolyData, latPolyData, imageArray, ijkToRas)
+
+        with tempfile.TemporaryDirectory() as cacheDir, tempfile.TemporaryDirectory() as dicomDir:
+            with open(os.path.join(dicomDir, "IM0001.dcm"), "wb") as dicomFile:
+                dicomFile.write(b"\0")
+            cache = VolumeCache(cacheDir)
+            cache.put(dicomDir, imageArray, ijkToRas, "1.2.3")
+            bounds = polyDataListBounds([medPolyData, latPolyData])
+            # Another series with the same folder listing is not served the cached one
+            self.assertIsNone(cache.get(dicomDir, "1.2.4"))
+            region = cache.getRegion(dicomDir, "1.2.3", *bounds)
+            self.assertLess(region.array.size, imageArray.size / 10)
+            self.assertEqual(computeKneeStatistics(medPolyData, latPolyData, region.array, region.ijkToRas), expected)
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityPartialVolume(self):
+        """Partial-volume weighting gets the volume of a coarsely sampled meniscus right."""
+        import numpy as np
+        from MeniscusSignalIntensityLib import computeMeniscusStatistics
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+
+        self.delayDisplay("Starting the partial volume test")
+
+        polyData = makeSyntheticMeniscus(50000, ringRadius=15, crossSectionRadius=4, arcDegrees=300)
+        imageArray, ijkToRas = makeSyntheticVolume(1.5)
+        ringVolume = 2 * np.pi**2 * 15 * 4**2 * 300 / 360
+
+        binary = computeMeniscusStatistics(polyData, imageArray, ijkToRas, True, singlePass=False)
+        weighted = computeMeniscusStatistics(polyData, imageArray, ijkToRas, True, supersampling=4)
+        binaryError = abs(sum(stats["volume_mm3"] for stats in binary.values()) / ringVolume - 1.0)
+        weightedError = abs(sum(stats["volume_mm3"] for stats in weighted.values()) / ringVolume - 1.0)
+        self.assertLess(weightedError, 0.01)
+        self.assertLess(weightedError, binaryError)
+        for regionName in ["ant", "mid", "post"]:
+            self.assertAlmostEqual(weighted[regionName]["mean"], binary[regionName]["mean"], delta=1.0)
+            self.assertLessEqual(weighted[regionName]["min"], weighted[regionName]["percentile05"])
+            self.assertLessEqual(weighted[regionName]["percentile95"], weighted[regionName]["max"])
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityBackground(self):
+        """A background knee computation gives the results of the synchronous one, and can be cancelled."""
+        import numpy as np
+        from MeniscusSignalIntensityLib import TaskCancelled
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+
+        self.delayDisplay("Starting the background computation test")
+
+        medModel = slicer.modules.models.logic().AddModel(makeSyntheticMeniscus(20000, openingDirection=180))
+        latModel = slicer.modules.models.logic().AddModel(makeSyntheticMeniscus(20000, center=(-45, 0, 0)))
+        imageArray, ijkToRas = makeSyntheticVolume(1.5, extent=90, center=(-22.5, 0, 0))
+        inputVolume = slicer.util.addVolumeFromArray(imageArray, slicer.util.vtkMatrixFromArray(ijkToRas))
+
+        logic = MeniscusSignalIntensityLogic()
+        expected = logic.computeMeniscusSignalIntensity(None, inputVolume, medModel, latModel, "left")
+        for model in [medModel, latModel]:
+            logic.mapSignalIntensityToModel(inputVolume, model, 1.0)
+        expectedIntensity = [
+            slicer.util.arrayFromModelPointData(model, "SignalIntensity").copy() for model in [medModel, latModel]
+        ]
+
+        nodeCount = slicer.mrmlScene.GetNumberOfNodes()
+        task = logic.startKneeComputation(inputVolume, medModel, latModel, "left", surfaceDepth=1.0)
+        # Nothing is added to the scene until the task is finished
+        self.assertTrue(task.wait(60))
+        self.assertEqual(slicer.mrmlScene.GetNumberOfNodes(), nodeCount)
+        self.assertEqual(task.progress()[0], 1.0)
+        planes, regionModels, resTable = logic.finishKneeComputation(task, None, medModel, latModel, "left")
+        self.assertEqual(len(planes), 2)
+        self.assertEqual([len(models) for models in regionModels], [3, 3])
+
+        self.assertEqual(resTable.GetNumberOfRows(), expected.GetNumberOfRows())
+        for columnName in ["Number of voxels [voxels]", "Mean", "Standard deviation"]:
+            for row in range(expected.GetNumberOfRows()):
+                self.assertAlmostEqual(
+                    resTable.GetTable().GetColumnByName(columnName).GetValue(row),
+                    expected.GetTable().GetColumnByName(columnName).GetValue(row),
+                    places=6,
+                )
+        for model, values in zip([medModel, latModel], expectedIntensity):
+            np.testing.assert_allclose(slicer.util.arrayFromModelPointData(model, "SignalIntensity"), values, rtol=1e-6)
+
+        # A cancelled task stops at its next progress report, and finishing it adds no node
+        task = logic.startKneeComputation(inputVolume, medModel, latModel, "right", supersampling=4)
+        task.cancel()
+        self.assertTrue(task.wait(60))
+        nodeCount = slicer.mrmlScene.GetNumberOfNodes()
+        with self.assertRaises(TaskCancelled):
+            logic.finishKneeComputation(task, None, medModel, latModel, "right")
+        self.assertEqual(slicer.mrmlScene.GetNumberOfNodes(), nodeCount)
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityMultiVolume(self):
+        """Shared region labels give one column block per volume, resampled only for other geometries."""
+        import numpy as np
+        from MeniscusSignalIntensityLib import SharedRegionLabels, computeCutPlanes, computeMeniscusStatistics, cutPolyDataByPlanes
+        from MeniscusSignalIntensityLib.synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+
+        self.delayDisplay("Starting the multi-volume test")
+
+        medPolyData = makeSyntheticMeniscus(20000, openingDirection=180)
+        latPolyData = makeSyntheticMeniscus(20000, center=(-45, 0, 0))
+        medModel = slicer.modules.models.logic().AddModel(medPolyData)
+        latModel = slicer.modules.models.logic().AddModel(latPolyData)
+        imageArray, ijkToRas = makeSyntheticVolume(1.5, extent=90, center=(-22.5, 0, 0))
+        ciss = slicer.util.addVolumeFromArray(imageArray, slicer.util.vtkMatrixFromArray(ijkToRas), name="CISS")
+        # Same grid, other contrast
+        t2map = slicer.util.addVolumeFromArray(2 * imageArray, slicer.util.vtkMatrixFromArray(ijkToRas), name="T2MAP")
+        # Other grid
+        fineArray, fineIjkToRas = makeSyntheticVolume(1.0, extent=90, center=(-22.5, 0, 0))
+        pdfs = slicer.util.addVolumeFromArray(fineArray, slicer.util.vtkMatrixFromArray(fineIjkToRas), name="PDFS")
+
+        logic = MeniscusSignalIntensityLogic()
+        single = logic.computeMeniscusSignalIntensity(None, ciss, medModel, latModel, "right")
+        wide = logic.computeMeniscusSignalIntensity(None, ciss, medModel, latModel, "right", additionalVolumes=[t2map, pdfs])
+        self.assertEqual(wide.GetNumberOfRows(), 6)
+        self.assertEqual(wide.GetNumberOfColumns(), 1 + 3 * (single.GetNumberOfColumns() - 1))
+        table = wide.GetTable()
+        for row in range(6):
+            cissMean = table.GetColumnByName("CISS Mean").GetValue(row)
+            self.assertAlmostEqual(cissMean, single.GetTable().GetColumnByName("Mean").GetValue(row), places=6)
+            self.assertAlmostEqual(table.GetColumnByName("T2MAP Mean").GetValue(row), 2 * cissMean, places=6)
+            self.assertGreater(table.GetColumnByName("PDFS Number of voxels [voxels]").GetValue(row), 0)
+
+        # Labels resampled onto a finer grid stay close to a rasterization on that grid
+        planes = computeCutPlanes(medPolyData, True)
+        regions = cutPolyDataByPlanes(medPolyData, planes.ant, planes.post, True)
+        shared = SharedRegionLabels(regions, [1, 2, 3], imageArray.shape, ijkToRas)
+        shared.statistics(2 * imageArray, ijkToRas)
+        self.assertEqual(shared.gridCount, 1)
+        resampled = shared.statistics(fineArray, fineIjkToRas)
+        self.assertEqual(shared.gridCount, 2)
+        expected = computeMeniscusStatistics(medPolyData, fineArray, fineIjkToRas, True, singlePass=False)
+        resampledVolume = sum(resampled[label]["volume_mm3"] for label in [1, 2, 3])
+        expectedVolume = sum(stats["volume_mm3"] for stats in expected.values())
+        self.assertAlmostEqual(resampledVolume / expectedVolume, 1.0, delta=0.1)
+        for label, regionName in zip([1, 2, 3], ["ant", "mid", "post"]):
+            self.assertAlmostEqual(resampled[label]["mean"], expected[regionName]["mean"], delta=2.0)
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityBatchSequences(self):
+        """The batch finds the other sequences of a subject by folder name and passes them to the worker."""
+        import tempfile
+        from MeniscusSignalIntensityLib.batch import WorkerOptions, findSequenceDirs, parseSequencePattern, workerCommand
+        from MeniscusSignalIntensityLib.manifest import Subject
+
+        self.delayDisplay("Starting the batch sequences test")
+
+        with tempfile.TemporaryDirectory() as subjectFolder:
+            for folder in ("CISS/DICOM", "T2_MAP/DICOM", "PD_FS"):
+                os.makedirs(os.path.join(subjectFolder, folder))
+                with open(os.path.join(subjectFolder, folder, "IM0001.dcm"), "wb") as dicomFile:
+                    dicomFile.write(b"\0")
+            for name in ("BEAR01_MM.stl", "BEAR01_LM.stl"):
+                open(os.path.join(subjectFolder, name), "w").close()
+            subject = Subject(
+                "BEAR01",
+                os.path.join(subjectFolder, "CISS", "DICOM"),
+                os.path.join(subjectFolder, "BEAR01_MM.stl"),
+                os.path.join(subjectFolder, "BEAR01_LM.stl"),
+                "right",
+            )
+
+            options = WorkerOptions(sequencePatterns=(parseSequencePattern("T2MAP=T2_MAP"), ("PDFS", "PD_FS")))
+            sequenceDirs = findSequenceDirs(subject, options.sequencePatterns)
+            self.assertEqual(
+                sequenceDirs,
+                [("T2MAP", os.path.join(subjectFolder, "T2_MAP", "DICOM")), ("PDFS", os.path.join(subjectFolder, "PD_FS"))],
+            )
+            command = workerCommand(subject, subjectFolder, "Slicer", options=options, sequenceDirs=sequenceDirs)
+            self.assertIn(f"T2MAP={sequenceDirs[0][1]}", command)
+            self.assertEqual(command.count("--sequence-dir"), 2)
+            self.assertNotEqual(options.algorithmVersion(), WorkerOptions().algorithmVersion())
+            # The DICOM folder of the subject is not another sequence
+            with self.assertRaises(FileNotFoundError):
+                findSequenceDirs(subject, [("CISS2", "CISS")])
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityResultCache(self):
+        """Cached tables are found by their inputs, and evicted by age and then least recently used first."""
+        import tempfile
+        import time
+        from MeniscusSignalIntensityLib.resultcache import ResultCache
+
+        self.delayDisplay("Starting the result cache test")
+
+        with tempfile.TemporaryDirectory() as workDir:
+            dicomDir = os.path.join(workDir, "DICOM")
+            os.makedirs(dicomDir)
+            paths = {}
+            for name, content in [("IM0001.dcm", "0"), ("MM.stl", "medial"), ("LM.stl", "lateral"), ("table.csv", "Segment\n")]:
+                paths[name] = os.path.join(dicomDir if name.endswith(".dcm") else workDir, name)
+                with open(paths[name], "w") as stream:
+                    stream.write(content)
+
+            cacheDir = os.path.join(workDir, "cache")
+            cache = ResultCache(cacheDir)
+            key = cache.key(paths["MM.stl"], paths["LM.stl"], dicomDir, "right")
+            destination = os.path.join(workDir, "result.csv")
+            self.assertFalse(cache.get(key, destination))
+            cache.put(key, paths["table.csv"])
+            self.assertTrue(cache.get(key, destination))
+            with open(destination) as stream:
+                self.assertEqual(stream.read(), "Segment\n")
+            # Any other input or algorithm version is another entry
+            self.assertNotEqual(cache.key(paths["MM.stl"], paths["LM.stl"], dicomDir, "left"), key)
+            self.assertNotEqual(cache.key(paths["MM.stl"], paths["LM.stl"], dicomDir, "right", "2"), key)
+            with open(paths["MM.stl"], "w") as stream:
+                stream.write("medial, edited")
+            self.assertNotEqual(cache.key(paths["MM.stl"], paths["LM.stl"], dicomDir, "right"), key)
+
+            # Four 8 byte entries, last used 40, 3, 2 and 1 days ago
+            now = time.time()
+            for index, days in enumerate([40, 3, 2, 1]):
+                cache.put(f"entry{index}", paths["table.csv"])
+                os.utime(os.path.join(cacheDir, f"entry{index}.csv"), (now - days * 86400, now - days * 86400))
+            os.remove(os.path.join(cacheDir, f"{key}.csv"))
+            cache.maxAgeDays = 30
+            cache.maxBytes = 20
+            self.assertEqual(cache.evict(), 2)
+            self.assertEqual(
+                [cache.get(f"entry{index}", destination) for index in range(4)], [False, False, True, True]
+            )
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityResultsWriter(self):
+        """Results rows given as sequences or partial dicts are streamed to CSV, and to Arrow when pyarrow is there."""
+        import csv
+        import tempfile
+        from MeniscusSignalIntensityLib import results
+        from MeniscusSignalIntensityLib.results import ResultsWriter, parseValue
+
+        self.delayDisplay("Starting the results writer test")
+
+        columns = ["Subject", "Meniscus", "Region", "Mean", "Volume"]
+        rows = [["BEAR01", "MM", "ant", 10.0, 100.0], {"Subject": "BEAR01", "Meniscus": "MM", "Region": "mid", "Mean": 12.5}]
+        with tempfile.TemporaryDirectory() as outdir:
+            csvPath = os.path.join(outdir, "results.csv")
+            with ResultsWriter(csvPath, columns, batchSize=1) as writer:
+                writer.extend(rows)
+                # Every batch is on disk before close
+                with open(csvPath, newline="") as stream:
+                    self.assertEqual(len(list(csv.reader(stream))), 3)
+                with self.assertRaises(ValueError):
+                    writer.append(["BEAR01", "MM"])
+            with ResultsWriter(csvPath, columns, append=True) as writer:
+                writer.append(["BEAR02", "LM", "post", 9.0, 80.0])
+            with open(csvPath, newline="") as stream:
+                written = list(csv.reader(stream))
+            self.assertEqual(written[0], columns)
+            self.assertEqual(len(written), 4)
+            # Missing dict entries are empty cells
+            self.assertEqual([parseValue(value) for value in written[2][3:]], [12.5, None])
+
+            # Without pyarrow, Arrow results fall back to CSV next to the requested path
+            installedPyarrow = results.pyarrow
+            results.pyarrow = None
+            try:
+                with ResultsWriter(os.path.join(outdir, "fallback.arrow"), columns) as writer:
+                    writer.extend(rows)
+                self.assertEqual(writer.format, "csv")
+                self.assertEqual(writer.path, os.path.join(outdir, "fallback.csv"))
+                self.assertTrue(os.path.exists(writer.path))
+            finally:
+                results.pyarrow = installedPyarrow
+
+            if installedPyarrow:
+                arrowPath = os.path.join(outdir, "results.arrow")
+                with ResultsWriter(arrowPath, columns, batchSize=1) as writer:
+                    writer.extend(rows)
+                with installedPyarrow.OSFile(arrowPath) as source:
+                    table = installedPyarrow.ipc.open_stream(source).read_all()
+                self.assertEqual(table.num_rows, 2)
+                self.assertEqual(table.column("Region").to_pylist(), ["ant", "mid"])
+                self.assertEqual(table.column("Volume").to_pylist(), [100.0, None])
+
+        self.delayDisplay("Test passed")
+
+    def test_MeniscusSignalIntensityManifest(self):
+        """The manifest lists complete subject folders only, and a refresh rescans changed folders only."""
+        import json
+        import tempfile
+        from MeniscusSignalIntensityLib.manifest import manifestSubjects, updateManifest
+
+        self.delayDisplay("Starting the manifest test")
+
+        def addFile(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as stream:
+                stream.write("0")
+
+        with tempfile.TemporaryDirectory() as dataDir:
+            addFile(os.path.join(dataDir, "BEAR01_right", "BEAR01_MM.stl"))
+            addFile(os.path.join(dataDir, "BEAR01_right", "BEAR01_LM.stl"))
+            addFile(os.path.join(dataDir, "BEAR01_right", "MRI", "CISS", "IM0001.dcm"))
+            # No lateral STL yet
+            addFile(os.path.join(dataDir, "BEAR02_left", "BEAR02_MM.stl"))
+            addFile(os.path.join(dataDir, "BEAR02_left", "MRI", "IM0001.dcm"))
+            addFile(os.path.join(dataDir, "OTHER03_right", "OTHER03_MM.stl"))
+
+            manifestPath = os.path.join(dataDir, "manifest.json")
+            manifest = updateManifest(dataDir, manifestPath, "BEAR")
+            self.assertEqual(sorted(manifest["subjects"]), ["BEAR01_right", "BEAR02_left"])
+            subjects = manifestSubjects(manifest)
+            self.assertEqual([subject.subjectId for subject in subjects], ["BEAR01_right"])
+            self.assertEqual(subjects[0].dicomDir, os.path.join(dataDir, "BEAR01_right", "MRI", "CISS"))
+            self.assertEqual(subjects[0].anatomy, "right")
+
+            # Mark the saved entries: entries that are reused keep the mark, rescanned ones lose it
+            for entry in manifest["subjects"].values():
+                entry["mark"] = True
+            with open(manifestPath, "w") as manifestFile:
+                json.dump(manifest, manifestFile)
+            addFile(os.path.join(dataDir, "BEAR02_left", "BEAR02_LM.stl"))
+            refreshed = updateManifest(dataDir, manifestPath, "BEAR")
+            self.assertTrue(refreshed["subjects"]["BEAR01_right"].get("mark"))
+            self.assertFalse(refreshed["subjects"]["BEAR02_left"].get("mark"))
+            self.assertEqual([subject.subjectId for subject in manifestSubjects(refreshed)], ["BEAR01_right", "BEAR02_left"])
+
+        self.delayDisplay("Test passed")
 
-        # Test algorithm with non-inverted threshold
-        logic.process(inputVolume, outputVolume, threshold, True)
-        outputScalarRange = outputVolume.GetImageData().GetScalarRange()
-        self.assertEqual(outputScalarRange[0], inputScalarRange[0])
-        self.assertEqual(outputScalarRange[1], threshold)
-
-        # Test algorithm with inverted threshold
-        logic.process(inputVolume, outputVolume, threshold, False)
-        outputScalarRange = outputVolume.GetImageData().GetScalarRange()
-        self.assertEqual(outputScalarRange[0], inputScalarRange[0])
-        self.assertEqual(outputScalarRange[1], inputScalarRange[1])
+    def test_MeniscusSignalIntensityLongitudinal(self):
+        """Scan names are grouped per subject and knee, and change tables follow the first timepoint."""
+        from MeniscusSignalIntensityLib.longitudinal import buildLongitudinalIndex, changeOverTimeRows, parseScanName
+        from MeniscusSignalIntensityLib.manifest import Subject
+
+        self.delayDisplay("Starting the longitudinal test")
+
+        scanName = parseScanName("BEAR_II_100_6_M_left_3T")
+        self.assertEqual(scanName.subjectKey, "BEAR_II_100")
+        self.assertEqual(scanName.timepoint, 6)
+        self.assertEqual(scanName.kneeKey, "BEAR_II_100_left")
+        # Laterality is a whole token, not a substring
+        self.assertIsNone(parseScanName("BEAR_II_100_6_M_brightness"))
+        self.assertIsNone(parseScanName("BEAR_left"))
+
+        # Only the folder names matter to the index
+        subjects = [
+            Subject(name, "", "", "", "")
+            for name in ["BEAR_II_100_24_M_left", "BEAR_II_100_6_M_left", "BEAR_II_100_6_M_right", "notes_left"]
+        ]
+        index = buildLongitudinalIndex(subjects)
+        self.assertEqual(sorted(index), ["BEAR_II_100_left", "BEAR_II_100_right"])
+        self.assertEqual([scan.timepoint for scan, _ in index["BEAR_II_100_left"]], [6, 24])
+
+        columns = ["Number of voxels [voxels]", "Mean"]
+        timepointTables = [
+            (scan, subject.subjectId, columns, [[subject.subjectId, f"{subject.subjectId}_MM", "ant", 100.0, 100.0 + scan.timepoint]])
+            for scan, subject in index["BEAR_II_100_left"]
+        ]
+        header, rows = changeOverTimeRows("BEAR_II_100_left", timepointTables)
+        self.assertEqual(header[-2:], ["Mean change", "Mean change [%]"])
+        self.assertEqual([row[1] for row in rows], ["MM", "MM"])
+        self.assertEqual([row[-2] for row in rows], [0.0, 18.0])
+        self.assertAlmostEqual(rows[1][-1], 100.0 * 18 / 106)
 
         self.delayDisplay("Test passed")
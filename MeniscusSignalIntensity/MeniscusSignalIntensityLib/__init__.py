@@ -0,0 +1,30 @@
+"""Scene-free computation helpers of the MeniscusSignalIntensity module."""
+
+from .planes import PLANE_FITTING_METHODS, Plane, MeniscusPlanes, computeCutPlanes
+from .regions import (
+    MENISCUS_NAMES,
+    REGION_LABELS,
+    REGION_NAMES,
+    classifyRegions,
+    cutPolyDataBatch,
+    cutPolyDataByPlanes,
+    labelRegionVoxels,
+    meniscusRegionLabel,
+    voxelizePolyData,
+)
+from .roi import ImageCrop, cropFromBounds, cropFromPolyData
+from .tables import appendTableColumns, setTableRows
+from .statistics import STATISTICS_COLUMN_NAMES, STATISTICS_KEYS, regionStatistics, voxelVolumeFromIjkToRas
+from .partialvolume import coverageFractions, weightedRegionStatistics
+from .sectors import classifySectors, labelSectorVoxels
+from .surface import addSurfaceIntensity, sampleSurfaceIntensity, setSurfaceIntensity, trilinearSample
+from .incremental import RegionVoxelCache
+from .multivolume import SharedRegionLabels
+from .engine import (
+    KneeResults,
+    computeKneeResults,
+    computeKneeStatistics,
+    computeMeniscusStatistics,
+    computeSectorStatistics,
+)
+from .tasks import BackgroundTask, TaskCancelled
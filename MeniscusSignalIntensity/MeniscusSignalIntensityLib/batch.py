@@ -0,0 +1,442 @@
+"""
+Parallel multi-subject batch processing.
+
+Each subject is processed by its own Slicer process running
+BrownMeniscus_BatchProcessing/process_subject.py, so subjects do not share a
+scene or a DICOM database and the work scales with the number of cores. The
+rows of every finished subject are streamed into one cohort results file. With a
+trace path, the per-stage timings of every worker are merged into one Chrome
+trace and summarized at the end. Workers only keep the sub-volume around the
+menisci in memory (see volumecache.VolumeCache.getRegion), so many of them can
+run at once on a machine with limited RAM. This module itself does not need slicer and can
+be run from a plain python.
+"""
+
+import contextlib
+import csv
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import NamedTuple, Optional
+
+from .manifest import Subject, buildManifest, findDicomDir, manifestSubjects, updateManifest
+from .profiling import StageProfiler, formatSummary, loadTraceEvents, relabelTraceEvents, summarizeTraceEvents, writeTraceEvents
+from .resultcache import ALGORITHM_VERSION, ResultCache
+from .results import KEY_COLUMNS, ResultsWriter, parseValue
+
+
+WORKER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "BrownMeniscus_BatchProcessing",
+    "process_subject.py",
+)
+
+MERGED_RESULTS_FILENAME = "MeniscusSignalIntensity_results.csv"
+
+# Statuses of subjects that have a results table
+SUCCESS_STATUSES = ("ok", "cached")
+
+
+class WorkerOptions(NamedTuple):
+    """Processing options passed on to every worker."""
+
+    planeFitting: str = "bounds"  # see planes.computeCutPlanes
+    preprocessMeshes: bool = False  # see preprocess
+    fullVolume: bool = False  # keep the whole volume in memory instead of the menisci sub-volume
+    partialVolume: bool = False  # see partialvolume
+    # (name, folder name pattern) of the co-registered sequences of every subject, see findSequenceDirs
+    sequencePatterns: tuple[tuple[str, str], ...] = ()
+
+    def arguments(self) -> list[str]:
+        arguments = []
+        if self.planeFitting != "bounds":
+            arguments += ["--plane-fitting", self.planeFitting]
+        if self.preprocessMeshes:
+            arguments.append("--preprocess-meshes")
+        if self.fullVolume:
+            arguments.append("--full-volume")
+        if self.partialVolume:
+            arguments.append("--partial-volume")
+        return arguments
+
+    def algorithmVersion(self) -> str:
+        """Result cache version of these options. The defaults keep ALGORITHM_VERSION, so
+        results of other options are cached apart without invalidating existing entries.
+        fullVolume gives the same results and shares the version."""
+        version = ALGORITHM_VERSION
+        if self.planeFitting != "bounds":
+            version += f"-{self.planeFitting}"
+        if self.preprocessMeshes:
+            from .preprocess import PREPROCESS_VERSION
+
+            version += f"-preprocess{PREPROCESS_VERSION}"
+        if self.partialVolume:
+            from .partialvolume import DEFAULT_SUPERSAMPLING
+
+            version += f"-partialvolume{DEFAULT_SUPERSAMPLING}"
+        if self.sequencePatterns:
+            version += "-sequences" + ",".join(name for name, _ in self.sequencePatterns)
+        return version
+
+
+def parseSequencePattern(text: str) -> tuple[str, str]:
+    """(name, pattern) of a NAME=PATTERN command line argument."""
+    name, _, pattern = text.partition("=")
+    if not name or not pattern:
+        raise ValueError(f"Expected NAME=PATTERN, got {text}")
+    return name, pattern
+
+
+def findSequenceDirs(subject: Subject, sequencePatterns) -> list[tuple[str, str]]:
+    """(name, DICOM folder) of each (name, pattern) of sequencePatterns for one subject.
+
+    The folder of a sequence is the first folder below the subject folder (the folder of
+    the STLs), breadth first, whose name contains pattern and which holds .dcm files or
+    has them in a folder below it (see manifest.findDicomDir). The DICOM folder of the
+    subject itself is never taken. Raises FileNotFoundError if a sequence is not found.
+    """
+    subjectFolder = os.path.dirname(subject.medialStl)
+    mainDicomDir = os.path.abspath(subject.dicomDir)
+    sequenceDirs = []
+    for name, pattern in sequencePatterns:
+        sequenceDir = None
+        pending = [subjectFolder]
+        while pending and not sequenceDir:
+            with os.scandir(pending.pop(0)) as entries:
+                folders = sorted(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            for folder in folders:
+                if pattern in os.path.basename(folder):
+                    dicomDir = findDicomDir(folder)[0]
+                    if dicomDir and os.path.abspath(dicomDir) != mainDicomDir:
+                        sequenceDir = dicomDir
+                        break
+            pending.extend(folders)
+        if not sequenceDir:
+            raise FileNotFoundError(f"No {name} DICOM folder matching '{pattern}' below {subjectFolder}")
+        sequenceDirs.append((name, sequenceDir))
+    return sequenceDirs
+
+
+class SubjectResult(NamedTuple):
+    """Outcome of processing one subject."""
+
+    subjectId: str
+    status: str  # "ok", "cached", "failed" or "timeout"
+    seconds: float
+    resultsFile: Optional[str]
+    message: str = ""
+
+
+def findSubjects(dataDir: str, namePattern: str = "BEAR", manifestPath: Optional[str] = None) -> list[Subject]:
+    """Subjects of dataDir, from the manifest at manifestPath (refreshed incrementally) or
+    from a fresh scan when no manifest path is given. See manifest."""
+    if manifestPath:
+        manifest = updateManifest(dataDir, manifestPath, namePattern)
+    else:
+        manifest = buildManifest(dataDir, namePattern)
+    return manifestSubjects(manifest)
+
+
+def defaultSlicerExecutable() -> str:
+    """Slicer launcher to run the workers with, from the SLICER_EXECUTABLE environment variable."""
+    return os.environ.get("SLICER_EXECUTABLE", "Slicer")
+
+
+def workerCommand(
+    subject: Subject,
+    subjectOutdir: str,
+    slicerExecutable: str,
+    cacheDir: Optional[str] = None,
+    traceFile: Optional[str] = None,
+    options: WorkerOptions = WorkerOptions(),
+    sequenceDirs=(),
+) -> list[str]:
+    """Command line that processes a single subject in a headless Slicer process, with the
+    (name, DICOM folder) of its other sequences (see findSequenceDirs)."""
+    command = [
+        slicerExecutable,
+        "--no-splash",
+        "--no-main-window",
+        "--python-script",
+        WORKER_SCRIPT,
+        "--dicom-dir", subject.dicomDir,
+        "--medial-stl", subject.medialStl,
+        "--lateral-stl", subject.lateralStl,
+        "--anatomy", subject.anatomy,
+        "--outdir", subjectOutdir,
+        "--results-file", resultsFilePath(subject, subjectOutdir),
+    ]
+    if cacheDir:
+        command += ["--cache-dir", cacheDir]
+    if traceFile:
+        command += ["--trace-file", traceFile]
+    for name, sequenceDir in sequenceDirs:
+        command += ["--sequence-dir", f"{name}={sequenceDir}"]
+    return command + options.arguments()
+
+
+def resultsFilePath(subject: Subject, subjectOutdir: str) -> str:
+    return os.path.join(subjectOutdir, f"{subject.subjectId}.csv")
+
+
+def traceFilePath(subject: Subject, subjectOutdir: str) -> str:
+    return os.path.join(subjectOutdir, f"{subject.subjectId}_trace.json")
+
+
+def runWorker(command: list[str], timeout: Optional[float]) -> subprocess.CompletedProcess:
+    """Run a worker command and capture its output. Raises subprocess.TimeoutExpired after
+    timeout seconds, once the worker and all its child processes are killed.
+
+    The Slicer launcher starts the application as a child process, so killing only the
+    launcher would leave the application running. The worker gets its own process group
+    (a process tree on Windows), which is killed as a whole.
+    """
+    if sys.platform == "win32":
+        process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
+        )
+    else:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        killProcessTree(process)
+        # Reap the worker and close its pipes
+        process.communicate()
+        raise
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def killProcessTree(process: subprocess.Popen) -> None:
+    """Kill a process started by runWorker and all of its descendants."""
+    if sys.platform == "win32":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+    else:
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+def processSubject(
+    subject: Subject,
+    outdir: str,
+    slicerExecutable: str,
+    timeout: Optional[float],
+    cacheDir: Optional[str] = None,
+    resultCache: Optional[ResultCache] = None,
+    traceFile: Optional[str] = None,
+    options: WorkerOptions = WorkerOptions(),
+) -> SubjectResult:
+    """Run the worker for one subject and wait for it, killing it and its child processes
+    after timeout seconds (see runWorker).
+
+    If the subject's inputs are found in resultCache, the cached table is used and no
+    worker is started. With traceFile, the worker writes its stage timings there. Subjects
+    missing one of the sequences of options.sequencePatterns fail without a worker.
+    """
+    subjectOutdir = os.path.join(outdir, subject.subjectId)
+    os.makedirs(subjectOutdir, exist_ok=True)
+    startTime = time.perf_counter()
+    try:
+        sequenceDirs = findSequenceDirs(subject, options.sequencePatterns)
+    except FileNotFoundError as error:
+        return SubjectResult(subject.subjectId, "failed", time.perf_counter() - startTime, None, str(error))
+    command = workerCommand(subject, subjectOutdir, slicerExecutable, cacheDir, traceFile, options, sequenceDirs)
+    resultsFile = resultsFilePath(subject, subjectOutdir)
+    if traceFile and os.path.exists(traceFile):
+        os.remove(traceFile)
+
+    resultKey = None
+    if resultCache:
+        resultKey = resultCache.key(
+            subject.medialStl,
+            subject.lateralStl,
+            subject.dicomDir,
+            subject.anatomy,
+            options.algorithmVersion(),
+            [sequenceDir for _, sequenceDir in sequenceDirs],
+        )
+        if resultCache.get(resultKey, resultsFile):
+            return SubjectResult(subject.subjectId, "cached", time.perf_counter() - startTime, resultsFile)
+    try:
+        completed = runWorker(command, timeout)
+    except subprocess.TimeoutExpired:
+        return SubjectResult(subject.subjectId, "timeout", time.perf_counter() - startTime, None, f"Exceeded {timeout} s")
+    seconds = time.perf_counter() - startTime
+
+    if completed.returncode != 0 or not os.path.exists(resultsFile):
+        message = (completed.stderr or completed.stdout).strip().splitlines()[-1:] or [f"Exit code {completed.returncode}"]
+        return SubjectResult(subject.subjectId, "failed", seconds, None, message[0])
+    if resultCache:
+        resultCache.put(resultKey, resultsFile)
+    return SubjectResult(subject.subjectId, "ok", seconds, resultsFile)
+
+
+def readSubjectRows(result: SubjectResult) -> tuple[list[str], list[list]]:
+    """Statistics column names and cohort rows (subject, meniscus, region, statistics...)
+    of a subject's results table.
+
+    The Segment column of the table holds "<meniscus model>_<region>" names.
+    """
+    with open(result.resultsFile, newline="") as subjectStream:
+        rows = list(csv.reader(subjectStream))
+    if not rows:
+        return [], []
+    header = rows[0]
+    cohortRows = []
+    for row in rows[1:]:
+        meniscus, _, region = row[0].rpartition("_")
+        cohortRows.append([result.subjectId, meniscus, region] + [parseValue(value) for value in row[1:]])
+    return header[1:], cohortRows
+
+
+def runBatch(
+    subjects: list[Subject],
+    outdir: str,
+    workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+    slicerExecutable: Optional[str] = None,
+    cacheDir: Optional[str] = None,
+    resultCache: Optional[ResultCache] = None,
+    resultsPath: Optional[str] = None,
+    tracePath: Optional[str] = None,
+    options: WorkerOptions = WorkerOptions(),
+) -> list[SubjectResult]:
+    """Process subjects with up to `workers` concurrent Slicer processes.
+
+    Every subject writes to its own sub-directory of outdir, and its rows are
+    appended to the cohort results file resultsPath (default
+    outdir/MERGED_RESULTS_FILENAME; .csv, .arrow or .parquet) as soon as the subject
+    is done, so an interrupted batch keeps the subjects finished so far. If cacheDir
+    is given, the workers load unchanged DICOM folders from that volume cache
+    (see volumecache) instead of importing them again. Subjects whose inputs did not
+    change since they were last processed are taken from resultCache.
+
+    With tracePath, the stage timings of the batch and of every worker (see
+    profiling) are written there as one Chrome trace, and per-stage and per-subject
+    summary tables are logged at the end. options are passed on to the workers.
+    """
+    workers = workers or os.cpu_count() or 1
+    slicerExecutable = slicerExecutable or defaultSlicerExecutable()
+    os.makedirs(outdir, exist_ok=True)
+    resultsPath = resultsPath or os.path.join(outdir, MERGED_RESULTS_FILENAME)
+    profiler = StageProfiler(processName="batch") if tracePath else None
+    workerEvents = []
+
+    def process(subject: Subject) -> SubjectResult:
+        traceFile = traceFilePath(subject, os.path.join(outdir, subject.subjectId)) if profiler else None
+        stage = profiler.stage("subject", "batch", subject=subject.subjectId) if profiler else contextlib.nullcontext({})
+        with stage as stageArgs:
+            result = processSubject(
+                subject, outdir, slicerExecutable, timeout, cacheDir, resultCache, traceFile, options
+            )
+            stageArgs["status"] = result.status
+        return result
+
+    results = []
+    writer = None
+    try:
+        # Threads only wait on the worker processes, the processing itself runs in parallel processes
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(process, subject): subject for subject in subjects}
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                logging.info(f"[{len(results)}/{len(subjects)}] {result.subjectId}: {result.status} ({result.seconds:.1f} s) {result.message}")
+                if profiler:
+                    subject = futures[future]
+                    traceFile = traceFilePath(subject, os.path.join(outdir, subject.subjectId))
+                    # Stable per-subject pids, so that the trace viewer shows one row per subject
+                    workerPid = 100000 + subjects.index(subject)
+                    workerEvents += relabelTraceEvents(loadTraceEvents(traceFile), workerPid, subject.subjectId)
+                if result.status not in SUCCESS_STATUSES:
+                    continue
+
+                statisticsColumns, rows = readSubjectRows(result)
+                if writer is None:
+                    writer = ResultsWriter(resultsPath, list(KEY_COLUMNS) + statisticsColumns)
+                elif list(KEY_COLUMNS) + statisticsColumns != writer.columns:
+                    logging.warning(f"Column mismatch in {result.resultsFile}, skipping")
+                    continue
+                writer.extend(rows)
+                writer.flush()
+    finally:
+        if writer:
+            writer.close()
+            logging.info(f"Wrote {writer.rowCount} rows to {writer.path}")
+
+    if resultCache:
+        resultCache.evict()
+    if profiler:
+        writeTraceEvents(tracePath, profiler.traceEvents() + workerEvents)
+        logSummary(workerEvents)
+        logging.info(f"Wrote trace to {tracePath}")
+    return results
+
+
+def logSummary(workerEvents: list[dict]) -> None:
+    """Log the per-stage summary over all workers and the per-subject totals."""
+    subjectNames = {event["pid"]: event["args"]["name"] for event in workerEvents if event.get("ph") == "M"}
+    logging.info(formatSummary(summarizeTraceEvents(workerEvents)))
+    subjectEvents = [event for event in workerEvents if event["name"] == "subject"]
+    logging.info(formatSummary(summarizeTraceEvents(subjectEvents, lambda event: subjectNames[event["pid"]]), "subject"))
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compute meniscus signal intensity for a cohort in parallel.")
+    parser.add_argument("dataDir", help="Folder containing one sub-folder per subject")
+    parser.add_argument("outdir", help="Output folder")
+    parser.add_argument("--results", default=None, help=f"Cohort results file, .csv, .arrow or .parquet (default: outdir/{MERGED_RESULTS_FILENAME})")
+    parser.add_argument("--workers", type=int, default=None, help="Number of concurrent Slicer processes (default: number of cores)")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-subject timeout in seconds")
+    parser.add_argument("--slicer", default=None, help="Slicer executable (default: $SLICER_EXECUTABLE or Slicer)")
+    parser.add_argument("--pattern", default="BEAR", help="Only process folders whose name contains this text")
+    parser.add_argument("--manifest", default=None, help="Subject manifest file, created or refreshed before the batch")
+    parser.add_argument("--cache-dir", default=None, help="Volume cache folder, reused across runs")
+    parser.add_argument("--result-cache-dir", default=None, help="Results cache folder, reused across runs")
+    parser.add_argument("--result-cache-max-mb", type=float, default=None, help="Evict cached results beyond this size")
+    parser.add_argument("--result-cache-max-days", type=float, default=None, help="Evict cached results unused for this long")
+    parser.add_argument("--trace", default=None, help="Write per-stage timings of all subjects to this Chrome trace file")
+    parser.add_argument("--plane-fitting", choices=["bounds", "pca"], default="bounds", help="Cut plane fitting, pca for oblique scans")
+    parser.add_argument("--preprocess-meshes", action="store_true", help="Clean and decimate the STLs to the voxel size first")
+    parser.add_argument("--full-volume", action="store_true", help="Load whole volumes instead of the menisci sub-volumes")
+    parser.add_argument("--partial-volume", action="store_true", help="Partial-volume weighted statistics")
+    parser.add_argument(
+        "--sequence",
+        action="append",
+        default=[],
+        type=parseSequencePattern,
+        metavar="NAME=PATTERN",
+        help="Co-registered sequence, found per subject as the folder whose name contains PATTERN; repeatable",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    subjects = findSubjects(args.dataDir, args.pattern, args.manifest)
+    resultCache = None
+    if args.result_cache_dir:
+        maxBytes = int(args.result_cache_max_mb * 1e6) if args.result_cache_max_mb else None
+        resultCache = ResultCache(args.result_cache_dir, maxBytes, args.result_cache_max_days)
+    results = runBatch(
+        subjects,
+        args.outdir,
+        args.workers,
+        args.timeout,
+        args.slicer,
+        args.cache_dir,
+        resultCache,
+        args.results,
+        args.trace,
+        WorkerOptions(args.plane_fitting, args.preprocess_meshes, args.full_volume, args.partial_volume, tuple(args.sequence)),
+    )
+    return 0 if all(result.status in SUCCESS_STATUSES for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
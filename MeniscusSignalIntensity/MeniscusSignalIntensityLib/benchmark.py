@@ -0,0 +1,200 @@
+"""
+Benchmarks of the plane, cut and statistics stages on synthetic menisci.
+
+Each stage is timed separately with the scene-free functions the Logic uses, over
+a grid of surface sizes (triangles) and volume resolutions (isotropic spacing):
+
+- planes: computeCutPlanes, from the RAS bounding box
+- planes_pca: computeCutPlanes, from the principal axes
+- cut: cutPolyDataByPlanes, the three capped region surfaces
+- cut_batch: cutPolyDataBatch of two menisci (the surface cut as medial and as lateral)
+- voxelize: voxelizePolyData of the three region surfaces
+- label: labelRegionVoxels, the single-pass alternative to cut + voxelize
+- statistics: regionStatistics of the labelled voxels
+- total: computeMeniscusStatistics, end to end
+- preprocess: preprocessPolyData, cleaning and decimation to the voxel size
+- total_preprocessed: computeMeniscusStatistics of the preprocessed surface
+- total_partial_volume: computeMeniscusStatistics with partial-volume weighting
+
+Results are written as JSON, and can be compared with an earlier run to catch
+regressions:
+
+python -m MeniscusSignalIntensityLib.benchmark --output current.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+import vtk
+
+from .engine import computeMeniscusStatistics
+from .partialvolume import DEFAULT_SUPERSAMPLING
+from .planes import computeCutPlanes
+from .preprocess import preprocessPolyData
+from .regions import REGION_LABELS, REGION_NAMES, cutPolyDataBatch, cutPolyDataByPlanes, labelRegionVoxels, voxelizePolyData
+from .roi import cropFromBounds
+from .statistics import regionStatistics, voxelVolumeFromIjkToRas
+from .synthetic import makeSyntheticMeniscus, makeSyntheticVolume
+
+
+STAGES = (
+    "planes",
+    "planes_pca",
+    "cut",
+    "cut_batch",
+    "voxelize",
+    "label",
+    "statistics",
+    "total",
+    "preprocess",
+    "total_preprocessed",
+    "total_partial_volume",
+)
+DEFAULT_TRIANGLE_COUNTS = (5000, 50000, 200000)
+DEFAULT_SPACINGS = (1.0, 0.5, 0.3)
+
+
+def timeCall(function, repeats: int) -> tuple[list[float], object]:
+    """Wall times of `repeats` calls of function, and the result of the last call."""
+    seconds = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    return seconds, result
+
+
+def benchmarkCase(triangleCount: int, spacing: float, repeats: int = 5, isMed: bool = True) -> list[dict]:
+    """Time every stage on one synthetic meniscus and volume. Returns one record per stage."""
+    polyData = makeSyntheticMeniscus(triangleCount)
+    imageArray, ijkToRas = makeSyntheticVolume(spacing)
+    labels = [REGION_LABELS[name] for name in REGION_NAMES]
+
+    timings = {}
+    timings["planes"], planes = timeCall(lambda: computeCutPlanes(polyData, isMed), repeats)
+    timings["planes_pca"], _ = timeCall(lambda: computeCutPlanes(polyData, isMed, "pca"), repeats)
+    crop = cropFromBounds(planes.boundsMin, planes.boundsMax, imageArray.shape, ijkToRas)
+    croppedArray = crop.crop(imageArray)
+    timings["cut"], regions = timeCall(lambda: cutPolyDataByPlanes(polyData, planes.ant, planes.post, isMed), repeats)
+    lateralPlanes = computeCutPlanes(polyData, not isMed)
+    # A surface per job: cutPolyDataBatch runs the jobs in threads, which must not share data
+    batchSurfaces = [vtk.vtkPolyData(), vtk.vtkPolyData()]
+    for surface in batchSurfaces:
+        surface.DeepCopy(polyData)
+    batchJobs = [
+        (batchSurfaces[0], planes.ant, planes.post, isMed),
+        (batchSurfaces[1], lateralPlanes.ant, lateralPlanes.post, not isMed),
+    ]
+    timings["cut_batch"], _ = timeCall(lambda: cutPolyDataBatch(batchJobs), repeats)
+    timings["voxelize"], _ = timeCall(
+        lambda: voxelizePolyData(regions, croppedArray.shape, crop.ijkToRas, labels), repeats
+    )
+    timings["label"], labelArray = timeCall(
+        lambda: labelRegionVoxels(polyData, croppedArray.shape, crop.ijkToRas, planes.ant, planes.post, isMed), repeats
+    )
+    voxelVolume = voxelVolumeFromIjkToRas(crop.ijkToRas)
+    timings["statistics"], _ = timeCall(lambda: regionStatistics(croppedArray, labelArray, labels, voxelVolume), repeats)
+    timings["total"], _ = timeCall(lambda: computeMeniscusStatistics(polyData, imageArray, ijkToRas, isMed), repeats)
+    timings["preprocess"], preprocessed = timeCall(lambda: preprocessPolyData(polyData, spacing), repeats)
+    timings["total_preprocessed"], _ = timeCall(
+        lambda: computeMeniscusStatistics(preprocessed, imageArray, ijkToRas, isMed), repeats
+    )
+    timings["total_partial_volume"], _ = timeCall(
+        lambda: computeMeniscusStatistics(polyData, imageArray, ijkToRas, isMed, supersampling=DEFAULT_SUPERSAMPLING),
+        repeats,
+    )
+
+    return [
+        {
+            "stage": stage,
+            "triangles": polyData.GetNumberOfCells(),
+            "spacing": spacing,
+            "shape": list(imageArray.shape),
+            "croppedShape": list(croppedArray.shape),
+            "repeats": repeats,
+            "median": float(np.median(seconds)),
+            "min": float(np.min(seconds)),
+            "max": float(np.max(seconds)),
+        }
+        for stage, seconds in timings.items()
+    ]
+
+
+def runBenchmarks(triangleCounts=DEFAULT_TRIANGLE_COUNTS, spacings=DEFAULT_SPACINGS, repeats: int = 5) -> dict:
+    """Benchmark every combination of triangle count and spacing."""
+    records = []
+    for triangleCount in triangleCounts:
+        for spacing in spacings:
+            records.extend(benchmarkCase(triangleCount, spacing, repeats))
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "vtk": vtk.vtkVersion.GetVTKVersion(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+        },
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": records,
+    }
+
+
+def _caseKey(record: dict) -> tuple:
+    return record["stage"], record["triangles"], record["spacing"]
+
+
+def compareBenchmarks(current: dict, baseline: dict, tolerance: float = 1.25) -> list[str]:
+    """Stages of current whose median time exceeds tolerance times the baseline median."""
+    baselineRecords = {_caseKey(record): record for record in baseline["results"]}
+    regressions = []
+    for record in current["results"]:
+        reference = baselineRecords.get(_caseKey(record))
+        if reference and record["median"] > tolerance * reference["median"]:
+            regressions.append(
+                f"{record['stage']} ({record['triangles']} triangles, {record['spacing']} mm): "
+                f"{record['median']:.4f} s vs {reference['median']:.4f} s"
+            )
+    return regressions
+
+
+def printSummary(benchmarks: dict) -> None:
+    print(f"{'stage':<20}{'triangles':>10}{'spacing':>9}{'voxels':>12}{'median [s]':>12}{'min [s]':>10}")
+    for record in benchmarks["results"]:
+        voxels = int(np.prod(record["croppedShape"]))
+        print(
+            f"{record['stage']:<20}{record['triangles']:>10}{record['spacing']:>9.2f}{voxels:>12}"
+            f"{record['median']:>12.4f}{record['min']:>10.4f}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="benchmark.json", help="JSON file to write the timings to")
+    parser.add_argument("--triangles", type=int, nargs="+", default=DEFAULT_TRIANGLE_COUNTS)
+    parser.add_argument("--spacings", type=float, nargs="+", default=DEFAULT_SPACINGS, help="Voxel sizes in mm")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--baseline", default=None, help="Earlier JSON output to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="Allowed slowdown factor against the baseline")
+    args = parser.parse_args(argv)
+
+    benchmarks = runBenchmarks(args.triangles, args.spacings, args.repeats)
+    with open(args.output, "w") as outputFile:
+        json.dump(benchmarks, outputFile, indent=1)
+    printSummary(benchmarks)
+
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            regressions = compareBenchmarks(benchmarks, json.load(baselineFile), args.tolerance)
+        for regression in regressions:
+            print(f"Slower than baseline: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Scene-free meniscus pipeline: cut planes, region cut and regional statistics
+from a surface and an image array. Nothing here depends on slicer or MRML, so it
+can run in a plain python process.
+"""
+
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+import vtk
+
+from .partialvolume import coverageFractions, weightedRegionStatistics
+from .planes import computeCutPlanes, polyDataBounds
+from .regions import (
+    MENISCUS_NAMES,
+    REGION_LABELS,
+    REGION_NAMES,
+    cutPolyDataByPlanes,
+    labelRegionVoxels,
+    meniscusRegionLabel,
+    voxelizePolyData,
+)
+from .roi import cropFromBounds, cropFromPolyData, polyDataListBounds
+from .sectors import labelSectorVoxels, sectorAngleRange, sectorFromLabel
+from .statistics import regionStatistics, voxelVolumeFromIjkToRas
+from .surface import sampleSurfaceIntensity
+
+
+def computeMeniscusStatistics(
+    polyData: vtk.vtkPolyData,
+    imageArray: np.ndarray,
+    ijkToRas: np.ndarray,
+    isMed: bool = True,
+    singlePass: bool = True,
+    cropPadding: Optional[int] = 2,
+    planeFitting: str = "bounds",
+    supersampling: Optional[int] = None,
+) -> dict[str, dict]:
+    """Return {"ant"|"mid"|"post": statistics} for one meniscus.
+
+    polyData is the closed meniscus surface in RAS, imageArray the (k, j, i) voxel
+    array of the MRI and ijkToRas its 4x4 IJK to RAS matrix. With singlePass the
+    voxels are split into regions by their signed distances to the planes;
+    otherwise the surface is cut into three capped surfaces that are rasterized.
+    Unless cropPadding is None, only the sub-volume of the meniscus bounds padded
+    by cropPadding voxels is rasterized and read. planeFitting selects how the cut
+    planes are fitted, see computeCutPlanes. With supersampling, the voxels are
+    weighted by their coverage by the cut surfaces instead (see partialvolume).
+    """
+    planes = computeCutPlanes(polyData, isMed, planeFitting)
+    if cropPadding is not None:
+        crop = cropFromBounds(planes.boundsMin, planes.boundsMax, imageArray.shape, ijkToRas, cropPadding)
+        imageArray = crop.crop(imageArray)
+        ijkToRas = crop.ijkToRas
+    labels = [REGION_LABELS[name] for name in REGION_NAMES]
+    if supersampling:
+        regions = cutPolyDataByPlanes(polyData, planes.ant, planes.post, isMed)
+        fractions = coverageFractions(regions, imageArray.shape, ijkToRas, supersampling)
+        stats = weightedRegionStatistics(imageArray, fractions, voxelVolumeFromIjkToRas(ijkToRas))
+        return dict(zip(REGION_NAMES, stats))
+    if singlePass:
+        labelArray = labelRegionVoxels(polyData, imageArray.shape, ijkToRas, planes.ant, planes.post, isMed)
+    else:
+        regions = cutPolyDataByPlanes(polyData, planes.ant, planes.post, isMed)
+        labelArray = voxelizePolyData(regions, imageArray.shape, ijkToRas, labels)
+    stats = regionStatistics(imageArray, labelArray, labels, voxelVolumeFromIjkToRas(ijkToRas))
+    return {name: stats[label] for name, label in zip(REGION_NAMES, labels)}
+
+
+def computeKneeStatistics(
+    medPolyData: vtk.vtkPolyData,
+    latPolyData: vtk.vtkPolyData,
+    imageArray: np.ndarray,
+    ijkToRas: np.ndarray,
+    anatomy: str = "right",
+    singlePass: bool = True,
+    cropPadding: Optional[int] = 2,
+    planeFitting: str = "bounds",
+) -> dict[str, dict[str, dict]]:
+    """Return {"med"|"lat": {"ant"|"mid"|"post": statistics}} for both menisci of one knee.
+
+    Same statistics as computeMeniscusStatistics of each meniscus, but all six regions
+    are labelled in one label array (see meniscusRegionLabel) over the bounds of both
+    menisci, so that the image is read and reduced once. anatomy is "right" or
+    "left"; for a left knee the plane construction of both menisci is swapped.
+    """
+    sides = [(medPolyData, anatomy == "right"), (latPolyData, anatomy != "right")]
+    planes = [computeCutPlanes(polyData, isMed, planeFitting) for polyData, isMed in sides]
+    if cropPadding is not None:
+        boundsMin, boundsMax = polyDataListBounds([medPolyData, latPolyData])
+        crop = cropFromBounds(boundsMin, boundsMax, imageArray.shape, ijkToRas, cropPadding)
+        imageArray = crop.crop(imageArray)
+        ijkToRas = crop.ijkToRas
+
+    labelArray = np.zeros(imageArray.shape, dtype=np.uint8)
+    for meniscus, ((polyData, isMed), meniscusPlanes) in enumerate(zip(sides, planes)):
+        if singlePass:
+            regionLabels = labelRegionVoxels(polyData, imageArray.shape, ijkToRas, meniscusPlanes.ant, meniscusPlanes.post, isMed)
+        else:
+            regions = cutPolyDataByPlanes(polyData, meniscusPlanes.ant, meniscusPlanes.post, isMed)
+            regionLabels = voxelizePolyData(regions, imageArray.shape, ijkToRas)
+        # REGION_LABELS shifted to the labels of this meniscus
+        inside = regionLabels > 0
+        labelArray[inside] = regionLabels[inside] + meniscusRegionLabel(meniscus, REGION_NAMES[0]) - 1
+
+    labels = [meniscusRegionLabel(meniscus, name) for meniscus in range(len(sides)) for name in REGION_NAMES]
+    stats = regionStatistics(imageArray, labelArray, labels, voxelVolumeFromIjkToRas(ijkToRas))
+    return {
+        meniscusName: {name: stats[meniscusRegionLabel(meniscus, name)] for name in REGION_NAMES}
+        for meniscus, meniscusName in enumerate(MENISCUS_NAMES)
+    }
+
+
+def _noProgress(fraction: float, message: str) -> None:
+    pass
+
+
+class KneeResults(NamedTuple):
+    """Results of computeKneeResults, one entry per meniscus in the order of the sides."""
+
+    planes: list  # MeniscusPlanes
+    regions: list  # (ant, mid, post) capped vtkPolyData
+    statistics: list  # {"ant"|"mid"|"post": statistics}
+    surfaceIntensity: list  # intensity at every point of the input surface, or None
+
+
+def computeKneeResults(
+    sides: list[tuple[vtk.vtkPolyData, bool]],
+    imageArray: np.ndarray,
+    ijkToRas: np.ndarray,
+    planeFitting: str = "bounds",
+    supersampling: Optional[int] = None,
+    surfaceDepth: Optional[float] = None,
+    surfaceDepthSamples: int = 3,
+    cropPadding: int = 2,
+    progress: Optional[Callable[[float, str], None]] = None,
+) -> KneeResults:
+    """Everything the module computes for one knee, without creating any scene node.
+
+    sides is a list of (polyData, isMed), as in computeMeniscusSignalIntensity of the
+    Logic. The planes are fitted, the surfaces cut into capped regions, and the regions of
+    all menisci rasterized into one label array (see meniscusRegionLabel) over their padded
+    bounds, as by segmentMenisciFromModels, or weighted by coverage with supersampling.
+    Unless surfaceDepth is None, the surface intensity of every input surface is sampled
+    too. progress(fraction, message) is called between the stages; it may raise to stop
+    the computation (see tasks.BackgroundTask).
+    """
+    progress = progress or _noProgress
+    progress(0.0, "Fitting cut planes")
+    planes = [computeCutPlanes(polyData, isMed, planeFitting) for polyData, isMed in sides]
+    progress(0.1, "Cutting the menisci")
+    regions = [
+        cutPolyDataByPlanes(polyData, meniscusPlanes.ant, meniscusPlanes.post, isMed)
+        for (polyData, isMed), meniscusPlanes in zip(sides, planes)
+    ]
+
+    progress(0.3, "Rasterizing the regions")
+    regionPolyData = [polyData for meniscusRegions in regions for polyData in meniscusRegions]
+    labels = [meniscusRegionLabel(meniscus, name) for meniscus in range(len(sides)) for name in REGION_NAMES]
+    crop = cropFromPolyData(regionPolyData, imageArray.shape, ijkToRas, cropPadding)
+    croppedArray = crop.crop(imageArray)
+    voxelVolume = voxelVolumeFromIjkToRas(crop.ijkToRas)
+    if supersampling:
+        fractions = coverageFractions(regionPolyData, croppedArray.shape, crop.ijkToRas, supersampling)
+        progress(0.6, "Computing statistics")
+        stats = dict(zip(labels, weightedRegionStatistics(croppedArray, fractions, voxelVolume)))
+    else:
+        labelArray = voxelizePolyData(regionPolyData, croppedArray.shape, crop.ijkToRas, labels)
+        progress(0.6, "Computing statistics")
+        stats = regionStatistics(croppedArray, labelArray, labels, voxelVolume)
+    statistics = [
+        {name: stats[meniscusRegionLabel(meniscus, name)] for name in REGION_NAMES} for meniscus in range(len(sides))
+    ]
+
+    surfaceIntensity = [None] * len(sides)
+    if surfaceDepth is not None:
+        progress(0.8, "Sampling the surface intensity")
+        surfaceIntensity = [
+            sampleSurfaceIntensity(polyData, imageArray, ijkToRas, surfaceDepth, surfaceDepthSamples)
+            for polyData, _ in sides
+        ]
+    progress(1.0, "Done")
+    return KneeResults(planes, regions, statistics, surfaceIntensity)
+
+
+def computeSectorStatistics(
+    polyData: vtk.vtkPolyData,
+    imageArray: np.ndarray,
+    ijkToRas: np.ndarray,
+    sectorCount: int = 36,
+    radialBands: int = 1,
+    cropPadding: Optional[int] = 2,
+) -> list[dict]:
+    """Statistics of every angular sector (and radial band) of one meniscus, see sectors.
+
+    Sectors are taken around the center of the surface bounding box, the centroid
+    the cut planes are built from. Returns one dict per sector and band, in label
+    order, with "sector", "band", "angle_start" and "angle_end" (degrees) added to
+    the statistics.
+    """
+    boundsMin, boundsMax = polyDataBounds(polyData)
+    center = (boundsMin + boundsMax) / 2
+    if cropPadding is not None:
+        crop = cropFromBounds(boundsMin, boundsMax, imageArray.shape, ijkToRas, cropPadding)
+        imageArray = crop.crop(imageArray)
+        ijkToRas = crop.ijkToRas
+    labelArray = labelSectorVoxels(polyData, imageArray.shape, ijkToRas, center, sectorCount, radialBands)
+
+    labels = range(1, sectorCount * radialBands + 1)
+    stats = regionStatistics(imageArray, labelArray, labels, voxelVolumeFromIjkToRas(ijkToRas))
+    rows = []
+    for label in labels:
+        sector, band = sectorFromLabel(label, radialBands)
+        angleStart, angleEnd = sectorAngleRange(sector, sectorCount)
+        rows.append({"sector": sector, "band": band, "angle_start": angleStart, "angle_end": angleEnd, **stats[label]})
+    return rows
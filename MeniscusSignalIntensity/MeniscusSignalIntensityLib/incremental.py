@@ -0,0 +1,76 @@
+"""
+Region statistics of one meniscus that are cheap to update while its cut planes move.
+
+RegionVoxelCache rasterizes the meniscus once, and keeps the RAS centers and
+intensities of the voxels inside it. Moving a plane then only needs the signed
+distances of those voxels to that plane. They are cached per plane normal, so a
+plane that is only translated along its normal costs a comparison per voxel.
+The regions are the ones of computeMeniscusStatistics with singlePass.
+"""
+
+import numpy as np
+import vtk
+
+from .planes import Plane, polyDataBounds
+from .regions import REGION_LABELS, REGION_NAMES, regionLabelsFromSides, voxelCenters, voxelizePolyData
+from .roi import cropFromBounds
+from .statistics import regionStatistics, voxelVolumeFromIjkToRas
+
+
+PLANE_NAMES = ("ant", "post")
+
+
+class RegionVoxelCache:
+    """Voxels of one meniscus, for recomputing its ant/mid/post statistics as the planes move."""
+
+    def __init__(
+        self,
+        polyData: vtk.vtkPolyData,
+        imageArray: np.ndarray,
+        ijkToRas: np.ndarray,
+        isMed: bool = True,
+        cropPadding: int = 2,
+    ) -> None:
+        boundsMin, boundsMax = polyDataBounds(polyData)
+        crop = cropFromBounds(boundsMin, boundsMax, imageArray.shape, ijkToRas, cropPadding)
+        inside = voxelizePolyData([polyData], crop.shape, crop.ijkToRas)
+        kji = np.nonzero(inside)
+        self.points = voxelCenters(kji, crop.ijkToRas)
+        self.values = np.asarray(crop.crop(imageArray)[kji], dtype=np.float64)
+        self.voxelVolume = voxelVolumeFromIjkToRas(crop.ijkToRas)
+        self.isMed = isMed
+        self.planes = {}
+        # Per plane: (normal, projection of every voxel center on the normal)
+        self._projections = {}
+        # Per plane: whether each voxel center is on the positive side
+        self._positive = {}
+
+    def setPlane(self, name: str, plane: Plane) -> bool:
+        """Move the "ant" or "post" plane. Returns False if the plane did not change."""
+        current = self.planes.get(name)
+        if current is not None and np.array_equal(current.origin, plane.origin) and np.array_equal(current.normal, plane.normal):
+            return False
+        projection = self._projections.get(name)
+        if projection is None or not np.array_equal(projection[0], plane.normal):
+            projection = (np.array(plane.normal, dtype=float), self.points @ plane.normal)
+            self._projections[name] = projection
+        # Signed distance >= 0, without recomputing the projections for a translated plane
+        self._positive[name] = projection[1] >= float(np.dot(plane.origin, plane.normal))
+        self.planes[name] = Plane(np.array(plane.origin, dtype=float), np.array(plane.normal, dtype=float))
+        return True
+
+    def setPlanes(self, antPlane: Plane, postPlane: Plane) -> list[str]:
+        """Move both planes. Returns the names of the planes that changed."""
+        return [name for name, plane in zip(PLANE_NAMES, (antPlane, postPlane)) if self.setPlane(name, plane)]
+
+    def labels(self) -> np.ndarray:
+        """Region label of every cached voxel."""
+        if len(self._positive) < len(PLANE_NAMES):
+            raise ValueError("Both planes must be set first")
+        return regionLabelsFromSides(self._positive["ant"], self._positive["post"], self.isMed)
+
+    def statistics(self) -> dict[str, dict]:
+        """Return {"ant"|"mid"|"post": statistics} for the current planes."""
+        labels = [REGION_LABELS[name] for name in REGION_NAMES]
+        stats = regionStatistics(self.values, self.labels(), labels, self.voxelVolume)
+        return {name: stats[label] for name, label in zip(REGION_NAMES, labels)}
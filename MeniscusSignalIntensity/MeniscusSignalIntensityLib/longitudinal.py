@@ -0,0 +1,332 @@
+"""
+Longitudinal index of a cohort: the scans of every subject and knee over time.
+
+Scan folder names carry the study, subject, timepoint and side, e.g.
+BEAR_II_100_6_M_left_... is subject 100 of BEAR_II at timepoint 6, left knee.
+Scans are grouped per (subject, knee) and ordered by timepoint.
+
+updateLongitudinal keeps a state file with a fingerprint of the inputs of every
+processed scan (the manifest modification times and sizes, and the algorithm
+version), so a run only processes the scans that are new or changed since the
+last one. The change-over-time table of a knee is then rewritten only if one of
+its timepoints was processed: one row per timepoint, meniscus and region with the
+statistics of that scan and the change of the signal intensity columns since the
+first timepoint of the knee.
+
+python -m MeniscusSignalIntensityLib.longitudinal dataDir outdir --cache-dir ...
+"""
+
+import csv
+import json
+import logging
+import os
+import re
+import sys
+from typing import NamedTuple, Optional
+
+from .batch import SUCCESS_STATUSES, SubjectResult, WorkerOptions, parseSequencePattern, readSubjectRows, runBatch
+from .manifest import Subject, anatomyFromName, manifestSubjects, updateManifest
+from .resultcache import ResultCache
+
+
+STATE_VERSION = 1
+STATE_FILENAME = "longitudinal_state.json"
+# Rows of the scans processed by the last run only
+UPDATE_RESULTS_FILENAME = "MeniscusSignalIntensity_update.csv"
+CHANGE_TABLE_SUFFIX = "_longitudinal.csv"
+
+# Statistics columns whose change since the first timepoint is added to the change tables
+CHANGE_COLUMNS = ("Mean", "Median")
+
+# <study>_<subject number>_<timepoint>_..., the study being one or more non-numeric tokens
+SCAN_NAME_PATTERN = re.compile(r"^(?P<study>[A-Za-z][A-Za-z0-9]*(?:_[A-Za-z][A-Za-z0-9]*)*)_(?P<subject>\d+)_(?P<timepoint>\d+)(?:_|$)")
+
+
+class ScanName(NamedTuple):
+    """Identity of a scan, parsed from its folder name."""
+
+    study: str
+    subject: str
+    timepoint: int
+    anatomy: str  # "right" or "left"
+
+    @property
+    def subjectKey(self) -> str:
+        """Subject identity across timepoints, e.g. BEAR_II_100."""
+        return f"{self.study}_{self.subject}"
+
+    @property
+    def kneeKey(self) -> str:
+        """Knee identity across timepoints, e.g. BEAR_II_100_left."""
+        return f"{self.subjectKey}_{self.anatomy}"
+
+
+def parseScanName(folderName: str) -> Optional[ScanName]:
+    """ScanName of a folder name, None if it does not carry a subject, timepoint and side."""
+    match = SCAN_NAME_PATTERN.match(folderName)
+    anatomy = anatomyFromName(folderName)
+    if not match or not anatomy:
+        return None
+    return ScanName(match["study"], match["subject"], int(match["timepoint"]), anatomy)
+
+
+def buildLongitudinalIndex(subjects: list[Subject]) -> dict[str, list[tuple[ScanName, Subject]]]:
+    """Scans of every knee (see ScanName.kneeKey), ordered by timepoint.
+
+    Scans whose name cannot be parsed are skipped with a warning. Of two scans of the
+    same knee and timepoint the first in name order is kept.
+    """
+    index = {}
+    for subject in sorted(subjects, key=lambda subject: subject.subjectId):
+        scanName = parseScanName(subject.subjectId)
+        if scanName is None:
+            logging.warning(f"Skipping {subject.subjectId}: no subject, timepoint and left/right in the name")
+            continue
+        scans = index.setdefault(scanName.kneeKey, [])
+        if any(other.timepoint == scanName.timepoint for other, _ in scans):
+            logging.warning(f"Skipping {subject.subjectId}: duplicate timepoint {scanName.timepoint} of {scanName.kneeKey}")
+            continue
+        scans.append((scanName, subject))
+    for scans in index.values():
+        scans.sort(key=lambda scan: scan[0].timepoint)
+    return index
+
+
+def scanFingerprint(manifestEntry: dict, algorithmVersion: str) -> str:
+    """Inputs of a scan as recorded in its manifest entry, with the algorithm version. Changes
+    whenever the manifest rescans the folder with different files."""
+    return json.dumps(
+        [
+            manifestEntry.get("folderMtime"),
+            manifestEntry.get("dicomDir"),
+            manifestEntry.get("dicomMtime"),
+            manifestEntry.get("dicomFiles"),
+            sorted(manifestEntry.get("files", {}).items()),
+            manifestEntry.get("anatomy"),
+            algorithmVersion,
+        ]
+    )
+
+
+def loadState(statePath: str) -> dict:
+    try:
+        with open(statePath) as stateFile:
+            state = json.load(stateFile)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = None
+    if not state or state.get("version") != STATE_VERSION:
+        state = {"version": STATE_VERSION, "scans": {}, "knees": {}}
+    return state
+
+
+def saveState(state: dict, statePath: str) -> None:
+    temporaryPath = f"{statePath}.{os.getpid()}.tmp"
+    with open(temporaryPath, "w") as stateFile:
+        json.dump(state, stateFile, indent=1)
+    os.replace(temporaryPath, statePath)
+
+
+def meniscusKey(modelName: str) -> str:
+    """Meniscus of a region row that is the same at every timepoint: the last token of the
+    model name (MM or LM for the _MM.stl and _LM.stl models)."""
+    return modelName.rpartition("_")[2] or modelName
+
+
+def changeOverTimeRows(
+    kneeKey: str,
+    timepointTables: list[tuple[ScanName, str, list[str], list[list]]],
+) -> tuple[list[str], list[list]]:
+    """Column names and rows of the change-over-time table of one knee.
+
+    timepointTables holds (scanName, scanId, statistics columns, rows) per timepoint in
+    timepoint order, with rows as returned by batch.readSubjectRows. The change of every
+    CHANGE_COLUMNS column is taken against the first timepoint that has the same meniscus
+    and region; timepoints with other statistics columns than the first are skipped.
+    """
+    if not timepointTables:
+        return [], []
+    statisticsColumns = timepointTables[0][2]
+    changeIndices = [(name, statisticsColumns.index(name)) for name in CHANGE_COLUMNS if name in statisticsColumns]
+    columns = ["Knee", "Meniscus", "Region", "Timepoint", "Scan"] + statisticsColumns
+    for name, _ in changeIndices:
+        columns += [f"{name} change", f"{name} change [%]"]
+
+    baselines = {}
+    rows = []
+    for scanName, scanId, scanColumns, scanRows in timepointTables:
+        if scanColumns != statisticsColumns:
+            logging.warning(f"Column mismatch in the results of {scanId}, left out of {kneeKey}")
+            continue
+        for _, modelName, region, *values in scanRows:
+            key = (meniscusKey(modelName), region)
+            baseline = baselines.setdefault(key, values)
+            row = [kneeKey, key[0], region, scanName.timepoint, scanId] + values
+            for _, index in changeIndices:
+                value, reference = values[index], baseline[index]
+                if value is None or reference is None:
+                    row += [None, None]
+                else:
+                    row += [value - reference, 100.0 * (value - reference) / reference if reference else None]
+            rows.append(row)
+    rows.sort(key=lambda row: (row[1], row[2], row[3]))
+    return columns, rows
+
+
+def writeChangeTable(path: str, columns: list[str], rows: list[list]) -> None:
+    temporaryPath = f"{path}.{os.getpid()}.tmp"
+    with open(temporaryPath, "w", newline="") as tableFile:
+        writer = csv.writer(tableFile)
+        writer.writerow(columns)
+        writer.writerows([["" if value is None else value for value in row] for row in rows])
+    os.replace(temporaryPath, path)
+
+
+class LongitudinalUpdate(NamedTuple):
+    """Outcome of updateLongitudinal."""
+
+    results: list  # batch.SubjectResult of the processed scans
+    changeTables: list[str]  # change-over-time tables written by this run
+    skippedScans: int  # scans unchanged since the last run
+
+
+def updateLongitudinal(
+    dataDir: str,
+    outdir: str,
+    manifestPath: Optional[str] = None,
+    namePattern: str = "BEAR",
+    workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+    slicerExecutable: Optional[str] = None,
+    cacheDir: Optional[str] = None,
+    resultCache: Optional[ResultCache] = None,
+    options: WorkerOptions = WorkerOptions(),
+) -> LongitudinalUpdate:
+    """Process the new and changed scans of dataDir, and rewrite the change-over-time tables
+    of their knees to outdir/<knee>_longitudinal.csv. See the module docstring.
+
+    Scans are processed with batch.runBatch (results in outdir/<scan>/<scan>.csv as usual,
+    the rows of this run in outdir/UPDATE_RESULTS_FILENAME). Failed scans are retried on
+    the next run.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    manifest = updateManifest(dataDir, manifestPath or os.path.join(outdir, "subject_manifest.json"), namePattern)
+    index = buildLongitudinalIndex(manifestSubjects(manifest))
+    statePath = os.path.join(outdir, STATE_FILENAME)
+    state = loadState(statePath)
+    algorithmVersion = options.algorithmVersion()
+
+    fingerprints = {}
+    toProcess = []
+    for scans in index.values():
+        for _, subject in scans:
+            fingerprint = scanFingerprint(manifest["subjects"][subject.subjectId], algorithmVersion)
+            fingerprints[subject.subjectId] = fingerprint
+            scanState = state["scans"].get(subject.subjectId)
+            if not (
+                scanState
+                and scanState["fingerprint"] == fingerprint
+                and os.path.exists(scanState["resultsFile"])
+            ):
+                toProcess.append(subject)
+    logging.info(f"Longitudinal index: {len(index)} knees, {len(fingerprints)} scans, {len(toProcess)} new or changed")
+
+    results = []
+    if toProcess:
+        results = runBatch(
+            toProcess,
+            outdir,
+            workers,
+            timeout,
+            slicerExecutable,
+            cacheDir,
+            resultCache,
+            os.path.join(outdir, UPDATE_RESULTS_FILENAME),
+            options=options,
+        )
+    processed = set()
+    for result in results:
+        if result.status in SUCCESS_STATUSES:
+            state["scans"][result.subjectId] = {
+                "fingerprint": fingerprints[result.subjectId],
+                "resultsFile": result.resultsFile,
+            }
+            processed.add(result.subjectId)
+        else:
+            state["scans"].pop(result.subjectId, None)
+    # Scans whose folder is gone
+    for scanId in set(state["scans"]) - set(fingerprints):
+        del state["scans"][scanId]
+
+    changeTables = []
+    for kneeKey, scans in sorted(index.items()):
+        tablePath = os.path.join(outdir, f"{kneeKey}{CHANGE_TABLE_SUFFIX}")
+        scanIds = [subject.subjectId for _, subject in scans if subject.subjectId in state["scans"]]
+        # Unchanged knee: same processed scans as when its table was written, none reprocessed
+        if (
+            os.path.exists(tablePath)
+            and state["knees"].get(kneeKey) == scanIds
+            and not processed.intersection(scanIds)
+        ):
+            continue
+        timepointTables = []
+        for scanName, subject in scans:
+            scanState = state["scans"].get(subject.subjectId)
+            if scanState and os.path.exists(scanState["resultsFile"]):
+                columns, rows = readSubjectRows(SubjectResult(subject.subjectId, "cached", 0.0, scanState["resultsFile"]))
+                timepointTables.append((scanName, subject.subjectId, columns, rows))
+        if timepointTables:
+            writeChangeTable(tablePath, *changeOverTimeRows(kneeKey, timepointTables))
+            changeTables.append(tablePath)
+            state["knees"][kneeKey] = scanIds
+    saveState(state, statePath)
+    logging.info(f"Wrote {len(changeTables)} change-over-time tables to {outdir}")
+
+    return LongitudinalUpdate(results, changeTables, len(fingerprints) - len(toProcess))
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataDir", help="Folder containing one sub-folder per scan")
+    parser.add_argument("outdir", help="Output folder, also holding the longitudinal state")
+    parser.add_argument("--pattern", default="BEAR", help="Only index folders whose name contains this text")
+    parser.add_argument("--manifest", default=None, help="Subject manifest file (default: outdir/subject_manifest.json)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of concurrent Slicer processes (default: number of cores)")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-scan timeout in seconds")
+    parser.add_argument("--slicer", default=None, help="Slicer executable (default: $SLICER_EXECUTABLE or Slicer)")
+    parser.add_argument("--cache-dir", default=None, help="Volume cache folder, reused across runs")
+    parser.add_argument("--result-cache-dir", default=None, help="Results cache folder, reused across runs")
+    parser.add_argument("--plane-fitting", choices=["bounds", "pca"], default="bounds", help="Cut plane fitting, pca for oblique scans")
+    parser.add_argument("--preprocess-meshes", action="store_true", help="Clean and decimate the STLs to the voxel size first")
+    parser.add_argument("--full-volume", action="store_true", help="Load whole volumes instead of the menisci sub-volumes")
+    parser.add_argument("--partial-volume", action="store_true", help="Partial-volume weighted statistics")
+    parser.add_argument(
+        "--sequence",
+        action="append",
+        default=[],
+        type=parseSequencePattern,
+        metavar="NAME=PATTERN",
+        help="Co-registered sequence, found per scan as the folder whose name contains PATTERN; repeatable",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    resultCache = ResultCache(args.result_cache_dir) if args.result_cache_dir else None
+    update = updateLongitudinal(
+        args.dataDir,
+        args.outdir,
+        args.manifest,
+        args.pattern,
+        args.workers,
+        args.timeout,
+        args.slicer,
+        args.cache_dir,
+        resultCache,
+        WorkerOptions(args.plane_fitting, args.preprocess_meshes, args.full_volume, args.partial_volume, tuple(args.sequence)),
+    )
+    return 0 if all(result.status in SUCCESS_STATUSES for result in update.results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
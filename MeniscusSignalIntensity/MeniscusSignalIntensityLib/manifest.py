@@ -0,0 +1,187 @@
+"""
+Subject manifest of a batch data directory.
+
+The data directory holds one folder per knee scan, containing the _MM.stl and
+_LM.stl meniscus models and, somewhere below it, a folder of .dcm files. The
+tree is scanned once with os.scandir, subject folders in parallel, and the
+result is kept as a JSON manifest. Refreshing a manifest only rescans subject
+folders whose folder, STL or DICOM folder modification times changed.
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+
+MANIFEST_VERSION = 1
+
+
+class Subject(NamedTuple):
+    """Input files of one knee scan."""
+
+    subjectId: str
+    dicomDir: str
+    medialStl: str
+    lateralStl: str
+    anatomy: str  # "right" or "left"
+
+
+def anatomyFromName(folderName: str) -> Optional[str]:
+    """"right" or "left" from the underscore separated tokens of a folder name."""
+    tokens = {token.lower() for token in folderName.split("_")}
+    if "right" in tokens:
+        return "right"
+    if "left" in tokens:
+        return "left"
+    return None
+
+
+def _mtime(path: Optional[str]) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns if path else None
+    except FileNotFoundError:
+        return None
+
+
+def findDicomDir(folder: str) -> tuple[Optional[str], int, int]:
+    """First folder below `folder` (breadth first) that contains .dcm files, with the
+    number and total size of those files."""
+    pending = [folder]
+    while pending:
+        current = pending.pop(0)
+        subfolders = []
+        dicomCount = dicomBytes = 0
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.path)
+                elif entry.name.lower().endswith(".dcm"):
+                    dicomCount += 1
+                    dicomBytes += entry.stat().st_size
+        if dicomCount:
+            return current, dicomCount, dicomBytes
+        pending.extend(sorted(subfolders))
+    return None, 0, 0
+
+
+def scanSubjectFolder(folder: str) -> dict:
+    """Manifest entry of one subject folder."""
+    folderName = os.path.basename(folder)
+    entry = {
+        "subjectId": folderName,
+        "folder": folder,
+        "folderMtime": _mtime(folder),
+        "anatomy": anatomyFromName(folderName),
+        "medialStl": None,
+        "lateralStl": None,
+        "dicomDir": None,
+        "files": {},
+    }
+
+    subfolders = []
+    with os.scandir(folder) as entries:
+        for item in entries:
+            if item.is_dir(follow_symlinks=False):
+                subfolders.append(item.path)
+            elif item.name.endswith("_MM.stl") or item.name.endswith("_LM.stl"):
+                stat = item.stat()
+                entry["medialStl" if item.name.endswith("_MM.stl") else "lateralStl"] = item.path
+                entry["files"][item.name] = [stat.st_size, stat.st_mtime_ns]
+
+    for subfolder in sorted(subfolders):
+        dicomDir, dicomCount, dicomBytes = findDicomDir(subfolder)
+        if dicomDir:
+            entry["dicomDir"] = dicomDir
+            entry["dicomMtime"] = _mtime(dicomDir)
+            entry["dicomFiles"] = [dicomCount, dicomBytes]
+            break
+    return entry
+
+
+def isEntryCurrent(entry: dict) -> bool:
+    """Whether a manifest entry still describes its folder, checked with a few stat calls."""
+    if _mtime(entry["folder"]) != entry["folderMtime"]:
+        return False
+    if entry.get("dicomDir") and _mtime(entry["dicomDir"]) != entry.get("dicomMtime"):
+        return False
+    for path in (entry["medialStl"], entry["lateralStl"]):
+        if path and _mtime(path) != entry["files"][os.path.basename(path)][1]:
+            return False
+    return True
+
+
+def isEntryComplete(entry: dict) -> bool:
+    return bool(entry["medialStl"] and entry["lateralStl"] and entry["dicomDir"] and entry["anatomy"])
+
+
+def buildManifest(dataDir: str, namePattern: str = "BEAR", previous: Optional[dict] = None, workers: int = 16) -> dict:
+    """Scan dataDir for subject folders whose name contains namePattern.
+
+    Entries of `previous` that are still current are reused without rescanning.
+    """
+    previousEntries = (previous or {}).get("subjects", {})
+    if (previous or {}).get("version") != MANIFEST_VERSION:
+        previousEntries = {}
+
+    with os.scandir(dataDir) as entries:
+        folders = sorted(
+            entry.path for entry in entries if namePattern in entry.name and entry.is_dir(follow_symlinks=False)
+        )
+
+    subjects = {}
+    toScan = []
+    for folder in folders:
+        previousEntry = previousEntries.get(os.path.basename(folder))
+        if previousEntry and previousEntry["folder"] == folder and isEntryCurrent(previousEntry):
+            subjects[previousEntry["subjectId"]] = previousEntry
+        else:
+            toScan.append(folder)
+
+    # Directory listings on a network share are latency bound, so list folders concurrently
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for entry in executor.map(scanSubjectFolder, toScan):
+            subjects[entry["subjectId"]] = entry
+    logging.info(f"Manifest of {dataDir}: {len(subjects)} subjects, {len(toScan)} rescanned")
+
+    return {"version": MANIFEST_VERSION, "dataDir": dataDir, "namePattern": namePattern, "subjects": subjects}
+
+
+def loadManifest(manifestPath: str) -> Optional[dict]:
+    try:
+        with open(manifestPath) as manifestFile:
+            return json.load(manifestFile)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def saveManifest(manifest: dict, manifestPath: str) -> None:
+    temporaryPath = f"{manifestPath}.{os.getpid()}.tmp"
+    with open(temporaryPath, "w") as manifestFile:
+        json.dump(manifest, manifestFile, indent=1)
+    os.replace(temporaryPath, manifestPath)
+
+
+def updateManifest(dataDir: str, manifestPath: str, namePattern: str = "BEAR") -> dict:
+    """Load the manifest at manifestPath, refresh it against dataDir and save it back."""
+    previous = loadManifest(manifestPath)
+    if previous and (previous.get("dataDir") != dataDir or previous.get("namePattern") != namePattern):
+        previous = None
+    manifest = buildManifest(dataDir, namePattern, previous)
+    saveManifest(manifest, manifestPath)
+    return manifest
+
+
+def manifestSubjects(manifest: dict) -> list[Subject]:
+    """Subjects of a manifest that have both STLs, a DICOM folder and a known side.
+
+    Incomplete subject folders are skipped with a warning.
+    """
+    subjects = []
+    for subjectId, entry in sorted(manifest["subjects"].items()):
+        if not isEntryComplete(entry):
+            logging.warning(f"Skipping {entry['folder']}: missing MM/LM STL, DICOM folder or left/right in the name")
+            continue
+        subjects.append(Subject(subjectId, entry["dicomDir"], entry["medialStl"], entry["lateralStl"], entry["anatomy"]))
+    return subjects
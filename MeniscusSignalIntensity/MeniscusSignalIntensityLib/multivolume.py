@@ -0,0 +1,88 @@
+"""
+Regional statistics of several co-registered volumes (e.g. CISS, T2 map, PD-FS)
+from one set of region labels.
+
+SharedRegionLabels rasterizes the region surfaces once, on the grid of a
+reference volume. Volumes with the same grid (shape and IJK to RAS matrix) reuse
+that label array as is; for every other grid the labels are resampled once, by
+nearest neighbour, onto the sub-volume of that grid around the regions. After
+that, each volume costs one read of its sub-volume and one reduction.
+
+The resampled labels take the region of the reference voxel nearest to each
+voxel center, so on a coarser grid the regions are as good as the reference
+rasterization, not better. Volumes are assumed to be registered in RAS.
+"""
+
+import numpy as np
+
+from .regions import voxelizePolyData
+from .roi import ImageCrop, cropFromBounds, polyDataListBounds
+from .statistics import regionStatistics, voxelVolumeFromIjkToRas
+
+
+def geometryKey(shape: tuple[int, int, int], ijkToRas: np.ndarray) -> tuple:
+    """Hashable identity of an image grid; equal keys share their labels."""
+    return tuple(int(size) for size in shape) + tuple(np.round(np.asarray(ijkToRas, dtype=float), 6).ravel())
+
+
+def resampleLabels(
+    labelArray: np.ndarray,
+    labelIjkToRas: np.ndarray,
+    shape: tuple[int, int, int],
+    ijkToRas: np.ndarray,
+) -> np.ndarray:
+    """Nearest-neighbour resampling of a (k, j, i) label array onto another grid, 0 outside it."""
+    # IJK of the target grid to IJK of the label grid
+    targetToLabel = np.linalg.inv(np.asarray(labelIjkToRas, dtype=float)) @ np.asarray(ijkToRas, dtype=float)
+    kji = np.indices(shape, dtype=np.float64).reshape(3, -1)
+    # Array axes are (k, j, i)
+    ijk = kji[::-1]
+    labelIjk = np.rint(targetToLabel[:3, :3] @ ijk + targetToLabel[:3, 3:4]).astype(np.int64)
+    labelKji = labelIjk[::-1]
+    inside = np.all((labelKji >= 0) & (labelKji < np.array(labelArray.shape)[:, None]), axis=0)
+    resampled = np.zeros(int(np.prod(shape)), dtype=labelArray.dtype)
+    resampled[inside] = labelArray[tuple(labelKji[:, inside])]
+    return resampled.reshape(shape)
+
+
+class SharedRegionLabels:
+    """Region labels rasterized once and applied to any number of volumes, see the module docstring."""
+
+    def __init__(
+        self,
+        regionPolyData,
+        labels,
+        shape: tuple[int, int, int],
+        ijkToRas: np.ndarray,
+        cropPadding: int = 2,
+    ) -> None:
+        self.labels = list(labels)
+        self.cropPadding = cropPadding
+        self.boundsMin, self.boundsMax = polyDataListBounds(regionPolyData)
+        crop = self._crop(shape, ijkToRas)
+        labelArray = voxelizePolyData(regionPolyData, crop.shape, crop.ijkToRas, self.labels)
+        self._reference = (crop, labelArray)
+        # Per geometryKey: (crop of that grid, labels of the crop)
+        self._grids = {geometryKey(shape, ijkToRas): self._reference}
+
+    def _crop(self, shape: tuple[int, int, int], ijkToRas: np.ndarray) -> ImageCrop:
+        return cropFromBounds(self.boundsMin, self.boundsMax, shape, ijkToRas, self.cropPadding)
+
+    @property
+    def gridCount(self) -> int:
+        """Number of distinct grids labels were computed for."""
+        return len(self._grids)
+
+    def labelsFor(self, shape: tuple[int, int, int], ijkToRas: np.ndarray) -> tuple[ImageCrop, np.ndarray]:
+        """(crop, label array of the crop) for an image grid, resampled on first use."""
+        key = geometryKey(shape, ijkToRas)
+        if key not in self._grids:
+            referenceCrop, referenceLabels = self._reference
+            crop = self._crop(shape, ijkToRas)
+            self._grids[key] = (crop, resampleLabels(referenceLabels, referenceCrop.ijkToRas, crop.shape, crop.ijkToRas))
+        return self._grids[key]
+
+    def statistics(self, imageArray: np.ndarray, ijkToRas: np.ndarray) -> dict[int, dict]:
+        """Statistics of every label in one volume, keyed by label."""
+        crop, labelArray = self.labelsFor(imageArray.shape, ijkToRas)
+        return regionStatistics(crop.crop(imageArray), labelArray, self.labels, voxelVolumeFromIjkToRas(crop.ijkToRas))
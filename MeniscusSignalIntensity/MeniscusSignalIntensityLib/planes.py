@@ -0,0 +1,135 @@
+"""
+Cut plane geometry for a meniscus surface, computed without any MRML node.
+"""
+
+import itertools
+from typing import NamedTuple
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+
+class Plane(NamedTuple):
+    """A plane in RAS given by a point on it and its unit normal."""
+
+    origin: np.ndarray
+    normal: np.ndarray
+
+
+class MeniscusPlanes(NamedTuple):
+    """Centroid, bounding box and anterior/posterior cut planes of a meniscus."""
+
+    center: np.ndarray
+    boundsMin: np.ndarray
+    boundsMax: np.ndarray
+    ant: Plane
+    post: Plane
+
+
+def polyDataBounds(polyData: vtk.vtkPolyData) -> tuple[np.ndarray, np.ndarray]:
+    """Return the (min, max) RAS corners of the polydata bounding box."""
+    bounds = [0.0] * 6
+    polyData.GetBounds(bounds)
+    bb_min = np.array([bounds[0], bounds[2], bounds[4]])
+    bb_max = np.array([bounds[1], bounds[3], bounds[5]])
+    return bb_min, bb_max
+
+
+def planeFromPoints(origin, point1, point2) -> Plane:
+    """Plane through three points, with the normal oriented as vtkPlaneSource does."""
+    origin = np.asarray(origin, dtype=float)
+    normal = np.cross(np.asarray(point1, dtype=float) - origin, np.asarray(point2, dtype=float) - origin)
+    length = np.linalg.norm(normal)
+    if length == 0:
+        raise ValueError("Cut plane points are collinear")
+    return Plane(origin, normal / length)
+
+
+PLANE_FITTING_METHODS = ("bounds", "pca")
+
+
+def principalFrame(polyData: vtk.vtkPolyData) -> tuple[np.ndarray, np.ndarray]:
+    """Centroid of the surface points and a rotation whose rows are the principal axes of
+    the points, matched to the R, A and S axes.
+
+    Each principal axis is assigned to the RAS axis it is most aligned with and
+    oriented along it, so the frame follows the meniscus however the knee sits in
+    the scanner, while medial/lateral and anterior/posterior keep their meaning.
+    Rotations beyond 45 degrees from the RAS axes swap axis roles, and the in-plane
+    axes of an almost circular meniscus are only loosely defined.
+    """
+    points = vtk_to_numpy(polyData.GetPoints().GetData()).astype(float)
+    centroid = points.mean(axis=0)
+    centered = points - centroid
+    _, axes = np.linalg.eigh(centered.T @ centered)
+    axes = axes.T
+
+    # Most aligned assignment of the 3 principal axes to R, A, S
+    alignment = np.abs(axes)
+    order = max(itertools.permutations(range(3)), key=lambda perm: sum(alignment[perm[axis], axis] for axis in range(3)))
+    rotation = axes[list(order)]
+    rotation *= np.sign(np.diag(rotation))[:, None]
+    if np.linalg.det(rotation) < 0:
+        rotation[2] *= -1
+    return centroid, rotation
+
+
+def _planesInBox(bb_min: np.ndarray, bb_max: np.ndarray, isMed: bool) -> tuple[np.ndarray, Plane, Plane]:
+    """Box center and anterior/posterior cut planes of a box given in R, A, S ordered coordinates."""
+    bb_center = (bb_min + bb_max) / 2
+
+    """ determine planes for cases:
+        |     R     |    L     |
+        |   ((  ))    ((  ))   |
+        |  lat  med | med lat  |
+    """
+    # R A S
+    mid_IS = (bb_min[2] + bb_max[2]) / 2
+
+    if isMed:
+        medLatExtent = bb_min[0]
+        medCentroid = np.array([bb_max[0], bb_center[1], mid_IS])
+    else:
+        medLatExtent = bb_max[0]
+        medCentroid = np.array([bb_min[0], bb_center[1], mid_IS])
+
+    antPlane = planeFromPoints(
+        medCentroid,
+        [medLatExtent, bb_max[1], bb_max[2]],
+        [medLatExtent, bb_max[1], bb_min[2]],
+    )
+    postPlane = planeFromPoints(
+        medCentroid,
+        [medLatExtent, bb_min[1], bb_max[2]],
+        [medLatExtent, bb_min[1], bb_min[2]],
+    )
+    return bb_center, antPlane, postPlane
+
+
+def computeCutPlanes(polyData: vtk.vtkPolyData, isMed: bool = True, planeFitting: str = "bounds") -> MeniscusPlanes:
+    """Compute the anterior and posterior cut planes from the model bounding box.
+
+    Each plane passes through the medial (isMed) or lateral edge of the box at mid
+    height and through the opposite edge at the anterior or posterior extent.
+
+    With planeFitting "bounds" the box is the RAS axis aligned bounding box. With
+    "pca" it is the bounding box in the principal frame of the surface points (see
+    principalFrame), so the planes follow oblique scans; boundsMin and boundsMax
+    stay the axis aligned bounds.
+    """
+    if planeFitting not in PLANE_FITTING_METHODS:
+        raise ValueError(f"Unknown plane fitting {planeFitting!r}, expected one of {PLANE_FITTING_METHODS}")
+    bb_min, bb_max = polyDataBounds(polyData)
+    if planeFitting == "bounds":
+        bb_center, antPlane, postPlane = _planesInBox(bb_min, bb_max, isMed)
+        return MeniscusPlanes(bb_center, bb_min, bb_max, antPlane, postPlane)
+
+    centroid, rotation = principalFrame(polyData)
+    localPoints = (vtk_to_numpy(polyData.GetPoints().GetData()) - centroid) @ rotation.T
+    localCenter, localAnt, localPost = _planesInBox(localPoints.min(axis=0), localPoints.max(axis=0), isMed)
+
+    def toRas(plane: Plane) -> Plane:
+        return Plane(plane.origin @ rotation + centroid, plane.normal @ rotation)
+
+    return MeniscusPlanes(localCenter @ rotation + centroid, bb_min, bb_max, toRas(localAnt), toRas(localPost))
@@ -0,0 +1,147 @@
+"""
+Cleaning and decimation of meniscus surfaces before cutting and rasterization.
+
+Segmentation exports have duplicate points and triangles far smaller than the
+voxels they are rasterized onto. preprocessPolyData merges duplicate points,
+decimates the mesh (keeping it closed) until its mean edge length reaches
+edgeFactor times the smallest voxel spacing, and makes the normals consistent
+and outward.
+
+Tolerance: with the default edgeFactor of 1.0, the region volumes and mean
+intensities of the decimated mesh stay within PREPROCESS_TOLERANCE (relative) of
+those of the full mesh; on synthetic menisci the differences are at most about
+0.5 % in volume and 0.15 % in mean (see test_MeniscusSignalIntensityPreprocess).
+
+Decimating a dense mesh takes longer than cutting it once, so decimated meshes
+are cached per input file in a MeshCache.
+"""
+
+import hashlib
+import os
+from typing import Optional
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from .resultcache import fileHash
+
+
+# Relative differences of region statistics allowed by preprocessing with the default edgeFactor
+PREPROCESS_TOLERANCE = {"volume_mm3": 0.01, "mean": 0.005}
+
+# Bump whenever preprocessPolyData changes its output
+PREPROCESS_VERSION = "1"
+
+# Never remove more than this fraction of the triangles
+MAX_REDUCTION = 0.98
+
+
+def meanEdgeLength(polyData: vtk.vtkPolyData) -> float:
+    """Mean edge length of a triangle mesh, in mm."""
+    if polyData.GetNumberOfCells() == 0:
+        return 0.0
+    triangles = vtk_to_numpy(polyData.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+    points = vtk_to_numpy(polyData.GetPoints().GetData())
+    corners = points[triangles]
+    return float(np.linalg.norm(corners - np.roll(corners, 1, axis=1), axis=2).mean())
+
+
+def preprocessPolyData(polyData: vtk.vtkPolyData, spacing: float, edgeFactor: float = 1.0) -> vtk.vtkPolyData:
+    """Cleaned, decimated copy of a closed surface for a voxel grid of the given (smallest) spacing."""
+    clean = vtk.vtkStaticCleanPolyData()
+    clean.SetInputData(polyData)
+    clean.ToleranceIsAbsoluteOn()
+    clean.SetAbsoluteTolerance(1e-3 * spacing)
+    triangles = vtk.vtkTriangleFilter()
+    triangles.SetInputConnection(clean.GetOutputPort())
+    triangles.Update()
+    mesh = triangles.GetOutput()
+
+    # The triangle count scales with the inverse square of the edge length
+    edgeLength = meanEdgeLength(mesh)
+    targetEdgeLength = edgeFactor * spacing
+    reduction = 0.0
+    if edgeLength > 0:
+        reduction = min(MAX_REDUCTION, max(0.0, 1.0 - (edgeLength / targetEdgeLength) ** 2))
+    if reduction > 0:
+        decimate = vtk.vtkDecimatePro()
+        decimate.SetInputData(mesh)
+        decimate.SetTargetReduction(reduction)
+        # Keep the surface closed, so that it can still be cut and rasterized
+        decimate.PreserveTopologyOn()
+        decimate.SplittingOff()
+        decimate.BoundaryVertexDeletionOff()
+        decimate.Update()
+        mesh = decimate.GetOutput()
+
+    normals = vtk.vtkPolyDataNormals()
+    normals.SetInputData(mesh)
+    normals.SplittingOff()
+    normals.ConsistencyOn()
+    normals.AutoOrientNormalsOn()
+    normals.ComputePointNormalsOn()
+    normals.Update()
+
+    output = vtk.vtkPolyData()
+    output.DeepCopy(normals.GetOutput())
+    return output
+
+
+class MeshCache:
+    """Preprocessed surfaces stored in cacheDir as .vtp files, keyed by the contents of the
+    file the surface was read from and the preprocessing parameters."""
+
+    def __init__(self, cacheDir: str) -> None:
+        self.cacheDir = cacheDir
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def key(self, sourcePath: str, spacing: float, edgeFactor: float = 1.0) -> str:
+        digest = hashlib.sha256()
+        for part in (fileHash(sourcePath), f"{spacing:.6g}", f"{edgeFactor:.6g}", PREPROCESS_VERSION):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cacheDir, f"{key}.vtp")
+
+    def get(self, key: str) -> Optional[vtk.vtkPolyData]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        reader = vtk.vtkXMLPolyDataReader()
+        reader.SetFileName(path)
+        reader.Update()
+        return reader.GetOutput()
+
+    def put(self, key: str, polyData: vtk.vtkPolyData) -> None:
+        path = self._path(key)
+        temporaryPath = f"{path}.{os.getpid()}.tmp"
+        writer = vtk.vtkXMLPolyDataWriter()
+        writer.SetFileName(temporaryPath)
+        writer.SetInputData(polyData)
+        writer.SetDataModeToAppended()
+        writer.Write()
+        os.replace(temporaryPath, path)
+
+
+def cachedPreprocessPolyData(
+    polyData: vtk.vtkPolyData,
+    sourcePath: Optional[str],
+    spacing: float,
+    edgeFactor: float = 1.0,
+    cacheDir: Optional[str] = None,
+) -> vtk.vtkPolyData:
+    """preprocessPolyData, reusing the result cached in cacheDir for the file polyData was read
+    from (sourcePath). The surface is cached as given, so in the coordinates it was loaded in.
+    Without sourcePath or cacheDir nothing is cached."""
+    if not (sourcePath and cacheDir):
+        return preprocessPolyData(polyData, spacing, edgeFactor)
+    cache = MeshCache(cacheDir)
+    key = cache.key(sourcePath, spacing, edgeFactor)
+    preprocessed = cache.get(key)
+    if preprocessed is None:
+        preprocessed = preprocessPolyData(polyData, spacing, edgeFactor)
+        cache.put(key, preprocessed)
+    return preprocessed
@@ -0,0 +1,159 @@
+"""
+Per-stage timing and memory instrumentation.
+
+A StageProfiler records, for every `with profiler.stage(name):` block, the wall
+time, the CPU time of the process, the peak resident set size at the end of the
+block and, when given a node counter, the number of MRML nodes added during it.
+Records are exported as Chrome trace events (open the JSON file in
+chrome://tracing or https://ui.perfetto.dev) and summarized per stage.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def peakRssBytes() -> Optional[int]:
+    """Peak resident set size of this process so far, None if it cannot be measured."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is not None:
+        memoryInfo = psutil.Process().memory_info()
+        return getattr(memoryInfo, "peak_wset", memoryInfo.rss)
+    return None
+
+
+class StageProfiler:
+    """Records nested, possibly concurrent, stages as Chrome trace "complete" events.
+
+    nodeCounter returns a running count of created MRML nodes (or any other counter);
+    its increase over a stage is stored as the stage's "nodes".
+    """
+
+    def __init__(self, nodeCounter: Optional[Callable[[], int]] = None, processName: Optional[str] = None) -> None:
+        self.nodeCounter = nodeCounter
+        self.processName = processName
+        self.events = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str, category: str = "stage", **args):
+        """Time the enclosed block. Extra keyword arguments are stored with the event."""
+        startTimestamp = time.time()
+        startWall = time.perf_counter()
+        startCpu = time.process_time()
+        startNodes = self.nodeCounter() if self.nodeCounter else None
+        try:
+            yield args
+        finally:
+            eventArgs = dict(args)
+            eventArgs["cpu_s"] = time.process_time() - startCpu
+            eventArgs["peak_rss_mb"] = _megabytes(peakRssBytes())
+            if self.nodeCounter:
+                eventArgs["nodes"] = self.nodeCounter() - startNodes
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": startTimestamp * 1e6,
+                "dur": (time.perf_counter() - startWall) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": eventArgs,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def traceEvents(self) -> list[dict]:
+        events = list(self.events)
+        if self.processName:
+            events.append(processNameEvent(os.getpid(), self.processName))
+        return events
+
+    def writeTrace(self, path: str, extraEvents=()) -> None:
+        writeTraceEvents(path, self.traceEvents() + list(extraEvents))
+
+    def summary(self) -> dict[str, dict]:
+        return summarizeTraceEvents(self.events)
+
+
+def _megabytes(byteCount: Optional[int]) -> Optional[float]:
+    return None if byteCount is None else byteCount / 2**20
+
+
+def processNameEvent(pid: int, name: str) -> dict:
+    """Metadata event naming a process in the trace viewer."""
+    return {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}}
+
+
+def writeTraceEvents(path: str, events) -> None:
+    with open(path, "w") as traceFile:
+        json.dump({"traceEvents": list(events), "displayTimeUnit": "ms"}, traceFile)
+
+
+def loadTraceEvents(path: str) -> list[dict]:
+    """Events of a trace file written by writeTraceEvents, [] if it is missing or unreadable."""
+    try:
+        with open(path) as traceFile:
+            return json.load(traceFile)["traceEvents"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return []
+
+
+def relabelTraceEvents(events, pid: int, processName: str) -> list[dict]:
+    """Events of another process moved to a stable pid and named, for merging into one trace."""
+    relabelled = [dict(event, pid=pid) for event in events if event.get("ph") != "M"]
+    return relabelled + [processNameEvent(pid, processName)]
+
+
+def summarizeTraceEvents(events, key: Callable[[dict], str] = lambda event: event["name"]) -> dict[str, dict]:
+    """Count, total and maximum wall time, total CPU time, maximum peak RSS and total created
+    nodes of the complete events, grouped by key (the stage name by default)."""
+    summary = {}
+    for event in events:
+        if event.get("ph") != "X":
+            continue
+        args = event.get("args", {})
+        entry = summary.setdefault(
+            key(event), {"count": 0, "wall_s": 0.0, "max_wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": None, "nodes": None}
+        )
+        wall = event["dur"] / 1e6
+        entry["count"] += 1
+        entry["wall_s"] += wall
+        entry["max_wall_s"] = max(entry["max_wall_s"], wall)
+        entry["cpu_s"] += args.get("cpu_s") or 0.0
+        if args.get("peak_rss_mb") is not None:
+            entry["peak_rss_mb"] = max(entry["peak_rss_mb"] or 0.0, args["peak_rss_mb"])
+        if args.get("nodes") is not None:
+            entry["nodes"] = (entry["nodes"] or 0) + args["nodes"]
+    return summary
+
+
+def formatSummary(summary: dict[str, dict], title: str = "stage") -> str:
+    """Text table of a summary, slowest first."""
+    lines = [f"{title:<28}{'count':>7}{'wall [s]':>11}{'max [s]':>10}{'cpu [s]':>10}{'peak RSS [MB]':>15}{'nodes':>7}"]
+    for name, entry in sorted(summary.items(), key=lambda item: -item[1]["wall_s"]):
+        peakRss = "" if entry["peak_rss_mb"] is None else f"{entry['peak_rss_mb']:.0f}"
+        nodes = "" if entry["nodes"] is None else str(entry["nodes"])
+        lines.append(
+            f"{name:<28}{entry['count']:>7}{entry['wall_s']:>11.2f}{entry['max_wall_s']:>10.2f}"
+            f"{entry['cpu_s']:>10.2f}{peakRss:>15}{nodes:>7}"
+        )
+    return "\n".join(lines)
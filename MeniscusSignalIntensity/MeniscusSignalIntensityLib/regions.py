@@ -0,0 +1,248 @@
+"""
+Splitting a meniscus surface into anterior/mid/posterior regions and
+rasterizing the regions onto an image grid, without any MRML node.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from .planes import Plane
+
+
+REGION_NAMES = ("ant", "mid", "post")
+
+# Label of each region in label arrays and region scalars
+REGION_LABELS = {name: label for label, name in enumerate(REGION_NAMES, start=1)}
+
+# Menisci sharing one label array, in label order
+MENISCUS_NAMES = ("med", "lat")
+
+
+def meniscusRegionLabel(meniscus: int, region: str) -> int:
+    """Label of a region in a label array shared by several menisci: REGION_LABELS for the
+    first (medial) meniscus, shifted by len(REGION_NAMES) for each following one."""
+    return meniscus * len(REGION_NAMES) + REGION_LABELS[region]
+
+
+def signedDistances(points: np.ndarray, plane: Plane) -> np.ndarray:
+    """Signed distance of each (N, 3) point to the plane, positive on the normal side."""
+    return (np.asarray(points, dtype=float) - plane.origin) @ plane.normal
+
+
+def classifyRegions(points: np.ndarray, antPlane: Plane, postPlane: Plane, isMed: bool = True) -> np.ndarray:
+    """Region label (1 ant, 2 mid, 3 post) of each (N, 3) RAS point from its signed
+    distances to both planes, in one pass.
+
+    Gives the same partition as cutPolyDataByPlanes: the medial meniscus keeps the
+    negative side of the ant plane as the anterior horn and the positive side of the
+    post plane as the posterior horn, the lateral meniscus the opposite sides.
+    """
+    antPositive = signedDistances(points, antPlane) >= 0
+    postPositive = signedDistances(points, postPlane) >= 0
+    return regionLabelsFromSides(antPositive, postPositive, isMed)
+
+
+def regionLabelsFromSides(antPositive: np.ndarray, postPositive: np.ndarray, isMed: bool = True) -> np.ndarray:
+    """Region labels of points from the side (signed distance >= 0) of each plane they lie on."""
+    if not isMed:
+        antPositive = ~antPositive
+        postPositive = ~postPositive
+
+    labels = np.full(antPositive.shape, REGION_LABELS["mid"], dtype=np.uint8)
+    labels[postPositive] = REGION_LABELS["post"]
+    labels[~antPositive] = REGION_LABELS["ant"]
+    return labels
+
+
+def _vtkPlane(plane: Plane) -> vtk.vtkPlane:
+    vtkPlane = vtk.vtkPlane()
+    vtkPlane.SetOrigin(*plane.origin)
+    vtkPlane.SetNormal(*plane.normal)
+    return vtkPlane
+
+
+def _planeCap(polyData: vtk.vtkPolyData, plane: Plane) -> vtk.vtkPolyData:
+    """Triangulated cross-section of a closed surface by a plane, facing the plane normal."""
+    cutter = vtk.vtkCutter()
+    cutter.SetInputData(polyData)
+    cutter.SetCutFunction(_vtkPlane(plane))
+    triangulator = vtk.vtkContourTriangulator()
+    triangulator.SetInputConnection(cutter.GetOutputPort())
+    triangulator.Update()
+    cap = triangulator.GetOutput()
+    if cap.GetNumberOfCells() == 0:
+        return cap
+
+    # The cut lines have no consistent direction, so orient every triangle to the normal
+    points = vtk_to_numpy(cap.GetPoints().GetData())
+    triangles = vtk_to_numpy(cap.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+    edges1 = points[triangles[:, 1]] - points[triangles[:, 0]]
+    edges2 = points[triangles[:, 2]] - points[triangles[:, 0]]
+    flipped = np.cross(edges1, edges2) @ plane.normal < 0
+    triangles[flipped] = triangles[flipped][:, ::-1]
+    cap.GetPolys().Modified()
+    return cap
+
+
+def _closeHalf(half: vtk.vtkDataSet, cap: vtk.vtkPolyData, flipCap: bool) -> vtk.vtkPolyData:
+    """Surface of a clipped half of a closed surface with the cap appended."""
+    surface = vtk.vtkGeometryFilter()
+    surface.SetInputData(half)
+    append = vtk.vtkAppendPolyData()
+    append.AddInputConnection(surface.GetOutputPort())
+    if flipCap:
+        reverse = vtk.vtkReverseSense()
+        reverse.SetInputData(cap)
+        append.AddInputConnection(reverse.GetOutputPort())
+    else:
+        append.AddInputData(cap)
+    append.Update()
+    return append.GetOutput()
+
+
+def clipPolyDataByPlane(polyData: vtk.vtkPolyData, plane: Plane) -> tuple[vtk.vtkPolyData, vtk.vtkPolyData]:
+    """Clip a closed surface by a plane, returning capped (negative, positive) halves.
+
+    Matches the Dynamic Modeler "Plane cut" tool: the positive half is the side the
+    plane normal points to. The surface is clipped once, keeping both sides, and both
+    halves are closed with the same cross-section.
+    """
+    clipper = vtk.vtkTableBasedClipDataSet()
+    clipper.SetInputData(polyData)
+    clipper.SetClipFunction(_vtkPlane(plane))
+    clipper.GenerateClippedOutputOn()
+    clipper.Update()
+    cap = _planeCap(polyData, plane)
+    # The output is the positive side, the clipped output the negative one
+    negative = _closeHalf(clipper.GetClippedOutput(), cap, flipCap=False)
+    positive = _closeHalf(clipper.GetOutput(), cap, flipCap=True)
+    return negative, positive
+
+
+def cutPolyDataByPlanes(
+    polyData: vtk.vtkPolyData,
+    antPlane: Plane,
+    postPlane: Plane,
+    isMed: bool = True,
+) -> tuple[vtk.vtkPolyData, vtk.vtkPolyData, vtk.vtkPolyData]:
+    """Cut the meniscus surface into (ant, mid, post) closed surfaces.
+
+    The anterior horn is cut first, then the rest of the meniscus is split by the
+    posterior plane, so each plane clips the mesh once. Which side of each plane is
+    kept depends on isMed, because the plane normals of the medial and lateral menisci
+    point in opposite directions.
+    """
+    antNeg, antPos = clipPolyDataByPlane(polyData, antPlane)
+    if isMed:
+        antPoly, rest = antNeg, antPos
+    else:
+        antPoly, rest = antPos, antNeg
+
+    postNeg, postPos = clipPolyDataByPlane(rest, postPlane)
+    if isMed:
+        midPoly, postPoly = postNeg, postPos
+    else:
+        midPoly, postPoly = postPos, postNeg
+
+    return antPoly, midPoly, postPoly
+
+
+def cutPolyDataBatch(
+    jobs: list[tuple[vtk.vtkPolyData, Plane, Plane, bool]],
+    workers: Optional[int] = None,
+) -> list[tuple[vtk.vtkPolyData, vtk.vtkPolyData, vtk.vtkPolyData]]:
+    """cutPolyDataByPlanes of several (polyData, antPlane, postPlane, isMed) jobs, typically
+    the medial and lateral menisci of one knee. Returns the (ant, mid, post) surfaces of each
+    job, in job order.
+
+    The jobs share no filters or data, so they run concurrently in a thread pool of
+    workers threads (by default one per job, up to the number of CPUs). The clippers
+    only overlap where VTK releases the GIL during filter execution, as in Slicer's
+    VTK build; with a single worker the jobs run one after the other.
+    """
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    if workers <= 1 or len(jobs) <= 1:
+        return [cutPolyDataByPlanes(*job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda job: cutPolyDataByPlanes(*job), jobs))
+
+
+def voxelCenters(kji, ijkToRas: np.ndarray) -> np.ndarray:
+    """(N, 3) RAS centers of the voxels at the (k, j, i) indices kji, as returned by np.nonzero."""
+    ijk = np.column_stack((kji[2], kji[1], kji[0], np.ones(kji[0].size)))
+    return (ijk @ np.asarray(ijkToRas, dtype=float).T)[:, :3]
+
+
+def voxelizePolyData(
+    polyDataList,
+    shape: tuple[int, int, int],
+    ijkToRas: np.ndarray,
+    labels=None,
+) -> np.ndarray:
+    """Rasterize closed surfaces given in RAS onto an image grid.
+
+    shape is the (k, j, i) shape of the image array, as returned by
+    slicer.util.arrayFromVolume. Returns a uint8 label array of that shape where
+    voxels inside polyDataList[n] are set to labels[n] (default n + 1). Later
+    surfaces overwrite earlier ones where they overlap.
+    """
+    if labels is None:
+        labels = range(1, len(polyDataList) + 1)
+
+    rasToIjk = vtk.vtkMatrix4x4()
+    rasToIjk.DeepCopy(np.linalg.inv(np.asarray(ijkToRas, dtype=float)).ravel())
+    transform = vtk.vtkTransform()
+    transform.SetMatrix(rasToIjk)
+
+    labelArray = np.zeros(shape, dtype=np.uint8)
+    for polyData, label in zip(polyDataList, labels):
+        if polyData.GetNumberOfPoints() == 0:
+            continue
+
+        # Work in IJK so that oblique volume directions are handled exactly
+        transformFilter = vtk.vtkTransformPolyDataFilter()
+        transformFilter.SetInputData(polyData)
+        transformFilter.SetTransform(transform)
+
+        stencil = vtk.vtkPolyDataToImageStencil()
+        stencil.SetInputConnection(transformFilter.GetOutputPort())
+        stencil.SetOutputOrigin(0, 0, 0)
+        stencil.SetOutputSpacing(1, 1, 1)
+        stencil.SetOutputWholeExtent(0, shape[2] - 1, 0, shape[1] - 1, 0, shape[0] - 1)
+
+        toImage = vtk.vtkImageStencilToImage()
+        toImage.SetInputConnection(stencil.GetOutputPort())
+        toImage.SetInsideValue(1)
+        toImage.SetOutsideValue(0)
+        toImage.SetOutputScalarTypeToUnsignedChar()
+        toImage.Update()
+
+        mask = vtk_to_numpy(toImage.GetOutput().GetPointData().GetScalars()).reshape(shape)
+        labelArray[mask > 0] = label
+
+    return labelArray
+
+
+def labelRegionVoxels(
+    polyData: vtk.vtkPolyData,
+    shape: tuple[int, int, int],
+    ijkToRas: np.ndarray,
+    antPlane: Plane,
+    postPlane: Plane,
+    isMed: bool = True,
+) -> np.ndarray:
+    """Region label array of the meniscus, without cutting the surface.
+
+    The whole meniscus is rasterized once and every voxel inside it is assigned to
+    a region from the signed distances of its center to both planes.
+    """
+    labelArray = voxelizePolyData([polyData], shape, ijkToRas)
+    kji = np.nonzero(labelArray)
+    if kji[0].size:
+        labelArray[kji] = classifyRegions(voxelCenters(kji, ijkToRas), antPlane, postPlane, isMed)
+    return labelArray
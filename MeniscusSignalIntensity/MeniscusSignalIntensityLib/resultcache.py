@@ -0,0 +1,108 @@
+"""
+Content-addressed cache of per-subject results tables.
+
+The key of a subject hashes the contents of its medial and lateral STL files,
+the fingerprints of its DICOM folder and of the folders of its other sequences
+(see volumecache.folderFingerprint), its laterality and ALGORITHM_VERSION, so a cached table is only reused when none of
+the inputs changed. Entries are plain CSV files named after their key; their
+modification time is refreshed on every hit, and evict() removes the least
+recently used entries by age and total size.
+"""
+
+import hashlib
+import os
+import shutil
+import time
+from typing import Optional
+
+from .volumecache import folderFingerprint
+
+
+# Bump whenever a change to the planes, cuts or statistics changes the results
+ALGORITHM_VERSION = "1"
+
+
+def fileHash(path: str, chunkSize: int = 1 << 20) -> str:
+    """SHA-256 of the contents of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for chunk in iter(lambda: stream.read(chunkSize), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Results tables stored in cacheDir, optionally bounded by total size and entry age."""
+
+    def __init__(self, cacheDir: str, maxBytes: Optional[int] = None, maxAgeDays: Optional[float] = None) -> None:
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.maxAgeDays = maxAgeDays
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def key(
+        self,
+        medialStl: str,
+        lateralStl: str,
+        dicomDir: str,
+        anatomy: str,
+        algorithmVersion: str = ALGORITHM_VERSION,
+        sequenceDirs=(),
+    ) -> str:
+        digest = hashlib.sha256()
+        parts = [fileHash(medialStl), fileHash(lateralStl), folderFingerprint(dicomDir), anatomy, algorithmVersion]
+        parts += [folderFingerprint(sequenceDir) for sequenceDir in sequenceDirs]
+        for part in parts:
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cacheDir, f"{key}.csv")
+
+    def get(self, key: str, destination: str) -> bool:
+        """Copy the cached table of key to destination. Returns False on a cache miss."""
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, destination)
+        except FileNotFoundError:
+            return False
+        os.utime(path)
+        return True
+
+    def put(self, key: str, resultsFile: str) -> None:
+        """Store a copy of resultsFile under key."""
+        path = self._path(key)
+        temporaryPath = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(resultsFile, temporaryPath)
+        os.replace(temporaryPath, path)
+
+    def evict(self) -> int:
+        """Remove entries older than maxAgeDays, then the least recently used ones until the
+        cache fits in maxBytes. Returns the number of removed entries."""
+        entries = []
+        with os.scandir(self.cacheDir) as scanned:
+            for entry in scanned:
+                if entry.is_file() and entry.name.endswith(".csv"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        removed = []
+        if self.maxAgeDays is not None:
+            oldest = time.time() - self.maxAgeDays * 86400
+            removed = [entry for entry in entries if entry[0] < oldest]
+        kept = entries[len(removed):]
+        if self.maxBytes is not None:
+            totalBytes = sum(size for _, size, _ in kept)
+            while kept and totalBytes > self.maxBytes:
+                entry = kept.pop(0)
+                totalBytes -= entry[1]
+                removed.append(entry)
+
+        for _, _, path in removed:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return len(removed)
@@ -0,0 +1,135 @@
+"""
+Append-only writer for cohort results: one row per subject, meniscus and region,
+all in a single file.
+
+Rows are buffered and written in batches. Every flush leaves a readable file on
+disk, so a crash loses at most the rows appended since the last flush:
+
+- .arrow: Arrow IPC stream, one record batch per flush (needs pyarrow)
+- .parquet: Parquet, one row group per flush (needs pyarrow). The Parquet footer
+  is only written on close, so prefer .arrow or .csv for crash safety.
+- .csv: fallback when pyarrow is not installed, flushed and fsync'ed per batch
+"""
+
+import csv
+import logging
+import os
+from typing import Optional
+
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Leading text columns of cohort results, followed by the numeric statistics columns
+KEY_COLUMNS = ("Subject", "Meniscus", "Region")
+
+
+def resultsFormat(path: str) -> str:
+    """Format of a results file from its extension; unknown extensions are written as CSV."""
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    return {"arrow": "arrow", "feather": "arrow", "ipc": "arrow", "parquet": "parquet"}.get(extension, "csv")
+
+
+class ResultsWriter:
+    """Streams rows with the given columns into one results file.
+
+    Columns listed in KEY_COLUMNS are stored as text, all others as float64.
+    Use as a context manager, or call close() when done.
+    """
+
+    def __init__(self, path: str, columns, batchSize: int = 256, append: bool = False) -> None:
+        self.columns = list(columns)
+        self.batchSize = batchSize
+        self.format = resultsFormat(path)
+        if self.format != "csv" and pyarrow is None:
+            path = os.path.splitext(path)[0] + ".csv"
+            logging.warning(f"pyarrow is not installed, writing results as CSV to {path}")
+            self.format = "csv"
+        if append and self.format != "csv":
+            raise ValueError("Appending to an existing file is only supported for CSV results")
+        self.path = path
+        self.rowCount = 0
+        self._rows = []
+
+        if self.format == "csv":
+            writeHeader = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+            self._stream = open(path, "a" if append else "w", newline="")
+            self._csvWriter = csv.writer(self._stream)
+            if writeHeader:
+                self._csvWriter.writerow(self.columns)
+                self._sync()
+        else:
+            self._schema = pyarrow.schema(
+                [(name, pyarrow.string() if name in KEY_COLUMNS else pyarrow.float64()) for name in self.columns]
+            )
+            if self.format == "arrow":
+                self._arrowWriter = pyarrow.ipc.new_stream(path, self._schema)
+            else:
+                self._arrowWriter = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def append(self, row) -> None:
+        """Add a row, given as a dict keyed by column name or as a sequence in column order."""
+        if isinstance(row, dict):
+            row = [row.get(name) for name in self.columns]
+        elif len(row) != len(self.columns):
+            raise ValueError(f"Expected {len(self.columns)} values, got {len(row)}")
+        self._rows.append(row)
+        if len(self._rows) >= self.batchSize:
+            self.flush()
+
+    def extend(self, rows) -> None:
+        for row in rows:
+            self.append(row)
+
+    def flush(self) -> None:
+        """Write the buffered rows and make them durable on disk."""
+        if not self._rows:
+            return
+        if self.format == "csv":
+            self._csvWriter.writerows(self._rows)
+            self._sync()
+        else:
+            columnValues = list(zip(*self._rows))
+            arrays = [
+                pyarrow.array(values, type=field.type, from_pandas=True)
+                for field, values in zip(self._schema, columnValues)
+            ]
+            batch = pyarrow.record_batch(arrays, schema=self._schema)
+            if self.format == "arrow":
+                self._arrowWriter.write_batch(batch)
+            else:
+                self._arrowWriter.write_table(pyarrow.Table.from_batches([batch]))
+        self.rowCount += len(self._rows)
+        self._rows = []
+
+    def close(self) -> None:
+        if self._rows is None:
+            return
+        self.flush()
+        if self.format == "csv":
+            self._stream.close()
+        else:
+            self._arrowWriter.close()
+        self._rows = None
+
+    def _sync(self) -> None:
+        self._stream.flush()
+        os.fsync(self._stream.fileno())
+
+
+def parseValue(text: str) -> Optional[float]:
+    """Numeric value of a CSV cell, None for empty cells."""
+    if text == "":
+        return None
+    return float(text)
@@ -0,0 +1,70 @@
+"""
+Cropping the image grid to the meniscus bounds so that rasterization and
+statistics only touch the voxels around the meniscus.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+import vtk
+
+from .planes import polyDataBounds
+
+
+class ImageCrop(NamedTuple):
+    """Sub-volume of an image: KJI slices into the full array and the IJK to RAS
+    matrix of the sub-volume."""
+
+    slices: tuple[slice, slice, slice]
+    ijkToRas: np.ndarray
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return tuple(s.stop - s.start for s in self.slices)
+
+    def crop(self, array: np.ndarray) -> np.ndarray:
+        """View of the sub-volume of a full-size (k, j, i) array."""
+        return array[self.slices]
+
+
+def polyDataListBounds(polyDataList) -> tuple[np.ndarray, np.ndarray]:
+    """RAS (min, max) corners of the bounding box enclosing all non-empty polydata."""
+    corners = [polyDataBounds(polyData) for polyData in polyDataList if polyData.GetNumberOfPoints()]
+    if not corners:
+        raise ValueError("No points to compute bounds from")
+    return np.min([c[0] for c in corners], axis=0), np.max([c[1] for c in corners], axis=0)
+
+
+def cropFromBounds(
+    boundsMin: np.ndarray,
+    boundsMax: np.ndarray,
+    shape: tuple[int, int, int],
+    ijkToRas: np.ndarray,
+    padding: int = 2,
+) -> ImageCrop:
+    """Sub-volume of an image of the given (k, j, i) shape that contains the RAS box,
+    padded by `padding` voxels on each side and clamped to the image."""
+    ijkToRas = np.asarray(ijkToRas, dtype=float)
+    corners = np.array(
+        [[x, y, z, 1.0] for x in (boundsMin[0], boundsMax[0]) for y in (boundsMin[1], boundsMax[1]) for z in (boundsMin[2], boundsMax[2])]
+    )
+    cornersIjk = (corners @ np.linalg.inv(ijkToRas).T)[:, :3]
+
+    ijkMin = np.floor(cornersIjk.min(axis=0)).astype(int) - padding
+    ijkMax = np.ceil(cornersIjk.max(axis=0)).astype(int) + padding
+    sizeIjk = np.array(shape[::-1])
+    ijkMin = np.clip(ijkMin, 0, sizeIjk)
+    ijkMax = np.clip(ijkMax + 1, ijkMin, sizeIjk)
+
+    slices = tuple(slice(int(ijkMin[axis]), int(ijkMax[axis])) for axis in (2, 1, 0))
+    croppedIjkToRas = ijkToRas.copy()
+    croppedIjkToRas[:3, 3] = (ijkToRas @ np.append(ijkMin, 1.0))[:3]
+    return ImageCrop(slices, croppedIjkToRas)
+
+
+def cropFromPolyData(polyDataList, shape: tuple[int, int, int], ijkToRas: np.ndarray, padding: int = 2) -> ImageCrop:
+    """Sub-volume of the image around the bounds of the given surfaces."""
+    if isinstance(polyDataList, vtk.vtkPolyData):
+        polyDataList = [polyDataList]
+    boundsMin, boundsMax = polyDataListBounds(polyDataList)
+    return cropFromBounds(boundsMin, boundsMax, shape, ijkToRas, padding)
@@ -0,0 +1,75 @@
+"""
+Angular sectors around the meniscus centroid, optionally crossed with radial bands.
+
+Sectors split the axial (R-A) plane around the centroid into sectorCount equal
+angles, counted counterclockwise as seen from superior, starting at +R. Each
+sector can further be split into radialBands bands between the innermost and
+outermost meniscus voxel of that sector, band 0 being the inner (free) edge.
+Voxels are assigned with a few array operations, so the cost does not depend on
+the number of sectors.
+"""
+
+import numpy as np
+import vtk
+
+from .regions import voxelCenters, voxelizePolyData
+
+
+def sectorAngles(points: np.ndarray, center) -> np.ndarray:
+    """Angle in degrees, in [0, 360), of each (N, 3) RAS point around center in the axial plane."""
+    offsets = np.asarray(points, dtype=float) - np.asarray(center, dtype=float)
+    return np.degrees(np.arctan2(offsets[:, 1], offsets[:, 0])) % 360.0
+
+
+def sectorLabel(sector, band, radialBands: int = 1):
+    """Label of a (sector, band) pair; labels start at 1 so that 0 stays background."""
+    return sector * radialBands + band + 1
+
+
+def sectorFromLabel(label: int, radialBands: int = 1) -> tuple[int, int]:
+    """(sector, band) of a label, the inverse of sectorLabel."""
+    return divmod(label - 1, radialBands)
+
+
+def sectorAngleRange(sector: int, sectorCount: int) -> tuple[float, float]:
+    width = 360.0 / sectorCount
+    return sector * width, (sector + 1) * width
+
+
+def classifySectors(points: np.ndarray, center, sectorCount: int, radialBands: int = 1) -> np.ndarray:
+    """Sector label (see sectorLabel) of each (N, 3) RAS point."""
+    angles = sectorAngles(points, center)
+    sectors = np.minimum((angles * (sectorCount / 360.0)).astype(np.int64), sectorCount - 1)
+    if radialBands == 1:
+        return sectorLabel(sectors, 0)
+
+    offsets = np.asarray(points, dtype=float)[:, :2] - np.asarray(center, dtype=float)[:2]
+    radii = np.hypot(offsets[:, 0], offsets[:, 1])
+    # Radial extent of the meniscus in each sector
+    innerRadii = np.full(sectorCount, np.inf)
+    outerRadii = np.full(sectorCount, -np.inf)
+    np.minimum.at(innerRadii, sectors, radii)
+    np.maximum.at(outerRadii, sectors, radii)
+    widths = outerRadii[sectors] - innerRadii[sectors]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fractions = np.where(widths > 0, (radii - innerRadii[sectors]) / widths, 0.0)
+    bands = np.minimum((fractions * radialBands).astype(np.int64), radialBands - 1)
+    return sectorLabel(sectors, bands, radialBands)
+
+
+def labelSectorVoxels(
+    polyData: vtk.vtkPolyData,
+    shape: tuple[int, int, int],
+    ijkToRas: np.ndarray,
+    center,
+    sectorCount: int,
+    radialBands: int = 1,
+) -> np.ndarray:
+    """Sector label array of the meniscus: the surface is rasterized once and every voxel
+    inside it gets the label of the sector and band of its center."""
+    inside = voxelizePolyData([polyData], shape, ijkToRas)
+    labelArray = np.zeros(shape, dtype=np.uint16)
+    kji = np.nonzero(inside)
+    if kji[0].size:
+        labelArray[kji] = classifySectors(voxelCenters(kji, ijkToRas), center, sectorCount, radialBands)
+    return labelArray
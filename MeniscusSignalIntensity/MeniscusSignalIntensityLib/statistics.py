@@ -0,0 +1,108 @@
+"""
+Regional intensity statistics computed directly from an image array and a label array.
+"""
+
+import numpy as np
+
+
+# Measurement keys of the ScalarVolume plugin of the SegmentStatistics module, plus percentiles
+STATISTICS_KEYS = (
+    "voxel_count",
+    "volume_mm3",
+    "volume_cm3",
+    "min",
+    "max",
+    "mean",
+    "median",
+    "stdev",
+    "percentile05",
+    "percentile95",
+)
+
+# Table column names, as in the SegmentStatistics tables
+STATISTICS_COLUMN_NAMES = {
+    "voxel_count": "Number of voxels [voxels]",
+    "volume_mm3": "Volume [mm3]",
+    "volume_cm3": "Volume [cm3]",
+    "min": "Minimum",
+    "max": "Maximum",
+    "mean": "Mean",
+    "median": "Median",
+    "stdev": "Standard deviation",
+    "percentile05": "Percentile 5",
+    "percentile95": "Percentile 95",
+}
+
+PERCENTILES = {"median": 50.0, "percentile05": 5.0, "percentile95": 95.0}
+
+
+def voxelVolumeFromIjkToRas(ijkToRas: np.ndarray) -> float:
+    """Volume of a single voxel in mm3."""
+    return float(abs(np.linalg.det(np.asarray(ijkToRas, dtype=float)[:3, :3])))
+
+
+def _sortedPercentile(sortedValues: np.ndarray, starts: np.ndarray, counts: np.ndarray, percentile: float) -> np.ndarray:
+    """Percentile of each run sortedValues[starts[n]:starts[n] + counts[n]], with linear
+    interpolation as numpy.percentile does. counts must be non-zero."""
+    position = (counts - 1) * (percentile / 100.0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    fraction = position - lower
+    return sortedValues[starts + lower] * (1.0 - fraction) + sortedValues[starts + upper] * fraction
+
+
+def regionStatistics(imageArray: np.ndarray, labelArray: np.ndarray, labels, voxelVolume: float = 1.0) -> dict:
+    """Compute intensity statistics of imageArray for each label in labelArray.
+
+    All labels are reduced together: one sort of the labelled voxels by (label,
+    intensity) gives min, max and the percentiles, and np.bincount gives counts,
+    means and standard deviations. Returns {label: {key: value}} with the keys of
+    STATISTICS_KEYS. Labels that cover no voxel get a voxel count of 0 and NaN
+    intensity statistics.
+    """
+    labels = [int(label) for label in labels]
+    labelFlat = np.asarray(labelArray).ravel()
+    inRegion = np.flatnonzero(np.isin(labelFlat, labels))
+    regionLabels = labelFlat[inRegion].astype(np.int64)
+    values = np.asarray(imageArray).ravel()[inRegion].astype(np.float64)
+
+    binCount = max(labels) + 1 if labels else 1
+    counts = np.bincount(regionLabels, minlength=binCount)
+    sums = np.bincount(regionLabels, weights=values, minlength=binCount)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        squaredDeviations = np.bincount(regionLabels, weights=(values - means[regionLabels]) ** 2, minlength=binCount)
+        stdevs = np.sqrt(squaredDeviations / counts)
+
+    # Voxels grouped by label, ascending intensity within each label
+    order = np.lexsort((values, regionLabels))
+    sortedValues = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    labelIds = np.array(labels, dtype=np.int64)
+    nonEmpty = counts[labelIds] > 0
+    measures = {key: np.full(len(labels), np.nan) for key in ("min", "max", *PERCENTILES)}
+    if nonEmpty.any():
+        labelStarts = starts[labelIds[nonEmpty]]
+        labelCounts = counts[labelIds[nonEmpty]]
+        measures["min"][nonEmpty] = sortedValues[labelStarts]
+        measures["max"][nonEmpty] = sortedValues[labelStarts + labelCounts - 1]
+        for key, percentile in PERCENTILES.items():
+            measures[key][nonEmpty] = _sortedPercentile(sortedValues, labelStarts, labelCounts, percentile)
+
+    results = {}
+    for index, label in enumerate(labels):
+        count = int(counts[label])
+        results[label] = {
+            "voxel_count": count,
+            "volume_mm3": count * voxelVolume,
+            "volume_cm3": count * voxelVolume / 1000.0,
+            "min": float(measures["min"][index]),
+            "max": float(measures["max"][index]),
+            "mean": float(means[label]) if count else np.nan,
+            "median": float(measures["median"][index]),
+            "stdev": float(stdevs[label]) if count else np.nan,
+            "percentile05": float(measures["percentile05"][index]),
+            "percentile95": float(measures["percentile95"][index]),
+        }
+    return results
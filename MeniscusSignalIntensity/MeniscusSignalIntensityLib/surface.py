@@ -0,0 +1,108 @@
+"""
+Image intensity sampled onto the vertices of a surface.
+
+All vertices are sampled at once with a vectorized trilinear interpolation of
+the (k, j, i) image array. Optionally the samples are averaged along the inward
+vertex normals over a small depth, to follow the tissue just below the surface
+rather than the partial-volume boundary itself.
+"""
+
+import warnings
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+
+def trilinearSample(imageArray: np.ndarray, ijkToRas: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Trilinearly interpolated intensity at each (N, 3) RAS point, NaN outside the image."""
+    points = np.asarray(points, dtype=float)
+    rasToIjk = np.linalg.inv(np.asarray(ijkToRas, dtype=float))
+    ijk = points @ rasToIjk[:3, :3].T + rasToIjk[:3, 3]
+    # Array axes are (k, j, i)
+    kji = ijk[:, ::-1]
+    shape = np.array(imageArray.shape)
+
+    inside = np.all((kji >= 0) & (kji <= shape - 1), axis=1)
+    lower = np.clip(np.floor(kji).astype(np.int64), 0, np.maximum(shape - 2, 0))
+    fractions = np.clip(kji - lower, 0.0, 1.0)
+    upper = np.minimum(lower + 1, shape - 1)
+
+    values = np.zeros(len(points))
+    for corner in range(8):
+        k = upper[:, 0] if corner & 4 else lower[:, 0]
+        j = upper[:, 1] if corner & 2 else lower[:, 1]
+        i = upper[:, 2] if corner & 1 else lower[:, 2]
+        weights = (
+            (fractions[:, 0] if corner & 4 else 1.0 - fractions[:, 0])
+            * (fractions[:, 1] if corner & 2 else 1.0 - fractions[:, 1])
+            * (fractions[:, 2] if corner & 1 else 1.0 - fractions[:, 2])
+        )
+        values += weights * imageArray[k, j, i]
+    values[~inside] = np.nan
+    return values
+
+
+def pointNormals(polyData: vtk.vtkPolyData) -> np.ndarray:
+    """(N, 3) outward unit normals of the points of a closed surface, in point order."""
+    normals = vtk.vtkPolyDataNormals()
+    normals.SetInputData(polyData)
+    normals.ComputePointNormalsOn()
+    normals.ComputeCellNormalsOff()
+    normals.SplittingOff()
+    normals.ConsistencyOn()
+    normals.AutoOrientNormalsOn()
+    normals.Update()
+    return vtk_to_numpy(normals.GetOutput().GetPointData().GetNormals())
+
+
+def sampleSurfaceIntensity(
+    polyData: vtk.vtkPolyData,
+    imageArray: np.ndarray,
+    ijkToRas: np.ndarray,
+    depth: float = 0.0,
+    depthSamples: int = 3,
+) -> np.ndarray:
+    """Intensity at every point of the surface.
+
+    With a depth (mm), the image is sampled at depthSamples points from the surface
+    to depth below it along the inward normal, and the samples are averaged.
+    """
+    points = vtk_to_numpy(polyData.GetPoints().GetData()).astype(float)
+    if depth <= 0 or depthSamples < 2:
+        return trilinearSample(imageArray, ijkToRas, points)
+
+    inward = -pointNormals(polyData)
+    offsets = np.linspace(0.0, depth, depthSamples)
+    samplePoints = points[None, :, :] + offsets[:, None, None] * inward[None, :, :]
+    values = trilinearSample(imageArray, ijkToRas, samplePoints.reshape(-1, 3)).reshape(depthSamples, -1)
+    with warnings.catch_warnings():
+        # Points whose samples all fall outside the image stay NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmean(values, axis=0)
+
+
+def addSurfaceIntensity(
+    polyData: vtk.vtkPolyData,
+    imageArray: np.ndarray,
+    ijkToRas: np.ndarray,
+    depth: float = 0.0,
+    depthSamples: int = 3,
+    arrayName: str = "SignalIntensity",
+) -> vtk.vtkDataArray:
+    """Sample the surface intensity (see sampleSurfaceIntensity) and store it in polyData as
+    the active point scalars named arrayName. Returns the array."""
+    values = sampleSurfaceIntensity(polyData, imageArray, ijkToRas, depth, depthSamples)
+    return setSurfaceIntensity(polyData, values, arrayName)
+
+
+def setSurfaceIntensity(polyData: vtk.vtkPolyData, values: np.ndarray, arrayName: str = "SignalIntensity") -> vtk.vtkDataArray:
+    """Store per-point values, e.g. from sampleSurfaceIntensity, in polyData as the active point
+    scalars named arrayName. Returns the array."""
+    intensityArray = numpy_to_vtk(values.astype(np.float32), deep=True)
+    intensityArray.SetName(arrayName)
+    pointData = polyData.GetPointData()
+    pointData.RemoveArray(arrayName)
+    pointData.AddArray(intensityArray)
+    pointData.SetActiveScalars(arrayName)
+    return intensityArray
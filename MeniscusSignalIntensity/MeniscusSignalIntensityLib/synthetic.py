@@ -0,0 +1,92 @@
+"""
+Synthetic meniscus surfaces and MR-like volumes for tests and benchmarks.
+"""
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray
+
+
+def makeSyntheticMeniscus(
+    triangleCount: int = 20000,
+    ringRadius: float = 15.0,
+    crossSectionRadius: float = 4.0,
+    arcDegrees: float = 300.0,
+    openingDirection: float = 0.0,
+    center=(0.0, 0.0, 0.0),
+) -> vtk.vtkPolyData:
+    """Closed C-shaped tube (a torus with a gap) lying in the axial (R-A) plane.
+
+    The tube is swept along arcDegrees of a circle of ringRadius, leaving the gap
+    centered on openingDirection (degrees from +R towards +A), and closed with flat
+    end caps. The mesh has approximately triangleCount triangles.
+    """
+    # Four times more samples along the arc than around the cross section
+    crossSamples = max(8, int(round(np.sqrt(triangleCount / 8.0))))
+    arcSamples = max(4, int(round((triangleCount - 2 * crossSamples) / (2.0 * crossSamples))) + 1)
+
+    gapCenter = np.radians(openingDirection)
+    halfGap = np.radians(360.0 - arcDegrees) / 2
+    u = np.linspace(gapCenter + halfGap, gapCenter + 2 * np.pi - halfGap, arcSamples)
+    v = np.linspace(0, 2 * np.pi, crossSamples, endpoint=False)
+    uu, vv = np.meshgrid(u, v, indexing="ij")
+
+    radial = ringRadius + crossSectionRadius * np.cos(vv)
+    tubePoints = np.stack(
+        (radial * np.cos(uu), radial * np.sin(uu), crossSectionRadius * np.sin(vv)), axis=-1
+    ).reshape(-1, 3)
+    capCenters = np.array(
+        [[ringRadius * np.cos(u[0]), ringRadius * np.sin(u[0]), 0.0], [ringRadius * np.cos(u[-1]), ringRadius * np.sin(u[-1]), 0.0]]
+    )
+    points = np.vstack((tubePoints, capCenters)) + np.asarray(center, dtype=float)
+
+    # Two triangles per quad of the tube, consistently oriented
+    a = np.arange(arcSamples - 1)[:, None] * crossSamples
+    b = np.arange(crossSamples)[None, :]
+    p00 = (a + b).ravel()
+    p01 = (a + (b + 1) % crossSamples).ravel()
+    p10 = p00 + crossSamples
+    p11 = p01 + crossSamples
+    triangles = [np.stack((p00, p10, p11), axis=1), np.stack((p00, p11, p01), axis=1)]
+
+    # Fans closing both ends of the tube
+    startCenter, endCenter = len(tubePoints), len(tubePoints) + 1
+    ring = np.arange(crossSamples)
+    lastRing = ring + (arcSamples - 1) * crossSamples
+    triangles.append(np.stack((np.full(crossSamples, startCenter), (ring + 1) % crossSamples, ring), axis=1))
+    triangles.append(np.stack((np.full(crossSamples, endCenter), lastRing, (ring + 1) % crossSamples + lastRing[0]), axis=1))
+    triangles = np.vstack(triangles)
+
+    cellArray = vtk.vtkCellArray()
+    offsets = np.arange(0, 3 * len(triangles) + 1, 3, dtype=np.int64)
+    cellArray.SetData(numpy_to_vtkIdTypeArray(offsets, deep=True), numpy_to_vtkIdTypeArray(triangles.ravel().astype(np.int64), deep=True))
+
+    vtkPoints = vtk.vtkPoints()
+    vtkPoints.SetData(numpy_to_vtk(points, deep=True))
+    polyData = vtk.vtkPolyData()
+    polyData.SetPoints(vtkPoints)
+    polyData.SetPolys(cellArray)
+    return polyData
+
+
+def makeSyntheticVolume(
+    spacing: float = 1.5,
+    extent: float = 60.0,
+    center=(0.0, 0.0, 0.0),
+    signal: float = 100.0,
+    noise: float = 10.0,
+    seed: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Cubic int16 volume of side `extent` mm with isotropic `spacing`, centered on `center`.
+
+    Intensities are a smooth left-right gradient around `signal` plus Gaussian noise.
+    Returns the (k, j, i) voxel array and its 4x4 IJK to RAS matrix.
+    """
+    size = int(np.ceil(extent / spacing))
+    ijkToRas = np.diag([spacing, spacing, spacing, 1.0])
+    ijkToRas[:3, 3] = np.asarray(center, dtype=float) - spacing * (size - 1) / 2
+
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(-0.2, 0.2, size, dtype=np.float32)[None, None, :] * signal
+    imageArray = signal + gradient + rng.normal(0.0, noise, (size, size, size)).astype(np.float32)
+    return imageArray.astype(np.int16), ijkToRas
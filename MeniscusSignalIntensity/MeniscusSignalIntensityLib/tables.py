@@ -0,0 +1,67 @@
+"""
+Bulk filling of vtkTable columns from NumPy arrays.
+"""
+
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+
+def _isText(values) -> bool:
+    return np.asarray(values).dtype.kind in "OSU"
+
+
+def appendTableColumns(table: vtk.vtkTable, columnValues, columnNames: list) -> int:
+    """Append rows to a vtkTable, given column by column.
+
+    columnValues holds one sequence per name of columnNames. If the table has no
+    columns yet, they are created in that order: vtkStringArray for text values and
+    vtkDoubleArray otherwise. Otherwise each sequence goes to the table column of
+    that name, and the names must be exactly those of the table columns. Numeric
+    columns are resized once and filled through a NumPy view. The caller is
+    responsible for a single Modified() call on the table (or its table node)
+    afterwards. Returns the number of appended rows.
+    """
+    if len(columnNames) != len(columnValues):
+        raise ValueError(f"Got {len(columnNames)} column names for {len(columnValues)} columns")
+    if table.GetNumberOfColumns() == 0:
+        for name, values in zip(columnNames, columnValues):
+            column = vtk.vtkStringArray() if _isText(values) else vtk.vtkDoubleArray()
+            column.SetName(name)
+            table.AddColumn(column)
+    else:
+        tableNames = [table.GetColumnName(index) for index in range(table.GetNumberOfColumns())]
+        if sorted(columnNames) != sorted(tableNames):
+            missing = [name for name in tableNames if name not in columnNames]
+            unknown = [name for name in columnNames if name not in tableNames]
+            raise ValueError(f"Column names do not match the table: missing {missing}, unknown {unknown}")
+
+    appendedRows = len(columnValues[0]) if len(columnValues) else 0
+    firstRow = table.GetNumberOfRows()
+    rowCount = firstRow + appendedRows
+    for name, values in zip(columnNames, columnValues):
+        column = table.GetColumnByName(name)
+        if isinstance(column, vtk.vtkStringArray):
+            column.SetNumberOfValues(rowCount)
+            for rowIndex, value in enumerate(values, firstRow):
+                column.SetValue(rowIndex, "" if value is None else str(value))
+        else:
+            column.SetNumberOfTuples(rowCount)
+            newRows = vtk_to_numpy(column)[firstRow:]
+            newValues = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+            newRows[...] = newValues.reshape(newRows.shape)
+        column.Modified()
+    return appendedRows
+
+
+def setTableRows(table: vtk.vtkTable, firstRow: int, columnValues: dict) -> None:
+    """Overwrite the rows starting at firstRow of the named numeric columns, given as
+    {column name: values}, in place. As for appendTableColumns, the caller calls Modified()."""
+    for name, values in columnValues.items():
+        column = table.GetColumnByName(name)
+        if column is None:
+            raise ValueError(f"No column named {name}")
+        newValues = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        vtk_to_numpy(column)[firstRow:firstRow + len(newValues)] = newValues
+        column.Modified()
@@ -0,0 +1,74 @@
+"""
+Long computations off the GUI thread, with progress reporting and cancellation.
+
+A BackgroundTask runs a function in a daemon thread and passes it a progress
+callback, progress(fraction, message). The callback records the progress and
+raises TaskCancelled once cancel() was called, so a cancelled task stops at its
+next report. The GUI polls progress(), done() and result() from a timer. Tasks
+only compute plain data (arrays, vtkPolyData); scene nodes are created from
+their results in the main thread.
+"""
+
+import threading
+from typing import Callable
+
+
+class TaskCancelled(Exception):
+    """Raised by the progress callback of a cancelled task."""
+
+
+class BackgroundTask:
+    """function(*args, progress=..., **kwargs) run in a thread, see the module docstring."""
+
+    def __init__(self, function: Callable, *args, **kwargs) -> None:
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+        self._cancelRequested = threading.Event()
+        self._lock = threading.Lock()
+        self._progress = (0.0, "")
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "BackgroundTask":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            self._result = self._function(*self._args, progress=self.reportProgress, **self._kwargs)
+        except Exception as error:
+            self._error = error
+
+    def reportProgress(self, fraction: float, message: str = "") -> None:
+        """Record the progress; raises TaskCancelled if the task was cancelled."""
+        if self._cancelRequested.is_set():
+            raise TaskCancelled()
+        with self._lock:
+            self._progress = (fraction, message)
+
+    def progress(self) -> tuple[float, str]:
+        """Last reported (fraction done, message)."""
+        with self._lock:
+            return self._progress
+
+    def cancel(self) -> None:
+        """Ask the task to stop at its next progress report."""
+        self._cancelRequested.set()
+
+    def done(self) -> bool:
+        return self._thread.ident is not None and not self._thread.is_alive()
+
+    def wait(self, timeout=None) -> bool:
+        """Block until the task is done, or timeout seconds. Returns done()."""
+        self._thread.join(timeout)
+        return self.done()
+
+    def result(self):
+        """Return value of the function; re-raises its exception (TaskCancelled if cancelled)."""
+        if not self.done():
+            raise RuntimeError("The task is still running")
+        if self._error is not None:
+            raise self._error
+        return self._result
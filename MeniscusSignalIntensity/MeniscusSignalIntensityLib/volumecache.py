@@ -0,0 +1,142 @@
+"""
+Persistent cache of scalar volumes loaded from DICOM folders.
+
+A cached volume is identified by a fingerprint of the file names, sizes and
+modification times of its DICOM folder and by its series UID, so a lookup only
+needs a directory listing and the UID, not a DICOM import; two folders whose
+listings happen to match do not share an entry. Each cached volume is stored once as an uncompressed .npy voxel array
+(memory-mappable) next to a .json file with its IJK to RAS matrix, series UID
+and source folder. Entries are written atomically, so concurrent batch workers
+can share one cache directory.
+
+getRegion memory-maps a cached volume and copies out only the sub-volume around
+the menisci. Arrays are (k, j, i), so that sub-volume is a range of slabs and
+only the pages of those slabs are read from disk; the rest of the series never
+takes memory in the worker.
+"""
+
+import hashlib
+import json
+import os
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+
+class CachedVolume(NamedTuple):
+    """Voxel array (k, j, i) with its geometry and DICOM identity."""
+
+    array: np.ndarray
+    ijkToRas: np.ndarray
+    seriesUID: str
+    name: str
+
+    def crop(self, boundsMin, boundsMax, padding: int = 4) -> "CachedVolume":
+        """In-memory copy of the sub-volume around the RAS box, padded by `padding` voxels and
+        clamped to the volume, with its own IJK to RAS matrix."""
+        from .roi import cropFromBounds
+
+        imageCrop = cropFromBounds(boundsMin, boundsMax, self.array.shape, self.ijkToRas, padding)
+        return self._replace(array=np.array(imageCrop.crop(self.array)), ijkToRas=imageCrop.ijkToRas)
+
+
+def listFilesRecursive(directory: str):
+    """Yield (relative path, os.stat_result) of all files below directory."""
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file():
+                    yield os.path.relpath(entry.path, directory), entry.stat()
+
+
+def folderFingerprint(directory: str) -> str:
+    """Hash of the names, sizes and modification times of all files in a folder."""
+    digest = hashlib.sha1()
+    for relativePath, stat in sorted(listFilesRecursive(directory)):
+        digest.update(f"{relativePath.replace(os.sep, '/')}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+class VolumeCache:
+    """Volumes loaded from DICOM folders, stored in cacheDir."""
+
+    def __init__(self, cacheDir: str) -> None:
+        self.cacheDir = cacheDir
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        base = os.path.join(self.cacheDir, key)
+        return base + ".npy", base + ".json"
+
+    def key(self, dicomDir: str, seriesUID: str) -> str:
+        digest = hashlib.sha1(f"{folderFingerprint(dicomDir)}\0{seriesUID}".encode())
+        return digest.hexdigest()
+
+    def get(
+        self,
+        dicomDir: str,
+        seriesUID: str,
+        key: Optional[str] = None,
+        mmap: bool = False,
+    ) -> Optional[CachedVolume]:
+        """Return the cached volume of the series in dicomDir, or None if it was not cached
+        or the files of the folder changed since. With mmap the array is memory-mapped read-only."""
+        arrayPath, metadataPath = self._paths(key or self.key(dicomDir, seriesUID))
+        if not (os.path.exists(arrayPath) and os.path.exists(metadataPath)):
+            return None
+        with open(metadataPath) as metadataFile:
+            metadata = json.load(metadataFile)
+        if metadata["seriesUID"] != seriesUID:
+            return None
+        array = np.load(arrayPath, mmap_mode="r" if mmap else None)
+        return CachedVolume(array, np.array(metadata["ijkToRas"]), metadata["seriesUID"], metadata["name"])
+
+    def getRegion(
+        self,
+        dicomDir: str,
+        seriesUID: str,
+        boundsMin,
+        boundsMax,
+        padding: int = 4,
+        key: Optional[str] = None,
+    ) -> Optional[CachedVolume]:
+        """Like get, but only the sub-volume around the RAS box (see CachedVolume.crop), read
+        from the memory-mapped array."""
+        cached = self.get(dicomDir, seriesUID, key, mmap=True)
+        return cached.crop(boundsMin, boundsMax, padding) if cached else None
+
+    def put(
+        self,
+        dicomDir: str,
+        array: np.ndarray,
+        ijkToRas: np.ndarray,
+        seriesUID: str,
+        name: str = "",
+        key: Optional[str] = None,
+    ) -> str:
+        """Store the volume of the series loaded from dicomDir and return its cache key."""
+        key = key or self.key(dicomDir, seriesUID)
+        arrayPath, metadataPath = self._paths(key)
+        metadata = {
+            "dicomDir": os.path.abspath(dicomDir),
+            "seriesUID": seriesUID,
+            "name": name,
+            "ijkToRas": np.asarray(ijkToRas, dtype=float).tolist(),
+            "shape": list(array.shape),
+            "dtype": str(array.dtype),
+        }
+
+        # Write to temporary files and rename, so readers never see a partial entry.
+        # The array goes first: an entry only counts once its metadata exists.
+        temporarySuffix = f".{os.getpid()}.tmp"
+        with open(arrayPath + temporarySuffix, "wb") as arrayFile:
+            np.save(arrayFile, np.ascontiguousarray(array))
+        os.replace(arrayPath + temporarySuffix, arrayPath)
+        with open(metadataPath + temporarySuffix, "w") as metadataFile:
+            json.dump(metadata, metadataFile, indent=1)
+        os.replace(metadataPath + temporarySuffix, metadataPath)
+        return key